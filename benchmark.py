@@ -0,0 +1,172 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Benchmark of the receive path. A pseudo terminal stands in for the device:
+numbered lines are written to the master side at the data rate of the baud
+(10 bits per byte for 8N1) while serial.SerialPort reads the slave side and
+feeds the pipeline. At the end the text that reached the display is compared
+with what was sent.
+
+A pseudo terminal doesn't limit the rate, so this measures whether the
+application keeps up with the data rate, not the UART. Only works on
+platforms with pseudo terminals (Linux, macOS).
+
+e.g.
+    python benchmark.py --baud 3000000 --seconds 10
+
+"""
+
+import argparse
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+
+from PyQt5 import QtCore
+
+import pipeline
+import serial
+
+
+def write_lines(fd, baud, seconds, sent, stop):
+    """Writes numbered lines to "fd" at the data rate of "baud"."""
+    bytes_per_second = baud / 10
+    start = time.perf_counter()
+    total = 0
+    line_number = 0
+    while not stop.is_set():
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            break
+        # Catch up to where the stream should be, then sleep a little.
+        chunk = []
+        target = int(elapsed * bytes_per_second)
+        size = 0
+        while total + size < target:
+            line = '{:010d} the quick brown fox jumps over the lazy dog\n'.format(
+                line_number).encode('ascii')
+            chunk.append(line)
+            size += len(line)
+            line_number += 1
+        if size > 0:
+            data = b''.join(chunk)
+            view = memoryview(data)
+            while len(view) > 0:
+                view = view[os.write(fd, view):]
+            sent.append(data)
+            total += size
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the receive path.')
+    parser.add_argument('--baud', type=int, default=3000000, help='Data rate to simulate. Default 3000000')
+    parser.add_argument('--seconds', type=float, default=5.0, help='How long to send for. Default 5')
+    parser.add_argument('--lines', action='store_true', help='Add the lines stage to the pipeline.')
+    args = parser.parse_args()
+
+    app = QtCore.QCoreApplication(sys.argv[:1])
+
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    port_name = os.ttyname(slave)
+
+    port = serial.SerialPort()
+    config = {'name': 'benchmark', 'port': port_name, 'baud': args.baud,
+        'data_bits': 8, 'stop_bits': 1.0, 'parity': 'none',
+        'flow_control': 'none'}
+    if not port.setConfig(config):
+        print('Error in the serial configuration: ' + port.get_config_error())
+        return 1
+    if port.open() != 0:
+        print('Could not open ' + port_name)
+        return 1
+
+    stages = [{'stage': 'decode', 'encoding': 'ascii'}]
+    if args.lines:
+        stages.append({'stage': 'lines'})
+    stages.append({'stage': 'display'})
+    pl = pipeline.Pipeline()
+    pl.setConfig(stages)
+    port.dataReceived.connect(pl.feed)
+
+    received = []
+    reads = [0]
+
+    def onDisplay(text):
+        received.append(text)
+
+    def onData(data, timestamp):
+        reads[0] += 1
+
+    pl.displayData.connect(onDisplay)
+    port.dataReceived.connect(onData)
+    pl.start()
+
+    sent = []
+    stop = threading.Event()
+    writer = threading.Thread(target=write_lines,
+        args=(master, args.baud, args.seconds, sent, stop))
+    start = time.perf_counter()
+    writer.start()
+
+    # Run the event loop until the writer is done and the data has drained.
+    timer = QtCore.QTimer()
+    timer.setInterval(100)
+    deadline = [None]
+
+    def check():
+        if writer.is_alive():
+            return
+        if deadline[0] is None:
+            deadline[0] = time.perf_counter() + 2.0
+        sent_bytes = sum(len(d) for d in sent)
+        received_bytes = sum(len(t) for t in received)
+        if received_bytes >= sent_bytes or time.perf_counter() > deadline[0]:
+            app.quit()
+
+    timer.timeout.connect(check)
+    timer.start()
+    app.exec_()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer.join()
+    stats = pl.statsToStr()
+    pl.stop()
+    port.close()
+    os.close(master)
+
+    sent_text = b''.join(sent).decode('ascii')
+    received_text = ''.join(received)
+    sent_bytes = len(sent_text)
+    intact = received_text == sent_text
+
+    print('Baud:            {}'.format(args.baud))
+    print('Target rate:     {:.0f} bytes/s'.format(args.baud / 10))
+    print('Sent:            {} bytes'.format(sent_bytes))
+    print('Received:        {} bytes in {} reads'.format(len(received_text),
+        reads[0]))
+    print('Achieved rate:   {:.0f} bytes/s'.format(len(received_text) / elapsed))
+    print('Data intact:     {}'.format('yes' if intact else 'NO'))
+    print('Pipeline:')
+    print(stats)
+    return 0 if intact else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
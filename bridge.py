@@ -0,0 +1,380 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Shares the serial port over TCP. Every client gets a copy of the data
+received from the port and anything a client sends is written to the port.
+
+There are two modes.
+
+raw
+    The socket carries the serial data as is.
+rfc2217
+    The socket is a Telnet connection with the COM-PORT-OPTION, so a client
+    can change the baud, data bits, parity, stop bits, flow control, DTR and
+    RTS of the port. e.g. pyserial's "rfc2217://localhost:7000".
+
+Each client has a bounded output buffer. A client that can't keep up is
+dropped instead of letting its buffer grow or stalling the port.
+
+References
+----------
+* https://tools.ietf.org/html/rfc2217
+* https://tools.ietf.org/html/rfc854
+* http://doc.qt.io/qt-5/qtcpserver.html
+
+"""
+
+import struct
+
+from PyQt5 import QtCore, QtNetwork, QtSerialPort
+
+import console
+
+
+# The most bytes that can be waiting to be sent to one client.
+MAX_CLIENT_BUFFER = 256 * 1024
+
+# Telnet
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+BINARY = 0
+SGA = 3
+COM_PORT_OPTION = 44
+
+# COM-PORT-OPTION commands sent by the client. The server responds with the
+# command plus SERVER_OFFSET.
+SIGNATURE = 0
+SET_BAUDRATE = 1
+SET_DATASIZE = 2
+SET_PARITY = 3
+SET_STOPSIZE = 4
+SET_CONTROL = 5
+NOTIFY_LINESTATE = 6
+NOTIFY_MODEMSTATE = 7
+FLOWCONTROL_SUSPEND = 8
+FLOWCONTROL_RESUME = 9
+SET_LINESTATE_MASK = 10
+SET_MODEMSTATE_MASK = 11
+PURGE_DATA = 12
+SERVER_OFFSET = 100
+
+_parities = {
+    1: QtSerialPort.QSerialPort.NoParity,
+    2: QtSerialPort.QSerialPort.OddParity,
+    3: QtSerialPort.QSerialPort.EvenParity,
+    4: QtSerialPort.QSerialPort.MarkParity,
+    5: QtSerialPort.QSerialPort.SpaceParity,
+}
+
+_stop_bits = {
+    1: QtSerialPort.QSerialPort.OneStop,
+    2: QtSerialPort.QSerialPort.TwoStop,
+    3: QtSerialPort.QSerialPort.OneAndHalfStop,
+}
+
+_flow_controls = {
+    1: QtSerialPort.QSerialPort.NoFlowControl,
+    2: QtSerialPort.QSerialPort.SoftwareControl,
+    3: QtSerialPort.QSerialPort.HardwareControl,
+}
+
+
+def _reverse(d, value, default=0):
+    for k, v in d.items():
+        if v == value:
+            return k
+    return default
+
+
+def escapeIac(data):
+    """Doubles every IAC byte so serial data can be sent over Telnet."""
+    return data.replace(b'\xff', b'\xff\xff')
+
+
+class TelnetParser():
+    """Splits the bytes received from an RFC 2217 client into serial data,
+    option negotiations and sub-negotiations. The state is kept between
+    calls so commands split across reads are handled.
+    """
+
+    DATA, COMMAND, OPTION, SUBNEG, SUBNEG_IAC = range(5)
+
+    def __init__(self):
+        self._state = self.DATA
+        self._verb = 0
+        self._subneg = bytearray()
+
+    def feed(self, data):
+        """
+        Returns
+        -------
+        A tuple (data, negotiations, subnegotiations). "negotiations" is a
+        list of (verb, option) and "subnegotiations" a list of bytes
+        starting with the option.
+        """
+        out = bytearray()
+        negotiations = []
+        subnegotiations = []
+        for byte in data:
+            if self._state == self.DATA:
+                if byte == IAC:
+                    self._state = self.COMMAND
+                else:
+                    out.append(byte)
+            elif self._state == self.COMMAND:
+                if byte == IAC:
+                    out.append(IAC)
+                    self._state = self.DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self._verb = byte
+                    self._state = self.OPTION
+                elif byte == SB:
+                    self._subneg = bytearray()
+                    self._state = self.SUBNEG
+                else:
+                    # NOP, AYT etc. are ignored.
+                    self._state = self.DATA
+            elif self._state == self.OPTION:
+                negotiations.append((self._verb, byte))
+                self._state = self.DATA
+            elif self._state == self.SUBNEG:
+                if byte == IAC:
+                    self._state = self.SUBNEG_IAC
+                else:
+                    self._subneg.append(byte)
+            elif self._state == self.SUBNEG_IAC:
+                if byte == SE:
+                    subnegotiations.append(bytes(self._subneg))
+                    self._state = self.DATA
+                else:
+                    # An escaped IAC inside the sub-negotiation.
+                    self._subneg.append(byte)
+                    self._state = self.SUBNEG
+        return bytes(out), negotiations, subnegotiations
+
+
+class BridgeClient(QtCore.QObject):
+    """One connection to the bridge."""
+
+    def __init__(self, socket, bridge):
+        super(BridgeClient, self).__init__()
+        self.socket = socket
+        self._bridge = bridge
+        self._parser = TelnetParser() if bridge.mode == 'rfc2217' else None
+        self._suspended = False
+        self.name = '{}:{}'.format(socket.peerAddress().toString(),
+            socket.peerPort())
+
+        self.socket.readyRead.connect(self._onReadyRead)
+        self.socket.disconnected.connect(self._onDisconnected)
+
+        if self._parser is not None:
+            self.socket.write(bytes([IAC, WILL, BINARY, IAC, DO, BINARY,
+                IAC, WILL, SGA, IAC, DO, SGA, IAC, DO, COM_PORT_OPTION]))
+
+    def send(self, data):
+        """Queues serial data for the client.
+
+        Returns
+        -------
+        False if the client's buffer is full and it should be dropped.
+        """
+        if self._suspended:
+            return True
+        if self._parser is not None:
+            data = escapeIac(data)
+        if self.socket.bytesToWrite() + len(data) > self._bridge.max_buffer:
+            return False
+        self.socket.write(data)
+        return True
+
+    def _onDisconnected(self):
+        self._bridge.removeClient(self, 'disconnected')
+
+    def _onReadyRead(self):
+        data = bytes(self.socket.readAll())
+        if self._parser is not None:
+            data, negotiations, subnegotiations = self._parser.feed(data)
+            for verb, option in negotiations:
+                self._onNegotiation(verb, option)
+            for subneg in subnegotiations:
+                if len(subneg) > 1 and subneg[0] == COM_PORT_OPTION:
+                    self._onComPortCommand(subneg[1], subneg[2:])
+        if len(data) > 0:
+            self._bridge.writeToPort(data)
+
+    def _onNegotiation(self, verb, option):
+        # The options we support were offered when the client connected, so
+        # agreeing is not answered to avoid a negotiation loop.
+        if option in (BINARY, SGA, COM_PORT_OPTION):
+            return
+        if verb == WILL:
+            self.socket.write(bytes([IAC, DONT, option]))
+        elif verb == DO:
+            self.socket.write(bytes([IAC, WONT, option]))
+
+    def _onComPortCommand(self, command, payload):
+        port = self._bridge.serial_port
+        reply = payload
+        if command == SIGNATURE:
+            reply = b'Super Serial'
+        elif command == SET_BAUDRATE and len(payload) == 4:
+            baud = struct.unpack('>I', payload)[0]
+            if baud != 0:
+                port.setBaudRate(baud)
+            reply = struct.pack('>I', port.baudRate())
+        elif command == SET_DATASIZE and len(payload) == 1:
+            if 5 <= payload[0] <= 8:
+                port.setDataBits(payload[0])
+            reply = bytes([port.dataBits()])
+        elif command == SET_PARITY and len(payload) == 1:
+            if payload[0] in _parities:
+                port.setParity(_parities[payload[0]])
+            reply = bytes([_reverse(_parities, port.parity())])
+        elif command == SET_STOPSIZE and len(payload) == 1:
+            if payload[0] in _stop_bits:
+                port.setStopBits(_stop_bits[payload[0]])
+            reply = bytes([_reverse(_stop_bits, port.stopBits())])
+        elif command == SET_CONTROL and len(payload) == 1:
+            reply = bytes([self._setControl(payload[0])])
+        elif command == FLOWCONTROL_SUSPEND:
+            self._suspended = True
+        elif command == FLOWCONTROL_RESUME:
+            self._suspended = False
+        elif command == PURGE_DATA and len(payload) == 1:
+            if payload[0] == 1:
+                port.clear(QtSerialPort.QSerialPort.Input)
+            elif payload[0] == 2:
+                port.clear(QtSerialPort.QSerialPort.Output)
+            elif payload[0] == 3:
+                port.clear(QtSerialPort.QSerialPort.AllDirections)
+        self.socket.write(bytes([IAC, SB, COM_PORT_OPTION,
+            command + SERVER_OFFSET]) + escapeIac(reply) + bytes([IAC, SE]))
+
+    def _setControl(self, value):
+        """Handles SET-CONTROL and returns the value for the reply."""
+        port = self._bridge.serial_port
+        if value in _flow_controls:
+            port.setFlowControl(_flow_controls[value])
+        elif value == 5:
+            port.setBreakEnabled(True)
+        elif value == 6:
+            port.setBreakEnabled(False)
+        elif value == 8:
+            port.setDataTerminalReady(True)
+        elif value == 9:
+            port.setDataTerminalReady(False)
+        elif value == 11:
+            port.setRequestToSend(True)
+        elif value == 12:
+            port.setRequestToSend(False)
+
+        # Requests (0, 4, 7 and 10) and settings are answered with the
+        # current state.
+        if value in (0, 1, 2, 3):
+            return _reverse(_flow_controls, port.flowControl())
+        if value in (4, 5, 6):
+            return 5 if port.isBreakEnabled() else 6
+        if value in (7, 8, 9):
+            return 8 if port.isDataTerminalReady() else 9
+        if value in (10, 11, 12):
+            return 11 if port.isRequestToSend() else 12
+        return value
+
+
+class SerialBridge(QtCore.QObject):
+    """A TCP listener that shares a serial.SerialPort with many clients.
+
+    Parameters
+    ----------
+    serial_port : serial.SerialPort
+        The port to share. The bridge sends everything the port emits with
+        dataReceived to the clients.
+    mode : str
+        "raw" or "rfc2217".
+    max_buffer : int
+        The most bytes that can be waiting to be sent to a client before it
+        is dropped.
+    """
+
+    def __init__(self, serial_port, mode='raw', max_buffer=MAX_CLIENT_BUFFER):
+        super(SerialBridge, self).__init__()
+        if mode not in ('raw', 'rfc2217'):
+            raise ValueError('Unknown bridge mode "{}".'.format(mode))
+        self.serial_port = serial_port
+        self.mode = mode
+        self.max_buffer = max_buffer
+        self._clients = []
+        self._server = QtNetwork.QTcpServer()
+        self._server.newConnection.connect(self._onNewConnection)
+        self.serial_port.dataReceived.connect(self.broadcast)
+
+    def listen(self, port, address='127.0.0.1'):
+        """Starts listening for clients.
+
+        Returns
+        -------
+        True if the listener was started.
+        """
+        if not self._server.listen(QtNetwork.QHostAddress(address), port):
+            console.enqueue('Could not start the TCP bridge on {}:{}. {}'
+                .format(address, port, self._server.errorString()), console.ERROR)
+            return False
+        console.enqueue('TCP bridge ({}) listening on {}:{}.'.format(
+            self.mode, address, self._server.serverPort()))
+        return True
+
+    def close(self):
+        self._server.close()
+        for client in list(self._clients):
+            client.socket.abort()
+        self._clients = []
+
+    def serverPort(self):
+        return self._server.serverPort()
+
+    def clientCount(self):
+        return len(self._clients)
+
+    def broadcast(self, data, timestamp=None):
+        for client in list(self._clients):
+            if not client.send(data):
+                self.removeClient(client, 'too slow, its buffer is full')
+                client.socket.abort()
+
+    def removeClient(self, client, reason):
+        if client not in self._clients:
+            return
+        self._clients.remove(client)
+        client.socket.deleteLater()
+        console.enqueue('TCP bridge client {} dropped: {}.'.format(
+            client.name, reason))
+
+    def writeToPort(self, data):
+        if self.serial_port.is_connected:
+            self.serial_port.write(data)
+
+    def _onNewConnection(self):
+        while self._server.hasPendingConnections():
+            socket = self._server.nextPendingConnection()
+            client = BridgeClient(socket, self)
+            self._clients.append(client)
+            console.enqueue('TCP bridge client {} connected.'.format(
+                client.name))
@@ -15,7 +15,15 @@ Copyright 2017-2018 Justin Watson
 """
 
 from code import InteractiveConsole
+import collections
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
 import sys
+import threading
+import time
 
 from PyQt5 import QtCore
 
@@ -31,38 +39,70 @@ class SimpleStream:
         self.out.append(line)
 
     def flush(self):
-        output = '\n'.join(self.out)
+        output = ''.join(self.out)
         self.reset()
         return output
 
 
+class ThreadStream():
+    """Stands in for sys.stdout and sends what each thread writes to the
+    stream registered for it, or to the original stream. This lets a console
+    session capture its output without swapping sys.stdout for everyone.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self._streams = {}
+
+    def register(self, stream):
+        """Sends what the calling thread writes to "stream"."""
+        self._streams[threading.get_ident()] = stream
+
+    def unregister(self):
+        self._streams.pop(threading.get_ident(), None)
+
+    def write(self, data):
+        return self._streams.get(threading.get_ident(), self.default).write(data)
+
+    def flush(self):
+        stream = self._streams.get(threading.get_ident(), self.default)
+        if stream is self.default:
+            self.default.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+
+def _threadStdout():
+    """Installs the ThreadStream as sys.stdout the first time it's needed."""
+    if not isinstance(sys.stdout, ThreadStream):
+        sys.stdout = ThreadStream(sys.stdout)
+    return sys.stdout
+
+
 class RemoteConsole(InteractiveConsole):
     def __init__(self):
-        self.stdout = sys.stdout
         self.internal_out = SimpleStream()
         InteractiveConsole.__init__(self)
         self._result = ''
 
-    def get_output(self):
-        sys.stdout = self.internal_out
-
-    def return_output(self):
-        sys.stdout = self.stdout
-
     def push(self,line):
         self._result = ''
 
-        # Wrap the execution around a seperate stream.
-        self.get_output()
-        InteractiveConsole.push(self,line)
-        self.return_output()
+        # Only this thread's output is captured.
+        stdout = _threadStdout()
+        stdout.register(self.internal_out)
+        try:
+            more = InteractiveConsole.push(self,line)
+        finally:
+            stdout.unregister()
 
         output = self.internal_out.flush()
 
         if self._result == '':
             self._result = output
 
-        return
+        return more
 
     def write(self, data):
         self._result = data
@@ -71,6 +111,165 @@ class RemoteConsole(InteractiveConsole):
         return self._result
 
 
+class _GuiInvoker(QtCore.QObject):
+    """Runs functions on the thread it was created on, the GUI thread."""
+
+    _call = QtCore.pyqtSignal(object)
+
+    def __init__(self):
+        super(_GuiInvoker, self).__init__()
+        self._call.connect(self._onCall, QtCore.Qt.QueuedConnection)
+
+    def call(self, function, *args, **kwargs):
+        """Calls the function on the GUI thread and waits for it.
+
+        Returns
+        -------
+        What the function returns. An exception it raises is raised here.
+        """
+        if QtCore.QThread.currentThread() is self.thread():
+            return function(*args, **kwargs)
+        job = {'call': (function, args, kwargs), 'done': threading.Event()}
+        self._call.emit(job)
+        # Waited on in steps so the session can still be cancelled.
+        while not job['done'].wait(0.1):
+            pass
+        if 'error' in job:
+            raise job['error']
+        return job.get('result')
+
+    def _onCall(self, job):
+        function, args, kwargs = job['call']
+        try:
+            job['result'] = function(*args, **kwargs)
+        except Exception as e:
+            job['error'] = e
+        job['done'].set()
+
+
+class GuiProxy():
+    """Wraps a Qt object for a console session. Its methods are run on the
+    GUI thread, where Qt objects have to be used, and other attributes are
+    read directly. The object itself is "unwrapped".
+    """
+
+    def __init__(self, obj, invoker):
+        self.__dict__['unwrapped'] = obj
+        self.__dict__['_invoker'] = invoker
+
+    def __getattr__(self, name):
+        value = getattr(self.unwrapped, name)
+        if callable(value) and not isinstance(value, QtCore.pyqtBoundSignal):
+            invoker = self._invoker
+
+            def method(*args, **kwargs):
+                return invoker.call(value, *args, **kwargs)
+            return method
+        return value
+
+    def __setattr__(self, name, value):
+        self._invoker.call(setattr, self.unwrapped, name, value)
+
+    def __repr__(self):
+        return 'GuiProxy({!r})'.format(self.unwrapped)
+
+
+class ConsoleSession(QtCore.QObject):
+    """Runs a RemoteConsole on a worker thread so a slow command doesn't
+    block the GUI. Commands are run one at a time in the order they are
+    pushed.
+
+    A command can be cancelled, and is cancelled when it runs longer than
+    "timeout" seconds if that isn't 0. Cancelling raises KeyboardInterrupt
+    in the command, which interrupts Python code but not a blocking call
+    until it returns.
+    """
+
+    # Emitted with the command and its output when it has run.
+    finished = QtCore.pyqtSignal(str, str)
+    # Emitted with True when a command starts and False when it finishes.
+    busyChanged = QtCore.pyqtSignal(bool)
+
+    def __init__(self, timeout=0):
+        super(ConsoleSession, self).__init__()
+        self.timeout = timeout
+        self._console = RemoteConsole()
+        self._invoker = _GuiInvoker()
+        self._commands = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = None
+        self._count = 0
+        self._thread = threading.Thread(target=self._run,
+            name='console session', daemon=True)
+        self._thread.start()
+
+    def setLocals(self, names):
+        """Makes objects available to the session by name. Qt objects are
+        wrapped in a GuiProxy.
+        """
+        for name, obj in names.items():
+            if isinstance(obj, QtCore.QObject):
+                obj = GuiProxy(obj, self._invoker)
+            self._console.locals[name] = obj
+
+    def push(self, line):
+        """Queues a line of input."""
+        self._commands.put(line)
+
+    def isBusy(self):
+        return self._running is not None
+
+    def cancel(self):
+        """Interrupts the command that is running, if any."""
+        with self._lock:
+            if self._running is not None:
+                self._interrupt(self._running)
+
+    def _interrupt(self, number):
+        # Called with the lock held so the command can't finish meanwhile.
+        if self._running != number:
+            return
+        import ctypes
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(self._thread.ident),
+            ctypes.py_object(KeyboardInterrupt))
+
+    def _onTimeout(self, number):
+        with self._lock:
+            self._interrupt(number)
+
+    def _run(self):
+        while True:
+            line = self._commands.get()
+            with self._lock:
+                self._count += 1
+                self._running = self._count
+            self.busyChanged.emit(True)
+            timer = None
+            if self.timeout > 0:
+                timer = threading.Timer(self.timeout, self._onTimeout,
+                    (self._running,))
+                timer.daemon = True
+                timer.start()
+            output = 'KeyboardInterrupt'
+            try:
+                try:
+                    self._console.push(line)
+                    output = self._console.getResult()
+                finally:
+                    # No cancel can be raised after this.
+                    with self._lock:
+                        self._running = None
+                    if timer is not None:
+                        timer.cancel()
+            except KeyboardInterrupt:
+                # Raised outside of the code being run, e.g. while it was
+                # compiled or just as it finished.
+                pass
+            self.finished.emit(line, output)
+            self.busyChanged.emit(False)
+
+
 # The following is a singleton for handling console messages.
 # Any QtObject can use these functions to pass messages to the console.
 # This removes having to pass the console object into every object, widget,
@@ -80,25 +279,185 @@ class RemoteConsole(InteractiveConsole):
 #
 
 class ConsoleMsgHandler(QtCore.QObject):
+    """Collects messages from any thread and delivers them in batches.
+
+    The first message after a delivery schedules the next one on the
+    handler's thread, so however many messages are enqueued there is one
+    newMessages signal per turn of the event loop. At most "capacity"
+    messages wait for delivery. Beyond that the oldest are dropped and
+    counted, and a note of how many were lost is delivered with the rest.
+    """
+
+    # The most messages waiting to be delivered.
+    CAPACITY = 10000
 
-    _messages = []
+    # Emitted with the list of messages since the last delivery.
+    newMessages = QtCore.pyqtSignal(list)
 
-    newMsg = QtCore.pyqtSignal()
+    _deliver = QtCore.pyqtSignal()
+
+    def __init__(self, capacity=CAPACITY):
+        super(ConsoleMsgHandler, self).__init__()
+        self.capacity = capacity
+        self.dropped = 0
+        self._messages = collections.deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._dropped_since_delivery = 0
+        self._deliver.connect(self._onDeliver, QtCore.Qt.QueuedConnection)
 
     def enqueue(self, msg):
-        self._messages.append(msg)
-        self.newMsg.emit()
+        """Adds a message. Safe to call from any thread."""
+        with self._lock:
+            if len(self._messages) >= self.capacity:
+                self._messages.popleft()
+                self.dropped += 1
+                self._dropped_since_delivery += 1
+            self._messages.append(msg)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._deliver.emit()
 
     def dequeue(self):
-        return self._messages.pop(0)
+        """Takes the oldest message that hasn't been delivered.
+
+        Raises
+        ------
+        IndexError
+            If there are no messages.
+        """
+        with self._lock:
+            return self._messages.popleft()
+
+    def dequeueAll(self):
+        """Takes all of the messages that haven't been delivered."""
+        with self._lock:
+            messages = list(self._messages)
+            self._messages.clear()
+            if self._dropped_since_delivery > 0:
+                messages.insert(0, '{} console messages were dropped.'.format(
+                    self._dropped_since_delivery))
+                self._dropped_since_delivery = 0
+            return messages
+
+    def _onDeliver(self):
+        with self._lock:
+            self._scheduled = False
+        # Without a receiver the messages wait for dequeue().
+        if self.receivers(self.newMessages) == 0:
+            return
+        messages = self.dequeueAll()
+        if len(messages) > 0:
+            self.newMessages.emit(messages)
 
 
 messages = ConsoleMsgHandler()
 
 
-def enqueue(msg):
-    global messages
-    messages.enqueue(msg)
+# Logging
+# -------
+# Messages are logged with the "super_serial" logger. Every record has the
+# source (the module that logged it) and the time.monotonic() time as well
+# as the wall clock time. The records go to the console widget and, once
+# startLogFile() is called, to a rotating file of JSON lines. The file is
+# written by a QueueListener thread so logging never waits on the disk.
+
+# The levels, so callers don't have to import logging.
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+logger = logging.getLogger('super_serial')
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'monotonic': getattr(record, 'monotonic', None),
+            'level': record.levelname,
+            'source': getattr(record, 'source', record.module),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _WidgetHandler(logging.Handler):
+    """Passes the messages to the console widget through "messages"."""
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.levelno >= logging.WARNING:
+            text = '{}: {}'.format(record.levelname, text)
+        messages.enqueue(text)
+
+
+logger.addHandler(_WidgetHandler(logging.INFO))
+
+_listener = None
+_queue_handler = None
+
+
+def startLogFile(path, max_bytes=1024 * 1024, backup_count=5):
+    """Starts logging to a file that is rotated when it reaches
+    "max_bytes", keeping "backup_count" old files.
+
+    Raises
+    ------
+    OSError
+        If the file can't be opened.
+    """
+    global _listener, _queue_handler
+    stopLogFile()
+    file_handler = logging.handlers.RotatingFileHandler(path,
+        maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    logger.addHandler(_queue_handler)
+
+
+def stopLogFile():
+    """Writes the queued records and closes the log file."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logger.removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
+
+
+def enqueue(msg, level=logging.INFO, source=None):
+    """Logs a message and shows it in the console.
+
+    Parameters
+    ----------
+    msg : str
+        The message.
+    level : int
+        A logging level, e.g. logging.WARNING.
+    source : str
+        The subsystem the message is from. By default the name of the
+        calling module.
+    """
+    if source is None:
+        source = sys._getframe(1).f_globals.get('__name__', '')
+    logger.log(level, msg, extra={'source': source,
+        'monotonic': time.monotonic()})
 
 
 def dequeue():
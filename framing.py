@@ -0,0 +1,440 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Framers split a stream of bytes into frames. A framer is fed the chunks as
+they are read and returns the frames that were completed. Frames can span
+any number of chunks.
+
+The received bytes are appended to one buffer per framer. Frame boundaries
+are searched for in place and each frame is sliced out of a memoryview of
+the buffer, so the only copy made is the frame's own bytes.
+
+Most framers look for boundaries in the data. The gap framer instead ends a
+frame when the line has been idle for a while, as Modbus RTU does, using the
+time each chunk was read.
+
+Framers are created by name with create(). The built in framers are listed
+in FRAMERS. A plugin framer is named by "module:Class" and the module is
+only imported when a pipeline uses it, so framers that aren't used cost
+nothing at start up.
+
+References
+----------
+* https://tools.ietf.org/html/rfc1055 (SLIP)
+* https://en.wikipedia.org/wiki/Consistent_Overhead_Byte_Stuffing
+* http://www.modbus.org/docs/Modbus_over_serial_line_V1_02.pdf
+
+"""
+
+import collections
+import importlib
+
+
+# The maximum size of a frame. Data past this without a frame boundary is
+# dropped so a missing delimiter can't grow the buffer forever.
+MAX_FRAME_LENGTH = 64 * 1024
+
+
+class Frame(collections.namedtuple('Frame', ['data', 'start', 'end'])):
+    """A frame.
+
+    Attributes
+    ----------
+    data : bytes
+        The decoded contents of the frame.
+    start : float
+        The time.monotonic() time the read with the first byte of the frame
+        was made.
+    end : float
+        The time.monotonic() time the read that completed the frame was made.
+    """
+    __slots__ = ()
+
+    def duration(self):
+        return self.end - self.start
+
+    def __str__(self):
+        return '[{:4d} bytes {:8.3f} ms] {}\n'.format(len(self.data),
+            self.duration() * 1000, ' '.join(format(b, '02x') for b in self.data))
+
+
+class Framer():
+    """Base class of the framers. Subclasses implement _split().
+
+    Parameters
+    ----------
+    config : dict
+        The settings of the framer, e.g. from the pipeline stage.
+    """
+
+    def __init__(self, config):
+        self.max_length = int(config.get('max_length', MAX_FRAME_LENGTH))
+        self._buffer = bytearray()
+        self._start = 0.0
+        # Statistics.
+        self.frames = 0
+        self.dropped_bytes = 0
+
+    def feed(self, data, timestamp):
+        """
+        Returns
+        -------
+        A list of the Frame completed by the data.
+        """
+        if len(self._buffer) == 0:
+            self._start = timestamp
+        self._buffer += data
+        frames = []
+        with memoryview(self._buffer) as view:
+            consumed = 0
+            for payload, end in self._split(view):
+                consumed = end
+                if payload is None:
+                    continue
+                frames.append(Frame(payload, self._start, timestamp))
+                # Whatever follows the frame arrived in this chunk.
+                self._start = timestamp
+        del self._buffer[:consumed]
+        if len(self._buffer) > self.max_length:
+            self.dropped_bytes += len(self._buffer)
+            self._buffer = bytearray()
+        self.frames += len(frames)
+        return frames
+
+    def _split(self, view):
+        """Finds the frames in the buffer.
+
+        Parameters
+        ----------
+        view : memoryview
+            A view of the buffered bytes.
+
+        Yields
+        ------
+        (payload, end) for every complete frame. "payload" is the decoded
+        frame and "end" the index just past the frame in the buffer. A None
+        payload consumes bytes up to "end" without making a frame.
+        """
+        raise NotImplementedError()
+
+
+class DelimiterFramer(Framer):
+    """Frames end with a delimiter, by default a line feed. The delimiter is
+    removed unless "keep_delimiter" is true.
+
+    The delimiter is given as a string. Escapes such as "\\r\\n" or "\\x00"
+    are allowed.
+    """
+
+    def __init__(self, config):
+        super(DelimiterFramer, self).__init__(config)
+        delimiter = config.get('delimiter', '\n')
+        self._delimiter = delimiter.encode('latin-1').decode(
+            'unicode_escape').encode('latin-1')
+        self._keep = bool(config.get('keep_delimiter', False))
+
+    def _split(self, view):
+        start = 0
+        while True:
+            index = self._buffer.find(self._delimiter, start)
+            if index == -1:
+                return
+            end = index + len(self._delimiter)
+            yield bytes(view[start:end if self._keep else index]), end
+            start = end
+
+
+class SlipFramer(Framer):
+    """SLIP (RFC 1055). Frames end with END (0xc0). Empty frames, which
+    come from senders that also start frames with END, are skipped.
+    """
+
+    END = b'\xc0'
+
+    def _split(self, view):
+        start = 0
+        while True:
+            index = self._buffer.find(self.END, start)
+            if index == -1:
+                return
+            payload = None
+            if index > start:
+                payload = bytes(view[start:index])
+                if b'\xdb' in payload:
+                    payload = payload.replace(b'\xdb\xdc', b'\xc0').replace(
+                        b'\xdb\xdd', b'\xdb')
+            yield payload, index + 1
+            start = index + 1
+
+
+class CobsFramer(Framer):
+    """Consistent Overhead Byte Stuffing. Frames end with a zero byte. A frame
+    that doesn't decode is dropped and counted in "invalid_frames".
+    """
+
+    def __init__(self, config):
+        super(CobsFramer, self).__init__(config)
+        self.invalid_frames = 0
+
+    def _split(self, view):
+        start = 0
+        while True:
+            index = self._buffer.find(b'\x00', start)
+            if index == -1:
+                return
+            payload = None
+            # Back to back delimiters are allowed, e.g. to synchronise.
+            if index > start:
+                payload = decodeCobs(view[start:index])
+                if payload is None:
+                    self.invalid_frames += 1
+            yield payload, index + 1
+            start = index + 1
+
+
+def decodeCobs(encoded):
+    """Decodes a COBS frame without the zero delimiter.
+
+    Returns
+    -------
+    The decoded bytes or None if the frame isn't valid.
+    """
+    out = bytearray()
+    i = 0
+    length = len(encoded)
+    if length == 0:
+        return None
+    while i < length:
+        code = encoded[i]
+        if code == 0 or i + code > length:
+            return None
+        # The block is copied in one slice.
+        out += encoded[i + 1:i + code]
+        i += code
+        if code < 0xff and i < length:
+            out.append(0)
+    return bytes(out)
+
+
+class LengthPrefixedFramer(Framer):
+    """Frames start with their length.
+
+    Settings
+    --------
+    length_size : int
+        Size of the length field in bytes. 1, 2 or 4. Default 2.
+    byte_order : str
+        "big" or "little". Default "big".
+    header_size : int
+        Bytes before the length field. Default 0.
+    length_adjust : int
+        Added to the length field to get the number of bytes that follow the
+        length field, e.g. for a length that counts a checksum. Default 0.
+    include_header : bool
+        Keep the header and the length field in the frame. Default false.
+    """
+
+    def __init__(self, config):
+        super(LengthPrefixedFramer, self).__init__(config)
+        self._length_size = int(config.get('length_size', 2))
+        if self._length_size not in (1, 2, 4):
+            raise ValueError('length_size must be 1, 2 or 4.')
+        self._byte_order = config.get('byte_order', 'big')
+        self._header_size = int(config.get('header_size', 0))
+        self._adjust = int(config.get('length_adjust', 0))
+        self._include_header = bool(config.get('include_header', False))
+
+    def _split(self, view):
+        start = 0
+        prefix = self._header_size + self._length_size
+        while len(view) - start >= prefix:
+            length = int.from_bytes(view[start + self._header_size:
+                start + prefix], self._byte_order) + self._adjust
+            end = start + prefix + length
+            if length < 0 or end - start > self.max_length:
+                # Can't be a frame. Drop a byte and look for the next one.
+                self.dropped_bytes += 1
+                start += 1
+                yield None, start
+                continue
+            if end > len(view):
+                return
+            yield bytes(view[start if self._include_header
+                else start + prefix:end]), end
+            start = end
+
+
+class GapFramer(Framer):
+    """Frames are separated by an idle line. A frame ends when no data has
+    arrived for "gap" after it. Chunks are timed by SerialPort when they are
+    read, so the gap between two chunks is the time between the reads less
+    the time it took to receive the second chunk.
+
+    A frame that is followed by silence is completed by poll(), which the
+    pipeline calls while no data is arriving.
+
+    The reads are made and timed by the GUI thread when Qt delivers
+    readyRead, not by a reader thread of their own, since QSerialPort
+    reads the port itself. So the gaps are only as accurate as the GUI's
+    latency: when the GUI thread is busy for longer than the gap, e.g.
+    1.75 ms for Modbus RTU, the frames received meanwhile come in one read
+    and are merged into one frame. Gaps that are long compared with the
+    frames, or a device that isn't flooding the console, work best. The
+    gap histogram in the statistics shows how the gaps were measured.
+
+    Settings
+    --------
+    gap : float
+        The idle time that ends a frame in milliseconds. By default it is
+        "gap_chars" character times at the baud of the port.
+    gap_chars : float
+        The idle time in characters. Default 3.5, as in Modbus RTU.
+    min_gap : float
+        The shortest gap in milliseconds when it is worked out from the
+        baud. Default 1.75, which Modbus RTU uses above 19200 baud. The
+        latency of the serial driver makes shorter gaps unreliable anyway.
+    baud, data_bits, parity, stop_bits
+        The line settings. Taken from the serial configuration.
+    """
+
+    # Upper bounds of the gap histogram in milliseconds.
+    HISTOGRAM_BOUNDS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0,
+        float('inf'))
+
+    def __init__(self, config):
+        super(GapFramer, self).__init__(config)
+        bits = 1 + int(config.get('data_bits', 8)) + float(
+            config.get('stop_bits', 1))
+        if config.get('parity', 'none') != 'none':
+            bits += 1
+        self.char_time = bits / int(config.get('baud', 9600))
+        if 'gap' in config:
+            self.gap = float(config['gap']) / 1000
+        else:
+            self.gap = max(float(config.get('gap_chars', 3.5)) * self.char_time,
+                float(config.get('min_gap', 1.75)) / 1000)
+        self._last = None
+        # Statistics of the gaps between chunks.
+        self.gaps = 0
+        self.min_gap = float('inf')
+        self.max_gap = 0.0
+        self._total_gap = 0.0
+        self.histogram = [0] * len(self.HISTOGRAM_BOUNDS)
+
+    def feed(self, data, timestamp):
+        frames = []
+        if self._last is not None:
+            # The chunk's first byte arrived about this long after the end of
+            # the previous chunk.
+            gap = max(timestamp - len(data) * self.char_time - self._last, 0.0)
+            self._addGap(gap)
+            if gap >= self.gap and len(self._buffer) > 0:
+                frames.append(self._takeFrame())
+        if len(self._buffer) == 0:
+            self._start = timestamp
+        self._buffer += data
+        self._last = timestamp
+        if len(self._buffer) > self.max_length:
+            self.dropped_bytes += len(self._buffer)
+            self._buffer = bytearray()
+        self.frames += len(frames)
+        return frames
+
+    def poll(self, now):
+        """Completes the buffered frame if the line has been idle for the
+        gap.
+
+        Returns
+        -------
+        A list with the completed Frame, or an empty list.
+        """
+        if len(self._buffer) == 0 or now - self._last < self.gap:
+            return []
+        self.frames += 1
+        return [self._takeFrame()]
+
+    def _takeFrame(self):
+        frame = Frame(bytes(self._buffer), self._start, self._last)
+        self._buffer = bytearray()
+        return frame
+
+    def _addGap(self, gap):
+        self.gaps += 1
+        self._total_gap += gap
+        self.min_gap = min(self.min_gap, gap)
+        self.max_gap = max(self.max_gap, gap)
+        ms = gap * 1000
+        for i, bound in enumerate(self.HISTOGRAM_BOUNDS):
+            if ms < bound:
+                self.histogram[i] += 1
+                break
+
+    def gapStatsToStr(self):
+        if self.gaps == 0:
+            return 'gap: {:.3f} ms, no gaps measured'.format(self.gap * 1000)
+        buckets = ', '.join('<{:g}: {}'.format(bound, count) for bound, count
+            in zip(self.HISTOGRAM_BOUNDS[:-1], self.histogram) if count > 0)
+        if self.histogram[-1] > 0:
+            buckets += '{}>={:g}: {}'.format(', ' if buckets else '',
+                self.HISTOGRAM_BOUNDS[-2], self.histogram[-1])
+        return 'gap: {:.3f} ms, gaps between reads: {}, min {:.3f} ms, ' \
+            'mean {:.3f} ms, max {:.3f} ms, histogram (ms) {}'.format(
+            self.gap * 1000, self.gaps, self.min_gap * 1000,
+            self._total_gap / self.gaps * 1000, self.max_gap * 1000, buckets)
+
+
+# The built in framers. Plugins can be added with register() or named in the
+# configuration as "module:Class".
+FRAMERS = {
+    'cobs': 'framing:CobsFramer',
+    'delimiter': 'framing:DelimiterFramer',
+    'gap': 'framing:GapFramer',
+    'length': 'framing:LengthPrefixedFramer',
+    'slip': 'framing:SlipFramer',
+}
+
+
+def register(name, path):
+    """Registers a framer plugin.
+
+    Parameters
+    ----------
+    name : str
+        The name used in the configuration.
+    path : str
+        "module:Class". The module is imported the first time the framer is
+        created.
+    """
+    FRAMERS[name] = path
+
+
+def create(name, config):
+    """Creates a framer by name or by "module:Class".
+
+    Raises
+    ------
+    ValueError
+        If the framer is unknown.
+    """
+    path = FRAMERS.get(name, name)
+    if ':' not in path:
+        raise ValueError('Unknown framer "{}".'.format(name))
+    module_name, class_name = path.split(':', 1)
+    try:
+        module = importlib.import_module(module_name)
+        cls = getattr(module, class_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError('Could not load framer "{}": {}'.format(name, e))
+    return cls(config)
@@ -0,0 +1,120 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Formats bytes as a hex dump.
+
+    00000000  48 65 6c 6c 6f 2c 20 77  6f 72 6c 64 21 0d 0a 00  |Hello, world!...|
+
+A whole chunk is formatted at once. The rows are built in a NumPy array of
+characters using lookup tables, so there is no Python loop per byte and the
+dump keeps up with multi-megabit rates.
+
+"""
+
+import numpy as np
+
+
+BYTES_PER_ROW = 16
+
+# Columns of a row.
+_hex_start = 10
+_ascii_bar = 60
+ROW_WIDTH = 79
+
+_hex_digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+# Printable ASCII is shown as is, everything else as ".".
+_ascii_lut = np.full(256, ord('.'), dtype=np.uint8)
+_ascii_lut[0x20:0x7f] = np.arange(0x20, 0x7f, dtype=np.uint8)
+
+# The column of the first hex digit of each byte. There is an extra space
+# after the eighth byte.
+_hex_columns = np.array([_hex_start + 3 * i + (1 if i >= 8 else 0)
+    for i in range(BYTES_PER_ROW)])
+
+
+def formatRows(data, offset=0):
+    """Formats bytes as hex dump rows.
+
+    Parameters
+    ----------
+    data : bytes
+        The bytes to format. If the length isn't a multiple of BYTES_PER_ROW
+        the last row is short.
+    offset : int
+        The offset of the first byte.
+
+    Returns
+    -------
+    The rows as a string. Every row ends with a new line.
+    """
+    if len(data) == 0:
+        return ''
+    values = np.frombuffer(data, dtype=np.uint8)
+    rows = (len(values) + BYTES_PER_ROW - 1) // BYTES_PER_ROW
+    padded = np.zeros(rows * BYTES_PER_ROW, dtype=np.uint8)
+    padded[:len(values)] = values
+    padded = padded.reshape(rows, BYTES_PER_ROW)
+
+    out = np.full((rows, ROW_WIDTH), ord(' '), dtype=np.uint8)
+
+    # Offset column, eight hex digits.
+    offsets = offset + np.arange(rows, dtype=np.int64) * BYTES_PER_ROW
+    for digit in range(8):
+        out[:, digit] = _hex_digits[(offsets >> (4 * (7 - digit))) & 0xf]
+
+    out[:, _hex_columns] = _hex_digits[padded >> 4]
+    out[:, _hex_columns + 1] = _hex_digits[padded & 0xf]
+    out[:, _ascii_bar] = ord('|')
+    out[:, _ascii_bar + 1:_ascii_bar + 1 + BYTES_PER_ROW] = _ascii_lut[padded]
+    out[:, _ascii_bar + 1 + BYTES_PER_ROW] = ord('|')
+    out[:, ROW_WIDTH - 1] = ord('\n')
+
+    # Blank the bytes past the end of the data in the last row.
+    missing = rows * BYTES_PER_ROW - len(values)
+    if missing > 0:
+        used = BYTES_PER_ROW - missing
+        out[-1, _hex_columns[used]:_ascii_bar - 1] = ord(' ')
+        out[-1, _ascii_bar + 1 + used:_ascii_bar + 1 + BYTES_PER_ROW] = ord(' ')
+
+    return out.tobytes().decode('ascii')
+
+
+class HexDumper():
+    """Formats a stream of bytes as a hex dump. Bytes that don't fill a row
+    are kept and shown as a partial row until the row is complete.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._offset = 0
+        self._partial = b''
+
+    def dump(self, data):
+        """
+        Returns
+        -------
+        A tuple (rows, partial). "rows" are the rows completed by the data,
+        "partial" is the row that isn't full yet, or an empty string. The
+        partial row replaces the one returned by the previous call.
+        """
+        data = self._partial + data
+        complete = len(data) - len(data) % BYTES_PER_ROW
+        rows = formatRows(data[:complete], self._offset)
+        self._offset += complete
+        self._partial = data[complete:]
+        return rows, formatRows(self._partial, self._offset)
@@ -15,11 +15,69 @@ Copyright 2017-2018 Justin Watson
 """
 
 from copy import deepcopy
+import re
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
 import material_colors as mc
 
+
+class PatternMatcher():
+    """Matches a list of regular expressions against the same text. The
+    patterns are also compiled into one alternation, so text that none of
+    them match, which is most text, is rejected with a single search.
+
+    Parameters
+    ----------
+    patterns : list
+        A tuple (pattern, case_sensitive) per regular expression.
+    binary : bool
+        Match bytes instead of str. The patterns are encoded as Latin-1.
+    tags : list
+        A value per pattern, e.g. its color, kept in "tags" in the order of
+        "regexes".
+
+    Raises
+    ------
+    re.error
+        If a pattern isn't a valid regular expression.
+    """
+
+    def __init__(self, patterns, binary=False, tags=None):
+        self.regexes = []
+        self.tags = list(tags) if tags is not None else [None] * len(patterns)
+        alternatives = []
+        for pattern, case_sensitive in patterns:
+            flags = '' if case_sensitive else 'i'
+            if binary:
+                pattern = pattern.encode('latin-1', 'replace')
+            self.regexes.append(re.compile(pattern,
+                0 if case_sensitive else re.IGNORECASE))
+            alternatives.append('(?{}:{})'.format(flags, pattern) if not binary
+                else b'(?' + flags.encode() + b':' + pattern + b')')
+        # Numbered back references would refer to the wrong groups and the
+        # same group name can't be used twice, so those patterns are searched
+        # one at a time instead.
+        self._combined = None
+        if len(alternatives) > 0 and not any(re.search(r'\\[1-9]', p)
+                for p, case_sensitive in patterns):
+            try:
+                self._combined = re.compile((b'|' if binary else '|').join(
+                    alternatives))
+            except re.error:
+                pass
+
+    def search(self, text, pos=0):
+        """
+        Returns
+        -------
+        True if any of the patterns match the text from "pos".
+        """
+        if self._combined is not None:
+            return self._combined.search(text, pos) is not None
+        return any(regex.search(text, pos) for regex in self.regexes)
+
+
 class HighlightManager(QtCore.QObject):
     def __init__(self, num_highlights=10):
         self._highlights = []
@@ -34,6 +92,7 @@ class HighlightManager(QtCore.QObject):
         for x in range(num_highlights):
             highlight_config['color'] = mc.colors[color_names[x]]['400']
             self._highlights.append(deepcopy(highlight_config))
+        self._matcher = None
 
     def get_highlights(self):
         """
@@ -43,3 +102,27 @@ class HighlightManager(QtCore.QObject):
 
     def set_highlight(self, index, config):
         self._highlights[index] = config
+        self._matcher = None
+
+    def matcher(self):
+        """
+        Returns
+        -------
+        A PatternMatcher of the enabled highlights, tagged with their
+        colors. It is compiled once and reused until a highlight changes.
+        """
+        if self._matcher is None:
+            patterns = []
+            colors = []
+            for h in self._highlights:
+                if not h['enabled'] or h['pattern'] == '':
+                    continue
+                try:
+                    re.compile(h['pattern'])
+                except re.error:
+                    # Probably still being typed.
+                    continue
+                patterns.append((h['pattern'], h['case_sensitive']))
+                colors.append(h['color'])
+            self._matcher = PatternMatcher(patterns, tags=colors)
+        return self._matcher
@@ -0,0 +1,225 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Measures the round trip time of a command. The probe writes the command to
+the serial port on a schedule and waits for a response matching a regular
+expression. The time from the write to the read with the response, both
+time.monotonic(), is recorded in a histogram.
+
+The histogram is in the style of HdrHistogram: the buckets are a power of
+two wide and each is split into the same number of sub-buckets, so values
+from microseconds to minutes are recorded with a fixed relative precision in
+a small, fixed amount of memory, and percentiles are exact to that
+precision.
+
+References
+----------
+* http://hdrhistogram.org/
+* https://github.com/HdrHistogram/HdrHistogram/blob/master/src/main/java/org/HdrHistogram/AbstractHistogram.java
+
+"""
+
+import math
+import re
+import time
+
+from PyQt5 import QtCore
+
+
+class Histogram():
+    """A histogram of integers with a fixed relative precision.
+
+    Parameters
+    ----------
+    highest : int
+        The highest value that can be recorded. Higher values are recorded
+        as this.
+    significant_digits : int
+        The number of decimal digits each value is recorded with.
+    """
+
+    def __init__(self, highest=60 * 1000000, significant_digits=2):
+        sub_buckets = 2 ** math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._sub_bits = int(math.log2(sub_buckets))
+        self._half = sub_buckets // 2
+        self.highest = highest
+        self._counts = [0] * (self._index(highest) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._total = 0
+
+    def record(self, value):
+        value = min(max(int(value), 0), self.highest)
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self._total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self._total / self.count if self.count > 0 else None
+
+    def percentile(self, p):
+        """
+        Returns
+        -------
+        The value that "p" percent of the values are less than or equal to,
+        within the precision of the histogram, or None if it is empty.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(p / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._highestEquivalent(index), self.max)
+        return self.max
+
+    def _index(self, value):
+        bucket = max(0, value.bit_length() - self._sub_bits)
+        return bucket * self._half + (value >> bucket)
+
+    def _highestEquivalent(self, index):
+        if index < 2 * self._half:
+            return index
+        bucket = index // self._half - 1
+        return ((index - bucket * self._half) << bucket) + (1 << bucket) - 1
+
+
+class LatencyProbe(QtCore.QObject):
+    """Sends a command every "interval" seconds and times the response. Only
+    one command is outstanding at a time: a command that hasn't been
+    answered after "timeout" seconds is counted as a timeout at the next
+    tick, and the next command is sent on the tick after that. Data
+    received in between is ignored, so a late response isn't taken as the
+    response to the next command.
+
+    Round trip times are recorded in microseconds in "histogram".
+    """
+
+    # Emitted after every response and timeout.
+    updated = QtCore.pyqtSignal()
+
+    # Bytes of received data kept while waiting for a response.
+    MAX_RESPONSE = 4096
+
+    def __init__(self, serial_port):
+        super(LatencyProbe, self).__init__()
+        self._serial_port = serial_port
+        self.histogram = Histogram()
+        self.command = b''
+        self._regex = None
+        self.interval = 1.0
+        self.timeout = 1.0
+        self._sent_time = None
+        self._received = b''
+        self.sent = 0
+        self.timeouts = 0
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._onTimer)
+
+    def setConfig(self, command, response, interval=1.0, timeout=1.0):
+        """
+        Parameters
+        ----------
+        command : str
+            The command to send. Escapes such as "\\r\\n" are allowed.
+        response : str
+            A regular expression that matches the response.
+        interval : float
+            Seconds between commands.
+        timeout : float
+            Seconds to wait for a response.
+
+        Raises
+        ------
+        re.error
+            If the response pattern isn't valid.
+        """
+        self._regex = re.compile(response.encode('latin-1', 'replace'))
+        self.command = command.encode('latin-1').decode(
+            'unicode_escape').encode('latin-1')
+        self.interval = interval
+        self.timeout = timeout
+
+    def isRunning(self):
+        return self._timer.isActive()
+
+    def start(self):
+        if self._regex is None:
+            return
+        self._serial_port.dataReceived.connect(self._onDataReceived)
+        self._timer.start(max(1, int(self.interval * 1000)))
+        self._onTimer()
+
+    def stop(self):
+        if not self._timer.isActive():
+            return
+        self._timer.stop()
+        self._serial_port.dataReceived.disconnect(self._onDataReceived)
+        self._sent_time = None
+
+    def reset(self):
+        self.histogram.reset()
+        self.sent = 0
+        self.timeouts = 0
+        self.updated.emit()
+
+    def statsToStr(self):
+        h = self.histogram
+
+        def ms(us):
+            return '-' if us is None else '{:.3f}'.format(us / 1000)
+
+        return 'sent: {}, responses: {}, timeouts: {}\n' \
+            'p50: {} ms, p90: {} ms, p99: {} ms, max: {} ms\n' \
+            'min: {} ms, mean: {} ms'.format(self.sent, h.count,
+            self.timeouts, ms(h.percentile(50)), ms(h.percentile(90)),
+            ms(h.percentile(99)), ms(h.max), ms(h.min), ms(h.mean()))
+
+    def _onDataReceived(self, data, timestamp):
+        if self._sent_time is None:
+            return
+        self._received = (self._received + data)[-self.MAX_RESPONSE:]
+        if self._regex.search(self._received) is None:
+            return
+        self.histogram.record((timestamp - self._sent_time) * 1000000)
+        self._sent_time = None
+        self.updated.emit()
+
+    def _onTimer(self):
+        if not self._serial_port.is_connected:
+            return
+        if self._sent_time is not None:
+            if time.monotonic() - self._sent_time < self.timeout:
+                return
+            self.timeouts += 1
+            # Nothing is sent on this tick so a late response arrives while
+            # no command is outstanding.
+            self._sent_time = None
+            self.updated.emit()
+            return
+        self._received = b''
+        self._sent_time = time.monotonic()
+        self._serial_port.write(self.command)
+        self.sent += 1
@@ -0,0 +1,240 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Sends data to the serial port at fixed intervals, e.g. heartbeat frames.
+
+The sends are timed by a thread of their own instead of a QTimer on the GUI
+thread, which is late whenever the GUI is busy. Deadlines are absolute, so
+lateness doesn't accumulate. The thread sleeps until each deadline. Sleeps
+wake up late by the scheduler's granularity, typically tens of
+microseconds on Linux and up to a millisecond or more on Windows, and
+another Python thread holding the interpreter can add up to its switch
+interval (sys.getswitchinterval(), 5 ms by default). Both show in the
+jitter. The sender doesn't busy wait or change the switch interval, which
+would slow the GUI and the other threads of the application.
+
+On POSIX systems the thread writes to the port's file descriptor itself.
+That bypasses QSerialPort's write buffer, so a periodic send can land in
+the middle of a long write from the console that QSerialPort hasn't
+finished. Send periodically only when nothing else writes frames that
+mustn't be split. Elsewhere the write is handed to the GUI thread, which
+keeps the writes in order but is as good as the GUI's responsiveness.
+
+The file descriptor is non-blocking, so a write can take only part of a
+frame when the output buffer is full, e.g. under flow control. The rest is
+written as the buffer drains, up to the next deadline. A frame that still
+isn't finished by then is finished before anything else at that deadline,
+which is skipped, so a frame is never cut short.
+
+How late each send was (the jitter) is recorded in a histogram, and
+deadlines that passed without a send, because the sender was more than a
+period late, are counted as missed.
+
+"""
+
+import math
+import os
+import select
+import threading
+import time
+
+from PyQt5 import QtCore
+
+import console
+import latency_probe
+
+
+class PeriodicJob():
+    """One thing to send periodically and its statistics."""
+
+    def __init__(self, data, interval):
+        self.data = data
+        self.interval = interval
+        self.next = 0.0
+        self.sent = 0
+        self.missed = 0
+        # Sends that weren't written by the next deadline, which was spent
+        # finishing them instead.
+        self.delayed = 0
+        # The part of the frame being sent that hasn't been written yet, or
+        # None.
+        self.pending = None
+        # How late the sends were in microseconds.
+        self.jitter = latency_probe.Histogram()
+
+    def statsToStr(self):
+        h = self.jitter
+
+        def us(value):
+            return '-' if value is None else '{:.0f}'.format(value)
+
+        return '{!r} every {:g} ms: sent {}, missed {}, delayed {}, ' \
+            'jitter p50 {} us, p99 {} us, max {} us'.format(self.data,
+            self.interval * 1000, self.sent, self.missed, self.delayed,
+            us(h.percentile(50)), us(h.percentile(99)), us(h.max))
+
+
+class PeriodicSender(QtCore.QObject):
+    """Runs the periodic jobs on a timing thread. The thread runs while there
+    are jobs and the port is open. It ends by itself when the last job is
+    removed, including when a send fails.
+    """
+
+    # Asks the GUI thread to write when the port has no file descriptor.
+    _writeRequested = QtCore.pyqtSignal(object, float)
+
+    def __init__(self, serial_port):
+        super(PeriodicSender, self).__init__()
+        self._serial_port = serial_port
+        self._condition = threading.Condition()
+        self._jobs = []
+        self._thread = None
+        # Whether the thread is running or about to. Changed with the
+        # condition held, so a job added as the thread ends starts another.
+        self._running = False
+        self._stop = False
+        self._fd = None
+        self._writeRequested.connect(self._onWriteRequested)
+        serial_port.opened.connect(self._start)
+        # The thread has to be stopped while the file descriptor is valid.
+        serial_port.closing.connect(self._stopThread)
+
+    def add(self, data, interval):
+        """Sends "data" every "interval" seconds, starting now.
+
+        Returns
+        -------
+        The PeriodicJob.
+        """
+        job = PeriodicJob(data, interval)
+        with self._condition:
+            job.next = time.monotonic()
+            self._jobs.append(job)
+            self._condition.notify()
+        if self._serial_port.is_connected:
+            self._start()
+        return job
+
+    def remove(self, job):
+        with self._condition:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            # The thread ends if it was the last job.
+            self._condition.notify()
+
+    def jobs(self):
+        with self._condition:
+            return list(self._jobs)
+
+    def clear(self):
+        for job in self.jobs():
+            self.remove(job)
+
+    def statsToStr(self):
+        return '\n'.join(job.statsToStr() for job in self.jobs())
+
+    def _start(self):
+        with self._condition:
+            if self._running or len(self._jobs) == 0:
+                return
+            self._running = True
+            self._stop = False
+            now = time.monotonic()
+            for job in self._jobs:
+                job.next = now
+                # The rest of a frame from before the port was closed.
+                job.pending = None
+        if self._thread is not None:
+            # A thread that ended by itself.
+            self._thread.join()
+        self._fd = None
+        if os.name == 'posix':
+            self._fd = self._serial_port.handle()
+        self._thread = threading.Thread(target=self._run,
+            name='periodic sender', daemon=True)
+        self._thread.start()
+
+    def _stopThread(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stop or len(self._jobs) == 0:
+                    self._running = False
+                    return
+                job = min(self._jobs, key=lambda j: j.next)
+                delay = job.next - time.monotonic()
+                if delay > 0:
+                    # Woken early if the jobs change.
+                    self._condition.wait(delay)
+                    continue
+            now = time.monotonic()
+            self._send(job, now)
+            job.next += job.interval
+            if now > job.next:
+                missed = math.floor((now - job.next) / job.interval) + 1
+                job.missed += missed
+                job.next += missed * job.interval
+
+    def _send(self, job, now):
+        if self._fd is None:
+            self._writeRequested.emit(job, job.next)
+            return
+        if job.pending is None:
+            job.pending = memoryview(job.data)
+            job.jitter.record((now - job.next) * 1000000)
+        # The rest of the frame can be written until the next deadline.
+        deadline = job.next + job.interval
+        try:
+            while True:
+                try:
+                    written = os.write(self._fd, job.pending)
+                except BlockingIOError:
+                    written = 0
+                job.pending = job.pending[written:]
+                if len(job.pending) == 0:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop:
+                    # Finished at the next deadline instead of sending the
+                    # next frame.
+                    job.delayed += 1
+                    return
+                # Woken when the buffer has room, or now and then to check
+                # for a stop.
+                select.select([], [self._fd], [], min(remaining, 0.05))
+        except OSError as e:
+            console.enqueue('Periodic send of {!r} stopped: {}'.format(
+                job.data, e), console.WARNING)
+            with self._condition:
+                if job in self._jobs:
+                    self._jobs.remove(job)
+            return
+        job.pending = None
+        job.sent += 1
+
+    def _onWriteRequested(self, job, deadline):
+        if not self._serial_port.is_connected:
+            return
+        now = time.monotonic()
+        self._serial_port.write(job.data)
+        job.sent += 1
+        job.jitter.record((now - deadline) * 1000000)
@@ -0,0 +1,1018 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+The received data path. Data read from the serial port is fed to a Pipeline
+which runs it through a list of stages on a worker thread. A stage takes an
+item and returns a list of items for the next stage. Sinks are stages that
+consume the items and pass them on unchanged, so several sinks can be chained
+at the end of a pipeline.
+
+Pipelines are declared per connection profile in connections.yaml with the
+key "pipeline". e.g.
+
+    pipeline:
+      - stage: decode
+        encoding: utf-8
+      - stage: lines
+      - stage: filter
+        pattern: '^DBG'
+        invert: true
+      - stage: display
+      - stage: file
+        path: device.log
+
+Binary protocols are split into frames by the frame stage. e.g.
+
+    pipeline:
+      - stage: frame
+        framer: slip
+      - stage: display
+
+If a profile doesn't have a pipeline then DEFAULT_CONFIG is used. A display
+sink that gets bytes, because it is before the decode stage, sends them to
+the console as bytes, which is how the hex view is shown.
+
+References
+----------
+* https://docs.python.org/3/library/codecs.html#incremental-decoding-and-encoding
+* https://wiki.python.org/moin/PyQt/Threading%2C_Signals_and_Slots
+
+"""
+
+import codecs
+import collections
+import datetime
+import os
+import queue
+import re
+import socket
+import threading
+import time
+
+from PyQt5 import QtCore
+
+import console
+
+
+DEFAULT_CONFIG = [
+    {'stage': 'decode', 'encoding': 'utf-8'},
+    {'stage': 'display'},
+]
+
+# How long the worker waits for data before polling the stages. Stages that
+# hold on to data, such as a partial line, use the poll to release it.
+POLL_INTERVAL = 0.05
+
+
+class Stage():
+    """Base class for all of the stages.
+
+    Parameters
+    ----------
+    config : dict
+        The stage's entry from the "pipeline" list of the connection profile.
+    pipeline : Pipeline
+        The pipeline that owns the stage. Sinks use it to emit signals.
+    """
+
+    # The kind of item the stage takes, "bytes", "text" or "frames", or None
+    # for any. Checked when the pipeline is built.
+    accepts = None
+    # The kind of item the stage returns. None if it is what it was given.
+    produces = None
+
+    def __init__(self, config, pipeline):
+        self.name = config['stage']
+        self._pipeline = pipeline
+        # Set by the pipeline when the stage raises an error. A disabled
+        # stage passes the items on unchanged.
+        self.disabled = False
+        # Statistics, updated by the pipeline.
+        self.items_in = 0
+        self.items_out = 0
+        self.seconds = 0.0
+
+    def process(self, item, timestamp):
+        """Processes one item.
+
+        Parameters
+        ----------
+        item
+            The output of the previous stage. The first stage gets the bytes
+            read from the serial port.
+        timestamp : float
+            The time.monotonic() time the data was read from the port.
+
+        Returns
+        -------
+        A list of items for the next stage.
+        """
+        return [item]
+
+    def poll(self, now):
+        """Called when no data has arrived for POLL_INTERVAL seconds.
+
+        Returns
+        -------
+        A list of items for the next stage.
+        """
+        return []
+
+    def flush(self):
+        """Called after a batch of data has gone through all of the stages."""
+        pass
+
+    def statsToStr(self):
+        """
+        Returns
+        -------
+        Statistics particular to the stage or an empty string.
+        """
+        return ''
+
+    def close(self):
+        """Called when the stage is removed from the pipeline."""
+        pass
+
+
+def toText(item):
+    """Converts an item for a sink. Text and bytes are left as they are and
+    anything else, such as a framing.Frame, is converted to a string.
+    """
+    if isinstance(item, (str, bytes)):
+        return item
+    return str(item)
+
+
+class DecodeStage(Stage):
+    """Decodes bytes into text. Multi-byte characters split across reads are
+    handled by the incremental decoder and invalid bytes are replaced instead
+    of raising an error.
+    """
+
+    accepts = 'bytes'
+    produces = 'text'
+
+    def __init__(self, config, pipeline):
+        super(DecodeStage, self).__init__(config, pipeline)
+        encoding = config.get('encoding', 'utf-8')
+        self._decoder = codecs.getincrementaldecoder(encoding)(
+            errors=config.get('errors', 'replace'))
+
+    def process(self, item, timestamp):
+        text = self._decoder.decode(item)
+        if text == '':
+            return []
+        return [text]
+
+
+class LineStage(Stage):
+    """Splits text into lines. The line endings are kept.
+
+    A partial line is held until the rest of the line arrives or until it is
+    older than "timeout" seconds. The timeout keeps prompts, which don't end
+    in a new line, from being held forever.
+    """
+
+    accepts = 'text'
+
+    def __init__(self, config, pipeline):
+        super(LineStage, self).__init__(config, pipeline)
+        self._timeout = float(config.get('timeout', 0.1))
+        self._partial = ''
+        self._partial_time = 0.0
+
+    def process(self, item, timestamp):
+        lines = (self._partial + item).split('\n')
+        if self._partial == '' or len(lines) > 1:
+            self._partial_time = timestamp
+        self._partial = lines.pop()
+        return [line + '\n' for line in lines]
+
+    def poll(self, now):
+        if self._partial == '' or now - self._partial_time < self._timeout:
+            return []
+        line = self._partial
+        self._partial = ''
+        return [line]
+
+
+class FrameStage(Stage):
+    """Splits bytes into frames with one of the framers in the framing
+    module. The stage's settings are passed to the framer. e.g.
+
+        - stage: frame
+          framer: length
+          length_size: 2
+
+    The frames of a batch are also emitted with Pipeline.framesReceived for
+    scripts.
+    """
+
+    accepts = 'bytes'
+    produces = 'frames'
+
+    def __init__(self, config, pipeline):
+        super(FrameStage, self).__init__(config, pipeline)
+        # Imported here so the framers are only loaded when they are used.
+        import framing
+        # Framers that depend on the line settings, e.g. the gap framer, get
+        # them from the serial configuration.
+        framer_config = {k: pipeline.serial_config[k] for k in
+            ('baud', 'data_bits', 'parity', 'stop_bits')
+            if k in pipeline.serial_config}
+        framer_config.update(config)
+        self._framer = framing.create(config.get('framer', 'delimiter'),
+            framer_config)
+        self._frames = []
+        self._total_duration = 0.0
+        self._max_duration = 0.0
+
+    def process(self, item, timestamp):
+        if item is None:
+            frames = self._framer.poll(timestamp)
+        else:
+            frames = self._framer.feed(item, timestamp)
+        for frame in frames:
+            duration = frame.end - frame.start
+            self._total_duration += duration
+            if duration > self._max_duration:
+                self._max_duration = duration
+        self._frames.extend(frames)
+        return frames
+
+    def poll(self, now):
+        if not hasattr(self._framer, 'poll'):
+            return []
+        return self.process(None, now)
+
+    def flush(self):
+        if len(self._frames) > 0:
+            self._pipeline.framesReceived.emit(self._frames)
+            self._frames = []
+
+    def statsToStr(self):
+        frames = self._framer.frames
+        mean = self._total_duration / frames if frames > 0 else 0.0
+        s = 'frames: {}, time to receive a frame: mean {:.3f} ms, max ' \
+            '{:.3f} ms, dropped bytes: {}'.format(frames, mean * 1000,
+            self._max_duration * 1000, self._framer.dropped_bytes)
+        if hasattr(self._framer, 'gapStatsToStr'):
+            s += '\n           ' + self._framer.gapStatsToStr()
+        return s
+
+
+class FilterStage(Stage):
+    """Drops the items that don't match a regular expression. When "invert"
+    is true the items that do match are dropped. Frames are matched on their
+    bytes.
+    """
+
+    def __init__(self, config, pipeline):
+        super(FilterStage, self).__init__(config, pipeline)
+        flags = 0 if config.get('case_sensitive', True) else re.IGNORECASE
+        self._regex = re.compile(config['pattern'], flags)
+        self._bytes_regex = re.compile(config['pattern'].encode('latin-1',
+            'replace'), flags)
+        self._invert = bool(config.get('invert', False))
+
+    def process(self, item, timestamp):
+        if isinstance(item, str):
+            match = self._regex.search(item)
+        else:
+            match = self._bytes_regex.search(getattr(item, 'data', item))
+        if (match is None) == self._invert:
+            return [item]
+        return []
+
+
+class RecordStage(Stage):
+    """Parses items into records with a regular expression whose named
+    groups are the fields. Use it after a lines stage so each item is a
+    line. e.g.
+
+        - stage: records
+          pattern: 'T=(?P<temp>[-\\d.]+) state=(?P<state>\\w+)'
+          types: {state: str}
+          csv: telemetry.csv
+
+    The records are kept in a records.RecordStore in Pipeline.records under
+    the stage's "name" (default "records"), which survives the pipeline
+    being rebuilt as long as the fields don't change. Fields are float64
+    unless "types" says otherwise. Values that can't be converted are
+    stored as NaN or 0 and counted. "csv" and "npy" stream the records to
+    the end of files as they arrive. When "keep_text" is false the lines
+    that were parsed are dropped so only the rest reach the display.
+    """
+
+    def __init__(self, config, pipeline):
+        super(RecordStage, self).__init__(config, pipeline)
+        # Imported here so NumPy is only loaded when records are used.
+        import records
+        self._regex = re.compile(config['pattern'])
+        groups = sorted(self._regex.groupindex.items(), key=lambda g: g[1])
+        if len(groups) == 0:
+            raise ValueError('The records pattern has no named groups.')
+        # Unnamed groups are skipped.
+        self._indexes = [index - 1 for name, index in groups]
+        self._all_named = len(groups) == self._regex.groups
+        dtype = records.makeDtype([name for name, index in groups],
+            config.get('types'), int(config.get('str_length', 16)))
+        self._name = config.get('name', 'records')
+        store = pipeline.records.get(self._name)
+        if store is None or store.dtype != dtype:
+            store = records.RecordStore(dtype,
+                int(config.get('max_records', records.MAX_RECORDS)))
+            pipeline.records[self._name] = store
+        self.store = store
+        self._keep_text = bool(config.get('keep_text', True))
+        # The files are appended to so rebuilding the pipeline, e.g. to
+        # show the hex view or after a reconnect, doesn't lose what was
+        # recorded.
+        self._writers = []
+        try:
+            if 'csv' in config:
+                self._writers.append(records.CsvWriter(config['csv'], dtype,
+                    append=True))
+            if 'npy' in config:
+                self._writers.append(records.NpyWriter(config['npy'], dtype,
+                    append=True))
+        except Exception:
+            self.close()
+            raise
+        self._timestamps = []
+        self._rows = []
+
+    def process(self, item, timestamp):
+        if not isinstance(item, str):
+            return [item]
+        count = len(self._rows)
+        if self._all_named and len(self._indexes) > 1:
+            self._rows.extend(self._regex.findall(item))
+        else:
+            for match in self._regex.finditer(item):
+                groups = match.groups()
+                self._rows.append(tuple(groups[i] for i in self._indexes))
+        count = len(self._rows) - count
+        if count == 0:
+            return [item]
+        self._timestamps.extend([timestamp] * count)
+        return [item] if self._keep_text else []
+
+    def flush(self):
+        if len(self._rows) == 0:
+            return
+        block = self.store.append(self._timestamps, self._rows)
+        self._timestamps = []
+        self._rows = []
+        for writer in self._writers:
+            writer.write(block)
+            writer.flush()
+
+    def statsToStr(self):
+        return '{}: {} records, {} bad values'.format(self._name,
+            len(self.store), self.store.bad_values)
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+        self._writers = []
+
+
+class TriggerStage(Stage):
+    """Captures the data around a pattern, like the trigger of an
+    oscilloscope. The last "pre_bytes" and "pre_seconds" of data are kept.
+    When "pattern" matches, they are written to a file followed by the data
+    that arrives in the next "post_bytes" or "post_seconds", whichever comes
+    first. e.g.
+
+        - stage: trigger
+          pattern: HardFault
+          pre_seconds: 30
+          post_seconds: 5
+          path: 'hardfault-%Y%m%d-%H%M%S.log'
+
+    "path" is formatted with strftime() when the trigger fires. A match
+    while capturing doesn't start another capture. After
+    "max_captures" captures (default 100) the trigger is disarmed. Text is
+    saved as UTF-8 and bytes as is.
+    """
+
+    # Characters of the previous item searched with the next one, so a
+    # match split across two items is found.
+    OVERLAP = 256
+
+    def __init__(self, config, pipeline):
+        super(TriggerStage, self).__init__(config, pipeline)
+        flags = 0 if config.get('case_sensitive', True) else re.IGNORECASE
+        self._pattern = config['pattern']
+        self._regex = re.compile(self._pattern, flags)
+        self._bytes_regex = re.compile(self._pattern.encode('latin-1',
+            'replace'), flags)
+        self._path = config.get('path', 'trigger-%Y%m%d-%H%M%S.log')
+        self._pre_bytes = int(config.get('pre_bytes', 64 * 1024))
+        self._pre_seconds = float(config.get('pre_seconds', 10))
+        self._post_bytes = int(config.get('post_bytes', 64 * 1024))
+        self._post_seconds = float(config.get('post_seconds', 5))
+        self._max_captures = int(config.get('max_captures', 100))
+        # The pre-trigger window as (timestamp, bytes), oldest first.
+        self._window = collections.deque()
+        self._window_bytes = 0
+        self._tail = None
+        self._file = None
+        self._post_end = 0.0
+        self._post_left = 0
+        self.captures = 0
+
+    def process(self, item, timestamp):
+        data = toText(item)
+        if isinstance(data, str):
+            match = self._search(self._regex, data, '')
+            data = data.encode('utf-8')
+        else:
+            match = self._search(self._bytes_regex, data, b'')
+        if self._file is not None:
+            self._capture(data, timestamp)
+        elif match and self.captures < self._max_captures:
+            self._open(timestamp)
+            self._capture(data, timestamp)
+        else:
+            self._addToWindow(data, timestamp)
+        return [item]
+
+    def poll(self, now):
+        if self._file is not None and now >= self._post_end:
+            self._finish()
+        return []
+
+    def statsToStr(self):
+        return 'captures: {}{}'.format(self.captures,
+            ', capturing' if self._file is not None else '')
+
+    def close(self):
+        if self._file is not None:
+            self._finish()
+
+    def _search(self, regex, data, empty):
+        if self._tail is None or type(self._tail) != type(data):
+            self._tail = empty
+        text = self._tail + data
+        match = regex.search(text)
+        # A match that is all in the tail was already found.
+        while match is not None and match.end() <= len(self._tail):
+            match = regex.search(text, match.start() + 1)
+        self._tail = text[-self.OVERLAP:]
+        return match is not None
+
+    def _addToWindow(self, data, timestamp):
+        self._window.append((timestamp, data))
+        self._window_bytes += len(data)
+        while len(self._window) > 1 and (
+                self._window_bytes - len(self._window[0][1]) >= self._pre_bytes
+                or timestamp - self._window[0][0] > self._pre_seconds):
+            self._window_bytes -= len(self._window.popleft()[1])
+        if self._window_bytes > self._pre_bytes:
+            # One chunk bigger than the window.
+            t, oldest = self._window[0]
+            trim = self._window_bytes - self._pre_bytes
+            self._window[0] = (t, oldest[trim:])
+            self._window_bytes -= trim
+
+    def _open(self, timestamp):
+        path = datetime.datetime.now().strftime(self._path)
+        base, ext = os.path.splitext(path)
+        n = 1
+        while os.path.exists(path):
+            path = '{}-{}{}'.format(base, n, ext)
+            n += 1
+        try:
+            self._file = open(path, 'wb')
+        except OSError as e:
+            console.enqueue('Trigger "{}" could not save a capture: {}'.format(
+                self._pattern, e), console.ERROR)
+            return
+        for t, data in self._window:
+            self._file.write(data)
+        self._window.clear()
+        self._window_bytes = 0
+        self._file_path = path
+        self._post_end = timestamp + self._post_seconds
+        self._post_left = self._post_bytes
+        self.captures += 1
+
+    def _capture(self, data, timestamp):
+        if self._file is None:
+            self._addToWindow(data, timestamp)
+            return
+        self._file.write(data[:self._post_left])
+        self._post_left -= len(data)
+        if self._post_left <= 0 or timestamp >= self._post_end:
+            self._finish()
+
+    def _finish(self):
+        self._file.close()
+        self._file = None
+        console.enqueue('Trigger "{}" saved a capture to {}'.format(
+            self._pattern, self._file_path))
+
+
+class RuleStage(Stage):
+    """Runs actions when patterns are found in the data. e.g.
+
+        - stage: rules
+          rules:
+            - pattern: HardFault
+              action: notify
+              message: The device crashed.
+            - pattern: 'login: $'
+              action: send
+              send: 'root\\r'
+            - pattern: Booting
+              action: record_start
+              path: 'boot-%H%M%S.log'
+            - pattern: Ready
+              action: record_stop
+            - pattern: Retry
+              action: count
+
+    Every rule counts its matches. "notify" shows a desktop notification and
+    "send" writes the string, which can have escapes, to the serial port.
+    They are emitted with Pipeline.ruleFired and run on the GUI thread, at
+    most once per "holdoff" seconds (default 1). "record_start" saves all
+    of the data that follows to a file, named with strftime(), until a
+    "record_stop" rule matches.
+
+    The patterns are matched with a highlighter.PatternMatcher, so data
+    that matches no rule costs one search. The matches and the time spent
+    on each rule are in the statistics. The stage works on bytes or text and
+    finds matches split across reads.
+    """
+
+    ACTIONS = ('count', 'notify', 'record_start', 'record_stop', 'send')
+
+    # Characters of the previous item searched with the next one.
+    OVERLAP = 256
+
+    def __init__(self, config, pipeline):
+        super(RuleStage, self).__init__(config, pipeline)
+        # Imported here so the GUI modules aren't needed by the worker until
+        # the rules are used.
+        import highlighter
+        self._rules = []
+        patterns = []
+        for rule in config['rules']:
+            action = rule.get('action', 'count')
+            if action not in self.ACTIONS:
+                raise ValueError('Unknown rule action "{}".'.format(action))
+            patterns.append((rule['pattern'], rule.get('case_sensitive', True)))
+            if action == 'send':
+                argument = rule['send'].encode('latin-1').decode(
+                    'unicode_escape')
+            elif action == 'notify':
+                argument = rule.get('message', 'Matched "{}".'.format(
+                    rule['pattern']))
+            else:
+                argument = rule.get('path', 'record-%Y%m%d-%H%M%S.log')
+            self._rules.append({
+                'name': rule.get('name', rule['pattern']),
+                'action': action,
+                'argument': argument,
+                'holdoff': float(rule.get('holdoff', 1.0)),
+                'last': None,
+                'hits': 0,
+                'seconds': 0.0,
+            })
+        self._matchers = {
+            str: highlighter.PatternMatcher(patterns),
+            bytes: highlighter.PatternMatcher(patterns, binary=True),
+        }
+        self._tail = None
+        self._file = None
+        self.prefilter_seconds = 0.0
+
+    def process(self, item, timestamp):
+        data = toText(item)
+        if self._tail is None or type(self._tail) != type(data):
+            self._tail = data[:0]
+        text = self._tail + data
+        start = len(self._tail)
+        self._tail = text[-self.OVERLAP:]
+        matcher = self._matchers[type(data)]
+        t0 = time.perf_counter()
+        found = matcher.search(text)
+        self.prefilter_seconds += time.perf_counter() - t0
+        if found:
+            for rule, regex in zip(self._rules, matcher.regexes):
+                t0 = time.perf_counter()
+                # A match that is all in the tail was found with the
+                # previous item.
+                hits = sum(1 for m in regex.finditer(text) if m.end() > start)
+                rule['seconds'] += time.perf_counter() - t0
+                if hits > 0:
+                    rule['hits'] += hits
+                    self._fire(rule, timestamp)
+        if self._file is not None:
+            self._file.write(data.encode('utf-8') if isinstance(data, str)
+                else data)
+        return [item]
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def statsToStr(self):
+        lines = ['rules: prefilter {:.3f} s'.format(self.prefilter_seconds)]
+        for rule in self._rules:
+            lines.append('{:<20} {:<12} hits: {:<8} {:.3f} s'.format(
+                rule['name'][:20], rule['action'], rule['hits'],
+                rule['seconds']))
+        return '\n           '.join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _fire(self, rule, timestamp):
+        action = rule['action']
+        if action == 'count':
+            return
+        if action == 'record_start':
+            if self._file is None:
+                path = datetime.datetime.now().strftime(rule['argument'])
+                try:
+                    self._file = open(path, 'ab')
+                except OSError as e:
+                    console.enqueue('Rule "{}" could not record: {}'.format(
+                        rule['name'], e), console.ERROR)
+                    return
+                console.enqueue('Rule "{}" started recording to {}'.format(
+                    rule['name'], path))
+            return
+        if action == 'record_stop':
+            if self._file is not None:
+                console.enqueue('Rule "{}" stopped recording to {}'.format(
+                    rule['name'], self._file.name))
+                self.close()
+            return
+        if rule['last'] is not None and \
+                timestamp - rule['last'] < rule['holdoff']:
+            return
+        rule['last'] = timestamp
+        self._pipeline.ruleFired.emit(action, rule['name'], rule['argument'])
+
+
+class DisplaySink(Stage):
+    """Sends the items to the serial console widget. All of the items of a
+    batch are joined and emitted once to keep the GUI thread from being
+    flooded with signals. Text is emitted with displayData and bytes with
+    displayBytes. The displayed text is also fed to Pipeline.telemetry for
+    the plot.
+    """
+
+    def __init__(self, config, pipeline):
+        super(DisplaySink, self).__init__(config, pipeline)
+        self._pending = []
+        self._timestamp = 0.0
+
+    def process(self, item, timestamp):
+        self._pending.append(toText(item))
+        self._timestamp = timestamp
+        return [item]
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        telemetry = self._pipeline.telemetry
+        if isinstance(self._pending[0], str):
+            text = ''.join(self._pending)
+            self._pipeline.displayData.emit(text)
+            if telemetry is not None:
+                telemetry.feed(text, self._timestamp)
+        else:
+            data = b''.join(self._pending)
+            self._pipeline.displayBytes.emit(data)
+            if telemetry is not None:
+                telemetry.feed(data.decode('latin-1'), self._timestamp)
+        self._pending = []
+
+
+class FileSink(Stage):
+    """Appends the items to a file. Text is written with the file's
+    "encoding" (default UTF-8) and bytes are written as is.
+    """
+
+    def __init__(self, config, pipeline):
+        super(FileSink, self).__init__(config, pipeline)
+        self._encoding = config.get('encoding', 'utf-8')
+        self._file = open(config['path'], 'ab')
+
+    def process(self, item, timestamp):
+        text = toText(item)
+        if isinstance(text, str):
+            self._file.write(text.encode(self._encoding, 'replace'))
+        else:
+            self._file.write(text)
+        return [item]
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSink(Stage):
+    """Sends the items to a TCP server at "host" and "port". If the
+    connection is lost the sink is disabled and a message is posted to the
+    console.
+    """
+
+    def __init__(self, config, pipeline):
+        super(SocketSink, self).__init__(config, pipeline)
+        self._encoding = config.get('encoding', 'utf-8')
+        self._address = (config.get('host', 'localhost'), int(config['port']))
+        self._socket = socket.create_connection(self._address, timeout=2.0)
+
+    def process(self, item, timestamp):
+        if self._socket is None:
+            return [item]
+        data = toText(item)
+        if isinstance(data, str):
+            data = data.encode(self._encoding, 'replace')
+        try:
+            self._socket.sendall(data)
+        except OSError as e:
+            console.enqueue('Socket sink {}:{} disabled: {}'.format(
+                self._address[0], self._address[1], e), console.WARNING)
+            self.close()
+        return [item]
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+# Keep in alphabetical order.
+STAGES = {
+    'decode': DecodeStage,
+    'display': DisplaySink,
+    'file': FileSink,
+    'filter': FilterStage,
+    'frame': FrameStage,
+    'lines': LineStage,
+    'records': RecordStage,
+    'rules': RuleStage,
+    'socket': SocketSink,
+    'trigger': TriggerStage,
+}
+
+
+def hexViewConfig(config):
+    """Makes the pipeline configuration for the hex view. The display gets
+    the raw bytes and the rest of the stages are run as configured.
+
+    Parameters
+    ----------
+    config : list
+        The configuration of the profile's pipeline. None for the default.
+    """
+    if config is None:
+        config = DEFAULT_CONFIG
+    return [{'stage': 'display'}] + [c for c in config
+        if c['stage'] != 'display']
+
+
+class Pipeline(QtCore.QObject):
+    """Runs the received data through the stages on a worker thread.
+
+    Data is handed to the worker with feed(). Everything the worker has
+    queued is processed as one batch and then the stages are flushed, so the
+    display gets a single signal per batch no matter how many reads there
+    were.
+    """
+
+    # Emitted by the display sink with the text to append to the console.
+    displayData = QtCore.pyqtSignal(str)
+    # Emitted by a display sink that is given bytes.
+    displayBytes = QtCore.pyqtSignal(bytes)
+    # Emitted by the frame stage with the list of framing.Frame of a batch.
+    framesReceived = QtCore.pyqtSignal(list)
+    # Emitted by the rules stage with the action, the rule's name and the
+    # message or the string to send.
+    ruleFired = QtCore.pyqtSignal(str, str, str)
+
+    def __init__(self):
+        super(Pipeline, self).__init__()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stages = []
+        self._thread = None
+        # The configuration of the serial port. Stages that depend on the
+        # baud etc. read it when they are built.
+        self.serial_config = {}
+        # A telemetry.Telemetry that the display sink feeds with the text it
+        # displays, or None.
+        self.telemetry = None
+        # The records.RecordStore of the records stages by name.
+        self.records = {}
+
+    def build(self, config):
+        """Creates the stages from a pipeline configuration.
+
+        Raises
+        ------
+        ValueError
+            If a stage name is unknown or a stage is given the wrong kind of
+            item, e.g. the lines stage before the decode stage.
+        """
+        stages = []
+        # The kind of item the next stage is given.
+        kind = 'bytes'
+        try:
+            for stage_config in config:
+                name = stage_config['stage']
+                if name not in STAGES:
+                    raise ValueError('Unknown pipeline stage "{}".'.format(name))
+                stage_class = STAGES[name]
+                if stage_class.accepts not in (None, kind):
+                    raise ValueError('The pipeline stage "{}" takes {} but is '
+                        'given {}.'.format(name, stage_class.accepts, kind))
+                kind = stage_class.produces or kind
+                stages.append(stage_class(stage_config, self))
+        except Exception:
+            for stage in stages:
+                stage.close()
+            raise
+        return stages
+
+    def setConfig(self, config=None, serial_config=None):
+        """Replaces the stages with those from the configuration. If there is
+        an error in the configuration the default pipeline is used.
+
+        Parameters
+        ----------
+        config : list
+            List of stage configurations. None for the default pipeline.
+        serial_config : dict
+            The configuration of the serial port. None to keep the current
+            one.
+        """
+        if serial_config is not None:
+            self.serial_config = serial_config
+        if config is None:
+            config = DEFAULT_CONFIG
+        try:
+            stages = self.build(config)
+        except (ValueError, KeyError, OSError, re.error) as e:
+            console.enqueue('Error in pipeline configuration: {} Using the '
+                'default pipeline.'.format(e), console.ERROR)
+            stages = self.build(DEFAULT_CONFIG)
+        with self._lock:
+            old_stages = self._stages
+            self._stages = stages
+        for stage in old_stages:
+            self._call(stage, stage.flush)
+            self._call(stage, stage.close)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if len(self._stages) == 0:
+            self.setConfig(None)
+        self._thread = threading.Thread(target=self._run,
+            name='pipeline', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            for stage in self._stages:
+                stage.close()
+            self._stages = []
+
+    def feed(self, data, timestamp=None):
+        """Queues data read from the serial port. Safe to call from any
+        thread.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self._queue.put((data, timestamp))
+
+    def stats(self):
+        """
+        Returns
+        -------
+        A list of tuples (name, items in, items out, seconds) one for each
+        stage.
+        """
+        with self._lock:
+            return [(s.name, s.items_in, s.items_out, s.seconds)
+                for s in self._stages]
+
+    def statsToStr(self):
+        lines = []
+        with self._lock:
+            for s in self._stages:
+                per_item = s.seconds / s.items_in * 1e6 if s.items_in > 0 else 0.0
+                lines.append('{:<10} in: {:<10} out: {:<10} {:.3f} s ({:.1f} us/item){}'
+                    .format(s.name, s.items_in, s.items_out, s.seconds, per_item,
+                    ' disabled' if s.disabled else ''))
+                extra = s.statsToStr()
+                if extra != '':
+                    lines.append('           ' + extra)
+        return '\n'.join(lines)
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                with self._lock:
+                    self._poll(time.monotonic())
+                continue
+            # Take everything that is waiting so it is handled as one batch.
+            batch = [entry]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                for entry in batch:
+                    if entry is None:
+                        self._flush()
+                        return
+                    self._process(0, [entry[0]], entry[1])
+                self._flush()
+
+    def _process(self, first, items, timestamp):
+        """Runs the items through the stages starting at index "first"."""
+        for stage in self._stages[first:]:
+            if len(items) == 0:
+                return
+            if stage.disabled:
+                continue
+            start = time.perf_counter()
+            output = []
+            try:
+                for item in items:
+                    output.extend(stage.process(item, timestamp))
+            except Exception as e:
+                self._disable(stage, e)
+                continue
+            stage.seconds += time.perf_counter() - start
+            stage.items_in += len(items)
+            stage.items_out += len(output)
+            items = output
+
+    def _poll(self, now):
+        for i, stage in enumerate(self._stages):
+            if stage.disabled:
+                continue
+            items = self._call(stage, stage.poll, now) or []
+            if len(items) > 0:
+                stage.items_out += len(items)
+                self._process(i + 1, items, now)
+        self._flush()
+
+    def _flush(self):
+        for stage in self._stages:
+            if not stage.disabled:
+                self._call(stage, stage.flush)
+
+    def _call(self, stage, method, *args):
+        """Calls a method of a stage and returns what it returns, or None if
+        it raised, in which case the stage is disabled.
+        """
+        try:
+            return method(*args)
+        except Exception as e:
+            self._disable(stage, e)
+            return None
+
+    def _disable(self, stage, error):
+        # An error in one stage mustn't stop the worker thread, which would
+        # drop all of the data that follows.
+        if not stage.disabled:
+            stage.disabled = True
+            console.enqueue('Pipeline stage "{}" disabled by an error: {}: '
+                '{}'.format(stage.name, type(error).__name__, error),
+                console.ERROR)
@@ -0,0 +1,149 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+A window that plots the numbers extracted from the received text by a
+telemetry.Telemetry.
+
+The plot is redrawn by a timer at no more than MAX_FPS and only when there
+are new samples. Each series is decimated to two points per pixel of the
+plot's width before it is drawn, so the cost of a redraw doesn't depend on
+the sample rate.
+
+References
+----------
+* https://matplotlib.org/gallery/user_interfaces/embedding_in_qt_sgskip.html
+
+"""
+
+import re
+import sys
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+from PyQt5 import QtCore, QtWidgets
+
+import telemetry
+
+
+# The most redraws per second.
+MAX_FPS = 20
+
+
+class PlotWidget(QtWidgets.QDialog):
+    def __init__(self, parent=None):
+        super(PlotWidget, self).__init__(parent)
+        self.setWindowTitle('Plot')
+        self.telemetry = telemetry.Telemetry()
+        self._drawnVersion = -1
+        self._lines = []
+
+        # Widgets
+        # -------
+        self.patternLineEdit = QtWidgets.QLineEdit()
+        self.patternLineEdit.setPlaceholderText(
+            'Regular expression, e.g. temp=(?P<temp>[-\\d.]+)')
+        self.patternLineEdit.editingFinished.connect(self._onPatternChanged)
+        self.capacitySpinBox = QtWidgets.QSpinBox()
+        self.capacitySpinBox.setRange(1000, 100000000)
+        self.capacitySpinBox.setSingleStep(100000)
+        self.capacitySpinBox.setValue(self.telemetry.capacity)
+        self.capacitySpinBox.setToolTip('The number of samples kept.')
+        self.capacitySpinBox.editingFinished.connect(self._onCapacityChanged)
+        self.pauseButton = QtWidgets.QPushButton('Pause')
+        self.pauseButton.setCheckable(True)
+        self.clearButton = QtWidgets.QPushButton('Clear')
+        self.clearButton.clicked.connect(self.telemetry.clear)
+        self.samplesLabel = QtWidgets.QLabel()
+
+        self._figure = Figure()
+        self._canvas = FigureCanvasQTAgg(self._figure)
+        self._axes = self._figure.add_subplot(111)
+        self._axes.set_xlabel('Time (s)')
+        self._axes.grid(True)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(1000 // MAX_FPS)
+        self._timer.timeout.connect(self._redraw)
+
+        # Layout
+        # ------
+        controls = QtWidgets.QHBoxLayout()
+        controls.addWidget(self.patternLineEdit, 1)
+        controls.addWidget(QtWidgets.QLabel('Samples:'))
+        controls.addWidget(self.capacitySpinBox)
+        controls.addWidget(self.pauseButton)
+        controls.addWidget(self.clearButton)
+        layout = QtWidgets.QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self._canvas, 1)
+        layout.addWidget(self.samplesLabel)
+        self.setLayout(layout)
+        self.resize(800, 500)
+
+    def showEvent(self, event):
+        self._timer.start()
+        super(PlotWidget, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self._timer.stop()
+        super(PlotWidget, self).hideEvent(event)
+
+    def _onCapacityChanged(self):
+        if self.capacitySpinBox.value() != self.telemetry.capacity:
+            self.telemetry.setCapacity(self.capacitySpinBox.value())
+
+    def _onPatternChanged(self):
+        try:
+            self.telemetry.setPattern(self.patternLineEdit.text())
+        except re.error as e:
+            self.patternLineEdit.setStyleSheet('color: red;')
+            self.patternLineEdit.setToolTip(str(e))
+            return
+        self.patternLineEdit.setStyleSheet('')
+        self.patternLineEdit.setToolTip('')
+
+    def _redraw(self):
+        if self.pauseButton.isChecked() or \
+                self.telemetry.version == self._drawnVersion:
+            return
+        self._drawnVersion = self.telemetry.version
+        times, values, names = self.telemetry.snapshot()
+
+        if [line.get_label() for line in self._lines] != names:
+            for line in self._lines:
+                line.remove()
+            self._lines = [self._axes.plot([], [], label=name)[0]
+                for name in names]
+            if len(names) > 0:
+                self._axes.legend(loc='upper left')
+
+        width = self._canvas.width()
+        for i, line in enumerate(self._lines):
+            line.set_data(*telemetry.decimate(times, values[:, i], width))
+        self._axes.relim()
+        self._axes.autoscale_view()
+        self._canvas.draw_idle()
+        self.samplesLabel.setText('{} samples'.format(len(times)))
+
+
+def show_plot_widget():
+    app = QtWidgets.QApplication(sys.argv)
+    pw = PlotWidget()
+    pw.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == '__main__':
+    show_plot_widget()
@@ -0,0 +1,215 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Finds the serial ports on the system without blocking the GUI thread.
+
+QSerialPortInfo.availablePorts() can take hundreds of milliseconds when
+there are many adapters, so it is run on a worker thread and the result is
+kept in a cache. On Linux "/dev" is watched and only the ports that were
+added or removed are looked up in sysfs, instead of scanning everything
+again.
+
+References
+----------
+* http://doc.qt.io/qt-5/qserialportinfo.html
+* https://www.kernel.org/doc/Documentation/ABI/testing/sysfs-class-tty
+
+"""
+
+import collections
+import os
+import os.path as osp
+import re
+import sys
+import threading
+import time
+
+from PyQt5 import QtCore, QtSerialPort
+
+import console
+
+
+PortInfo = collections.namedtuple('PortInfo', ['name', 'location',
+    'description', 'manufacturer', 'vid', 'pid', 'serial_number'])
+
+# Device names on Linux that come and go when adapters are plugged in.
+_hotplug_names = re.compile(r'^(ttyUSB|ttyACM|rfcomm)\d+$')
+
+
+def portInfoToStr(info):
+    """Makes a string to describe the port, e.g. for a tool tip."""
+    s = info.description or info.name
+    if info.manufacturer:
+        s += ' (' + info.manufacturer + ')'
+    if info.vid is not None and info.pid is not None:
+        s += ' {:04X}:{:04X}'.format(info.vid, info.pid)
+    if info.serial_number:
+        s += ' SN ' + info.serial_number
+    return s
+
+
+def _fromQSerialPortInfo(qinfo):
+    return PortInfo(
+        name=qinfo.portName(),
+        location=qinfo.systemLocation(),
+        description=qinfo.description(),
+        manufacturer=qinfo.manufacturer(),
+        vid=qinfo.vendorIdentifier() if qinfo.hasVendorIdentifier() else None,
+        pid=qinfo.productIdentifier() if qinfo.hasProductIdentifier() else None,
+        serial_number=qinfo.serialNumber())
+
+
+def _readSysfs(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def _fromSysfs(name):
+    """Looks up a Linux tty in sysfs.
+
+    Returns
+    -------
+    A PortInfo or None if the tty doesn't have a device.
+    """
+    device = '/sys/class/tty/{}/device'.format(name)
+    if not osp.exists(device):
+        return None
+    # Walk up from the interface to the USB device that has the IDs.
+    path = osp.realpath(device)
+    while path != '/' and not osp.exists(osp.join(path, 'idVendor')):
+        path = osp.dirname(path)
+    if path == '/':
+        return PortInfo(name, '/dev/' + name, '', '', None, None, '')
+    vid = _readSysfs(osp.join(path, 'idVendor'))
+    pid = _readSysfs(osp.join(path, 'idProduct'))
+    return PortInfo(
+        name=name,
+        location='/dev/' + name,
+        description=_readSysfs(osp.join(path, 'product')),
+        manufacturer=_readSysfs(osp.join(path, 'manufacturer')),
+        vid=int(vid, 16) if vid else None,
+        pid=int(pid, 16) if pid else None,
+        serial_number=_readSysfs(osp.join(path, 'serial')))
+
+
+class PortScanner(QtCore.QObject):
+    """Keeps an inventory of the serial ports on the system.
+
+    Call scan() for a full scan. On Linux the inventory is also updated when
+    a tty is added to or removed from "/dev". portsChanged is emitted on the
+    GUI thread whenever the inventory changes.
+    """
+
+    # Emitted with the list of PortInfo sorted by name.
+    portsChanged = QtCore.pyqtSignal(list)
+
+    # How long to wait for "/dev" to settle after a change. Plugging in an
+    # adapter creates several nodes.
+    hotplug_delay = 250
+
+    def __init__(self, parent=None):
+        super(PortScanner, self).__init__(parent)
+        self._ports = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        # The job to run when the current one is done.
+        self._pending = None
+
+        self._watcher = None
+        self._hotplug_timer = QtCore.QTimer(self)
+        self._hotplug_timer.setSingleShot(True)
+        self._hotplug_timer.timeout.connect(self._onHotplugTimeout)
+        if sys.platform.startswith('linux') and osp.isdir('/dev'):
+            self._watcher = QtCore.QFileSystemWatcher(['/dev'], self)
+            self._watcher.directoryChanged.connect(self._onDevChanged)
+
+    def ports(self):
+        """
+        Returns
+        -------
+        The cached list of PortInfo sorted by name.
+        """
+        with self._lock:
+            return sorted(self._ports.values())
+
+    def scan(self):
+        """Starts a full scan on a worker thread."""
+        self._start(self._fullScan)
+
+    def _start(self, job):
+        with self._lock:
+            if self._worker is not None:
+                # A full scan covers everything a hotplug update would do.
+                if self._pending != self._fullScan:
+                    self._pending = job
+                return
+            self._worker = threading.Thread(target=self._run, args=(job,),
+                name='port scanner', daemon=True)
+            self._worker.start()
+
+    def _run(self, job):
+        while job is not None:
+            try:
+                start = time.perf_counter()
+                changed = job()
+                if job == self._fullScan:
+                    console.enqueue('Port scan took {:.1f} ms.'.format(
+                        (time.perf_counter() - start) * 1000))
+                if changed:
+                    self.portsChanged.emit(self.ports())
+            except Exception as e:
+                console.enqueue('Error scanning serial ports: {}'.format(e), console.ERROR)
+            with self._lock:
+                job = self._pending
+                self._pending = None
+                if job is None:
+                    self._worker = None
+
+    def _fullScan(self):
+        ports = {}
+        for qinfo in QtSerialPort.QSerialPortInfo.availablePorts():
+            info = _fromQSerialPortInfo(qinfo)
+            ports[info.name] = info
+        with self._lock:
+            changed = ports != self._ports
+            self._ports = ports
+        return changed
+
+    def _hotplugScan(self):
+        names = set(n for n in os.listdir('/dev') if _hotplug_names.match(n))
+        with self._lock:
+            known = set(n for n in self._ports if _hotplug_names.match(n))
+        added = {}
+        for name in names - known:
+            info = _fromSysfs(name)
+            if info is not None:
+                added[name] = info
+        removed = known - names
+        if len(added) == 0 and len(removed) == 0:
+            return False
+        with self._lock:
+            for name in removed:
+                self._ports.pop(name, None)
+            self._ports.update(added)
+        return True
+
+    def _onDevChanged(self, path):
+        self._hotplug_timer.start(self.hotplug_delay)
+
+    def _onHotplugTimeout(self):
+        self._start(self._hotplugScan)
@@ -22,6 +22,7 @@ _preferences_manager
 
 """
 
+import collections
 import os
 import re
 
@@ -29,14 +30,28 @@ from PyQt5 import QtCore
 import yaml
 
 import console
+import schema
 
 # Keep in alphabetical order.
 _default_prefs = {
+    'auto_reconnect': True,
+    'console_timeout': 0.0,
     'font_face': 'Operator Mono',
     'font_size': 11,
-    'prompt_on_quit': False
+    'prompt_on_quit': False,
+    'scrollback_lines': 100000
 }
 
+# The type of each preference. Values are converted when the file is
+# loaded, so the users of a preference don't have to.
+_types = {name: type(value) for name, value in _default_prefs.items()}
+
+# The preferences as attributes, e.g. values().font_size.
+Preferences = collections.namedtuple('Preferences', sorted(_default_prefs))
+
+# The LibYAML loader is much faster than the pure Python one.
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class PreferencesManager(QtCore.QObject):
     """
@@ -57,53 +72,125 @@ class PreferencesManager(QtCore.QObject):
     In every widget that you want to have the preferences reload on file change
     you must add a callback to the prefsUpdated signal.
     e.g. preferences.subscribe(self._onPrefsUpdate)
-    Then in your callback you apply the prefrences to your widgets or systems.
+    The callback is given the set of names of the preferences that changed,
+    so it only has to apply those to your widgets or systems.
     e.g.
     ```
-    def _onPrefsUpdate(self):
-        mono_font = QtGui.QFont(preferences.get('font_face'))
-        mono_font.setPointSize(int(preferences.get('font_size')))
-        self.consoleWidget.setFont(mono_font)
-        self.serialConsoleWidget.document().setDefaultFont(mono_font)
+    def _onPrefsUpdate(self, changed):
+        if {'font_face', 'font_size'} & changed:
+            prefs = preferences.values()
+            mono_font = QtGui.QFont(prefs.font_face)
+            mono_font.setPointSize(prefs.font_size)
+            self.consoleWidget.setFont(mono_font)
+            self.serialConsoleWidget.document().setDefaultFont(mono_font)
     ```
 
     The above function takes the new font_face and font_size and applies
     them to the widgets.
+
+    Editors often change the file several times when saving it, so the file
+    is only reloaded once it has been left alone for DEBOUNCE milliseconds,
+    and only parsed if its contents changed.
     """
-    prefsUpdated = QtCore.pyqtSignal()
+
+    # Emitted with the set of names of the preferences that changed.
+    prefsUpdated = QtCore.pyqtSignal(set)
+
+    DEBOUNCE = 200
 
     def __init__(self, default_prefs):
         super(PreferencesManager, self).__init__()
-        self._preferences = default_prefs
+        self._default_prefs = default_prefs
+        self._preferences = dict(default_prefs)
+        self._values = Preferences(**self._preferences)
         self._file_path = None
+        self._contents = None
         self._watcher = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE)
+        self._timer.timeout.connect(self._reload)
 
     def parseFileYaml(self, file_path):
-        # Load the preferences file if it exists.
+        """Parses the preferences file. Preferences missing from the file
+        keep their default value. Unknown preferences, e.g. of another
+        version, are skipped with a warning.
+
+        Returns
+        -------
+        The preferences as a dict, or None if the file hasn't changed since
+        it was last parsed.
+
+        Raises
+        ------
+        yaml.YAMLError
+            If the file isn't valid YAML.
+        ValueError
+            If the preferences don't match preferences_schema.yaml.
+        """
         with open(file_path, encoding='utf-8') as data_file:
             contents = data_file.read()
-            # Remove all comments that start with "//".
-            #contents = re.sub('//.*[\r\n]*', '', contents, 0, re.M)
-            # Remove blank lines.
-            #contents = re.sub('^\s*[\r\n]*', '', contents, 0, re.M)
-            # Parse the file as YAML.
-            self._preferences = yaml.load(contents)
+        if contents == self._contents:
+            return None
+        parsed = yaml.load(contents, Loader=_Loader) or {}
+        errors = schema.validate(parsed, 'preferences_schema.yaml')
+        if len(errors) > 0:
+            raise ValueError('\n'.join(errors))
+        self._contents = contents
+        prefs = dict(self._default_prefs)
+        unknown = []
+        for name, value in parsed.items():
+            if name not in prefs:
+                unknown.append(str(name))
+            # A preference without a value keeps the default.
+            elif value is not None:
+                prefs[name] = self._convert(name, value)
+        if len(unknown) > 0:
+            console.enqueue('Unknown preferences ignored: {}'.format(
+                ', '.join(unknown)), console.WARNING)
+        return prefs
 
     def load(self, file_path):
+        """Loads a preferences file and watches it for changes.
+
+        Returns
+        -------
+        The set of names of the preferences that changed.
+        """
         if self._watcher is None:
             raise Exception('Can\'t load preferences file until a watcher has been set.')
+        if file_path != self._file_path:
+            self._contents = None
         if not os.path.isfile(file_path):
             console.enqueue('Could not find preferences file "{}". Using default preferences.'.format(
-                file_path))
-            return
+                file_path), console.WARNING)
+            return set()
+        changed = set()
         try:
-            self.parseFileYaml(file_path)
-        except TypeError:
+            prefs = self.parseFileYaml(file_path)
+            if prefs is not None:
+                changed = {name for name, value in prefs.items()
+                    if self._preferences.get(name) != value}
+                self._preferences = prefs
+                self._values = Preferences(**{name: prefs[name]
+                    for name in Preferences._fields})
+        except (OSError, ValueError, yaml.YAMLError) as e:
             # If there was a parsing error keep the current settings and
             # post a message to the console.
-            console.enqueue('Error parsing the preferences file.')
-        self._watcher.addPath(file_path)
+            console.enqueue('Error in the preferences file:\n{}'.format(e),
+                console.ERROR)
+        # Editors that save by replacing the file take it out of the watcher.
+        if file_path not in self._watcher.files():
+            self._watcher.addPath(file_path)
         self._file_path = file_path
+        return changed
+
+    def _convert(self, name, value):
+        # The schema has checked the type, but YAML reads 12 as an int where
+        # a float is expected.
+        if _types.get(name) is float:
+            return float(value)
+        return value
 
     def _onFileChanged(self, file_path):
         """
@@ -113,8 +200,12 @@ class PreferencesManager(QtCore.QObject):
         file_path
             The path to the file that was just updated/modified.
         """
-        self.load(self._file_path)
-        self.prefsUpdated.emit()
+        self._timer.start()
+
+    def _reload(self):
+        changed = self.load(self._file_path)
+        if len(changed) > 0:
+            self.prefsUpdated.emit(changed)
 
     def setWatcher(self, watcher):
         self._watcher = watcher
@@ -123,6 +214,9 @@ class PreferencesManager(QtCore.QObject):
     def get(self, pref_name):
         return self._preferences[pref_name]
 
+    def values(self):
+        return self._values
+
 
 _preferences_manager = PreferencesManager(_default_prefs)
 
@@ -134,7 +228,7 @@ def setWatcher(watcher):
 
 def load(file_path):
     global _preferences_manager
-    _preferences_manager.load(file_path)
+    return _preferences_manager.load(file_path)
 
 
 def subscribe(subscriber):
@@ -145,3 +239,14 @@ def subscribe(subscriber):
 def get(pref_name):
     global _preferences_manager
     return _preferences_manager.get(pref_name)
+
+
+def values():
+    """
+    Returns
+    -------
+    The preferences as a Preferences named tuple. It is replaced, not
+    changed, when the file is reloaded.
+    """
+    global _preferences_manager
+    return _preferences_manager.values()
@@ -0,0 +1,428 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Records are the fields parsed out of received lines, e.g. by the records
+stage of the pipeline. They are stored column-wise: a NumPy array per field
+plus a "time" column with the Unix time each record was read. A float64
+field takes 8 bytes per record, a small fraction of the text it came from.
+
+The records can be queried over a time window, exported to CSV or NPY, or
+streamed to CSV or NPY files as they arrive.
+
+References
+----------
+* https://docs.scipy.org/doc/numpy/neps/npy-format.html
+
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+# The types a field can have. "str" is stored as a fixed length string.
+TYPES = ('float32', 'float64', 'int8', 'int16', 'int32', 'int64', 'str',
+    'uint8', 'uint16', 'uint32', 'uint64')
+
+# The most records kept. When there are more the oldest tenth is dropped.
+MAX_RECORDS = 10000000
+
+# Rows written to a file at a time when exporting.
+_EXPORT_CHUNK = 65536
+
+
+def makeDtype(fields, types=None, str_length=16):
+    """Makes the structured dtype of a record, with the time first.
+
+    Parameters
+    ----------
+    fields : list
+        The names of the fields.
+    types : dict
+        The type of each field, from TYPES. The default is float64.
+    str_length : int
+        The number of characters kept of "str" fields.
+
+    Raises
+    ------
+    ValueError
+        If a type is unknown.
+    """
+    types = types or {}
+    descr = [('time', 'float64')]
+    for field in fields:
+        name = types.get(field, 'float64')
+        if name not in TYPES:
+            raise ValueError('Unknown type "{}" for field "{}".'.format(
+                name, field))
+        descr.append((field, 'U{}'.format(str_length) if name == 'str'
+            else name))
+    return np.dtype(descr)
+
+
+def _convert(values, dtype):
+    """Converts a list of strings to an array. Values that can't be
+    converted, or are out of range for an integer field, are NaN for floats
+    and 0 for integers.
+
+    Returns
+    -------
+    The array and the number of values that couldn't be converted.
+    """
+    strings = np.array(values, dtype=str)
+    try:
+        return strings.astype(dtype), 0
+    except (ValueError, OverflowError, TypeError):
+        pass
+    default = np.nan if dtype.kind == 'f' else 0
+    out = np.empty(len(values), dtype=dtype)
+    bad = 0
+    for i, value in enumerate(values):
+        try:
+            out[i] = value
+        except (ValueError, OverflowError, TypeError):
+            out[i] = default
+            bad += 1
+    return out, bad
+
+
+class RecordStore():
+    """The records of one kind. append() is called by the pipeline's worker
+    thread and the queries by the GUI or scripts, so the columns are
+    protected by a lock.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype
+        The structured dtype from makeDtype().
+    max_records : int
+        The most records kept.
+    """
+
+    def __init__(self, dtype, max_records=MAX_RECORDS):
+        self.dtype = dtype
+        self.fields = list(dtype.names)
+        self.max_records = max_records
+        # Values that couldn't be converted and were stored as NaN or 0.
+        self.bad_values = 0
+        self._lock = threading.Lock()
+        self._columns = {f: np.empty(1024, dtype=dtype[f]) for f in self.fields}
+        self._size = 0
+        # Converts the time.monotonic() times of the reads to Unix times.
+        self._time_offset = time.time() - time.monotonic()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamps, rows):
+        """Appends records.
+
+        Parameters
+        ----------
+        timestamps : list
+            The time.monotonic() time each record was read.
+        rows : list
+            A tuple of strings per record, one per field after the time.
+
+        Returns
+        -------
+        The new records as a dict of arrays by field.
+        """
+        if len(rows) > self.max_records:
+            timestamps = timestamps[-self.max_records:]
+            rows = rows[-self.max_records:]
+        block = {'time': np.array(timestamps, dtype=np.float64) +
+            self._time_offset}
+        for i, field in enumerate(self.fields[1:]):
+            block[field], bad = _convert([row[i] for row in rows],
+                self.dtype[field])
+            self.bad_values += bad
+        n = len(rows)
+        with self._lock:
+            if self._size + n > self.max_records:
+                self._drop(self._size + n - self.max_records +
+                    self.max_records // 10)
+            capacity = len(self._columns['time'])
+            if self._size + n > capacity:
+                # Doubled so appends stay amortized O(1).
+                capacity = max(capacity * 2, self._size + n)
+                for field, column in self._columns.items():
+                    grown = np.empty(capacity, dtype=column.dtype)
+                    grown[:self._size] = column[:self._size]
+                    self._columns[field] = grown
+            for field, values in block.items():
+                self._columns[field][self._size:self._size + n] = values
+            self._size += n
+        return block
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+
+    def column(self, field, start=None, end=None, last=None):
+        """
+        Returns
+        -------
+        A copy of a column over a time window. See window().
+        """
+        with self._lock:
+            first, stop = self._window(start, end, last)
+            return self._columns[field][first:stop].copy()
+
+    def window(self, start=None, end=None, last=None):
+        """Gets the records in a time window.
+
+        Parameters
+        ----------
+        start : float
+            The Unix time of the first record. None for the oldest.
+        end : float
+            The Unix time after the last record. None for the newest.
+        last : float
+            If given, the window is the last "last" seconds.
+
+        Returns
+        -------
+        A structured array of the records.
+        """
+        with self._lock:
+            first, stop = self._window(start, end, last)
+            out = np.empty(stop - first, dtype=self.dtype)
+            for field in self.fields:
+                out[field] = self._columns[field][first:stop]
+            return out
+
+    def stats(self, field, start=None, end=None, last=None):
+        """Summarizes a numeric field over a time window. See window().
+
+        Returns
+        -------
+        A dict with the "count", "min", "max" and "mean". The minimum etc.
+        are None when there are no records.
+        """
+        with self._lock:
+            first, stop = self._window(start, end, last)
+            values = self._columns[field][first:stop]
+            if len(values) == 0:
+                return {'count': 0, 'min': None, 'max': None, 'mean': None}
+            return {'count': len(values), 'min': values.min().item(),
+                'max': values.max().item(), 'mean': values.mean().item()}
+
+    def exportCsv(self, path):
+        """Writes the records to a CSV file."""
+        with CsvWriter(path, self.dtype) as writer:
+            self._export(writer)
+
+    def exportNpy(self, path):
+        """Writes the records to an NPY file as a structured array."""
+        with NpyWriter(path, self.dtype) as writer:
+            self._export(writer)
+
+    def _export(self, writer):
+        # Written in chunks so the lock isn't held for the whole export.
+        start = 0
+        while True:
+            with self._lock:
+                stop = min(start + _EXPORT_CHUNK, self._size)
+                if stop <= start:
+                    return
+                block = {f: self._columns[f][start:stop].copy()
+                    for f in self.fields}
+            writer.write(block)
+            start = stop
+
+    def _window(self, start, end, last):
+        times = self._columns['time'][:self._size]
+        if last is not None:
+            start = time.time() - last
+        first = 0 if start is None else int(np.searchsorted(times, start))
+        stop = self._size if end is None else int(np.searchsorted(times, end))
+        return first, stop
+
+    def _drop(self, n):
+        n = min(n, self._size)
+        for column in self._columns.values():
+            column[:self._size - n] = column[n:self._size]
+        self._size -= n
+
+
+class CsvWriter():
+    """Streams records to a CSV file with a header row.
+
+    Parameters
+    ----------
+    path : str
+        The file.
+    dtype : numpy.dtype
+        The structured dtype of the records.
+    append : bool
+        If true the records are added to the end of an existing file instead
+        of replacing it, e.g. so recording goes on when the pipeline is
+        rebuilt.
+
+    Raises
+    ------
+    ValueError
+        If the file is appended to and its header has other fields.
+    """
+
+    def __init__(self, path, dtype, append=False):
+        self._dtype = dtype
+        header = ','.join(dtype.names)
+        self._file = open(path, 'a' if append else 'w', newline='',
+            encoding='utf-8')
+        if self._file.tell() == 0:
+            self._file.write(header + '\n')
+        else:
+            with open(path, encoding='utf-8') as f:
+                existing = f.readline().rstrip('\r\n')
+            if existing != header:
+                self._file.close()
+                raise ValueError('{} has the fields "{}" instead of "{}".'
+                    .format(path, existing, header))
+        self._formats = []
+        for name in dtype.names:
+            kind = dtype[name].kind
+            self._formats.append('%.17g' if kind == 'f' else
+                '%d' if kind in 'iu' else '%s')
+
+    def write(self, block):
+        n = len(block['time'])
+        if n == 0:
+            return
+        rows = np.empty(n, dtype=self._dtype)
+        for name in self._dtype.names:
+            rows[name] = block[name]
+        np.savetxt(self._file, rows, fmt=self._formats, delimiter=',')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class NpyWriter():
+    """Streams records to an NPY file as a one dimensional structured array.
+    The header has room for any length, so it is rewritten with the number
+    of records written so far on every flush and the file can be loaded
+    with numpy.load() while it is being written.
+
+    Parameters
+    ----------
+    path : str
+        The file.
+    dtype : numpy.dtype
+        The structured dtype of the records.
+    append : bool
+        If true the records are added to an existing file written by an
+        NpyWriter instead of replacing it.
+
+    Raises
+    ------
+    ValueError
+        If the file is appended to and it has other fields or wasn't
+        written by an NpyWriter.
+    """
+
+    # The size of the header including the magic string. A multiple of 64.
+    HEADER_SIZE = 1024
+
+    def __init__(self, path, dtype, append=False):
+        self._dtype = dtype
+        self._count = 0
+        self._file = None
+        if append:
+            try:
+                self._file = open(path, 'r+b')
+            except FileNotFoundError:
+                pass
+        if self._file is None:
+            self._file = open(path, 'wb')
+        size = self._file.seek(0, 2)
+        if size > 0:
+            try:
+                self._count = self._readHeader(path, size)
+            except ValueError:
+                self._file.close()
+                raise
+        self._writeHeader()
+
+    def write(self, block):
+        n = len(block['time'])
+        if n == 0:
+            return
+        rows = np.empty(n, dtype=self._dtype)
+        for name in self._dtype.names:
+            rows[name] = block[name]
+        self._file.write(rows.tobytes())
+        self._count += n
+
+    def flush(self):
+        self._writeHeader()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def _readHeader(self, path, size):
+        """Checks the header of an existing file and returns the number of
+        whole records in it. A record cut short, e.g. by a crash, is
+        removed.
+        """
+        self._file.seek(0)
+        try:
+            if np.lib.format.read_magic(self._file) != (1, 0):
+                raise ValueError('The version is not 1.0.')
+            shape, fortran_order, dtype = \
+                np.lib.format.read_array_header_1_0(self._file)
+        except ValueError as e:
+            raise ValueError('{} is not an NPY file: {}'.format(path, e))
+        if self._file.tell() != self.HEADER_SIZE or dtype != self._dtype:
+            raise ValueError('{} has other fields or was not written by '
+                'Super Serial.'.format(path))
+        # The header is only updated on a flush, so the size is trusted.
+        count = (size - self.HEADER_SIZE) // self._dtype.itemsize
+        self._file.truncate(self.HEADER_SIZE + count * self._dtype.itemsize)
+        self._file.seek(0, 2)
+        return count
+
+    def _writeHeader(self):
+        header = "{{'descr': {}, 'fortran_order': False, 'shape': ({},), }}".format(
+            repr(np.lib.format.dtype_to_descr(self._dtype)), self._count)
+        # Magic, version 1.0 and the 2 byte header length come first.
+        header = header.ljust(self.HEADER_SIZE - 10 - 1) + '\n'
+        if len(header) + 10 > self.HEADER_SIZE:
+            raise ValueError('Too many fields for the NPY header.')
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00' +
+            len(header).to_bytes(2, 'little') + header.encode('latin-1'))
+        if position > 0:
+            self._file.seek(position)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,244 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Runs a test script against many ports at once, without the GUI, e.g. to
+test a rack of boards:
+
+    python runner.py test_board.py "board 1" "board 2" --out results
+
+The ports are connections from the connections file, all of them if none
+are named. The script defines a function
+
+    def run(session, log):
+        session.sendline('selftest')
+        if session.expect(['PASS', 'FAIL']) != 0:
+            raise AssertionError('Self test failed.')
+
+that is called with a scripting.Session on the port and a logging.Logger.
+The port passes if run() returns and fails if it raises.
+
+Each port is run in a process of its own. The sessions wait in blocking
+calls and match received data in Python, so processes rather than threads
+or coroutines keep one port's traffic from slowing the others, and a port
+that crashes its process doesn't take the rest with it.
+
+The output directory gets, per port, a log and a transcript of the data
+sent and received, and report.json with the result and timing of every
+port.
+
+"""
+
+import argparse
+import concurrent.futures
+from datetime import datetime
+import json
+import logging
+import multiprocessing
+import os
+import os.path as osp
+import runpy
+import sys
+import time
+import traceback
+
+import console
+import scripting
+import serial
+
+
+def loadConnections(path, names=None):
+    """Loads connections from a connections file.
+
+    Parameters
+    ----------
+    path : str
+        The connections file.
+    names : list
+        The names of the connections to load. All of them if None or empty.
+
+    Returns
+    -------
+    The connections as a list of dicts in the order of "names".
+
+    Raises
+    ------
+    ValueError
+        If the file isn't valid, has no connections or a name isn't in it.
+    """
+    if not osp.isfile(path):
+        raise ValueError('The connections file {} does not exist.'.format(path))
+    connections = serial.SerialConnections.load(path)
+    if connections is None or not serial.SerialConnections.check(connections):
+        raise ValueError('The connections file {} is not valid.'.format(path))
+    if len(connections) == 0:
+        raise ValueError('The connections file {} has no connections.'.format(
+            path))
+    by_name = {c['name']: c for c in connections}
+    if not names:
+        return connections
+    missing = [name for name in names if name not in by_name]
+    if len(missing) > 0:
+        raise ValueError('No connections named: {}'.format(', '.join(missing)))
+    return [by_name[name] for name in names]
+
+
+def _fileName(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def runPort(script, connection, out_dir, timeout=10.0):
+    """Runs a script against one port. This is run in a worker process.
+
+    Returns
+    -------
+    The result of the port as a dict.
+    """
+    name = connection['name']
+    base = osp.join(out_dir, _fileName(name))
+    result = {
+        'name': name,
+        'port': connection['port'],
+        'passed': False,
+        'error': None,
+        'traceback': None,
+        'start': datetime.now().isoformat(),
+        'seconds': None,
+        'log': base + '.log',
+        'transcript': base + '.bin',
+    }
+
+    handler = logging.FileHandler(result['log'], encoding='utf-8')
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s %(message)s'))
+    log = logging.getLogger('runner.' + name)
+    log.setLevel(logging.DEBUG)
+    log.addHandler(handler)
+    # The messages of the port itself, e.g. that it was opened.
+    console.logger.addHandler(handler)
+
+    start = time.monotonic()
+    try:
+        run = runpy.run_path(script)['run']
+        config = {k: v for k, v in connection.items() if k != 'name'}
+        with scripting.open_port(timeout=timeout, **config) as session, \
+                open(result['transcript'], 'wb') as transcript:
+            session.logfile = transcript
+            run(session, log)
+        result['passed'] = True
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+        log.error(result['traceback'])
+    result['seconds'] = time.monotonic() - start
+    log.info('Passed.' if result['passed'] else 'Failed.')
+
+    console.logger.removeHandler(handler)
+    log.removeHandler(handler)
+    handler.close()
+    return result
+
+
+def run(script, connections, out_dir, jobs=None, timeout=10.0):
+    """Runs a script against the ports concurrently and writes the report.
+
+    Parameters
+    ----------
+    script : str
+        The path of the test script.
+    connections : list
+        The connections from loadConnections().
+    out_dir : str
+        The directory the logs and report are written to.
+    jobs : int
+        The most ports run at once. All of them if None.
+    timeout : float
+        The default number of seconds the sessions wait.
+
+    Returns
+    -------
+    The report as a dict.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    script = osp.abspath(script)
+    report = {
+        'script': script,
+        'start': datetime.now().isoformat(),
+        'seconds': None,
+        'passed': 0,
+        'failed': 0,
+        'ports': [],
+    }
+    start = time.monotonic()
+    # Qt isn't safe to fork, so the workers are started fresh.
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs or max(1, len(connections)),
+            mp_context=context) as executor:
+        futures = {executor.submit(runPort, script, c, out_dir, timeout): c
+            for c in connections}
+        for future in concurrent.futures.as_completed(futures):
+            connection = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process died.
+                result = {'name': connection['name'],
+                    'port': connection['port'], 'passed': False,
+                    'error': '{}: {}'.format(type(e).__name__, e)}
+            report['ports'].append(result)
+            print('{} {} ({}) {}'.format('PASS' if result['passed'] else 'FAIL',
+                result['name'], result['port'], result['error'] or
+                '{:.1f} s'.format(result['seconds'])))
+    # In the order the ports were given.
+    order = [c['name'] for c in connections]
+    report['ports'].sort(key=lambda r: order.index(r['name']))
+    report['passed'] = sum(1 for r in report['ports'] if r['passed'])
+    report['failed'] = len(report['ports']) - report['passed']
+    report['seconds'] = time.monotonic() - start
+    with open(osp.join(out_dir, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runs a test script against many ports at once.')
+    parser.add_argument('script', help='The test script. It defines run(session, log).')
+    parser.add_argument('names', nargs='*', help='Names of the connections to test. All of them by default.')
+    parser.add_argument('--connections', dest='connections_file', default='connections.yaml', help='The connections file. Default \'connections.yaml\'')
+    parser.add_argument('--jobs', type=int, dest='jobs', help='The most ports tested at once. Default all of them')
+    parser.add_argument('--out', dest='out_dir', help='Directory for the logs and report. Default \'runs/<date and time>\'')
+    parser.add_argument('--timeout', type=float, dest='timeout', default=10.0, help='Default seconds a script waits for data. Default 10')
+
+    args = parser.parse_args()
+
+    try:
+        connections = loadConnections(args.connections_file, args.names)
+    except ValueError as e:
+        print(e)
+        return 2
+    out_dir = args.out_dir
+    if out_dir is None:
+        out_dir = osp.join('runs', '{:%Y%m%d-%H%M%S}'.format(datetime.now()))
+
+    report = run(args.script, connections, out_dir, args.jobs, args.timeout)
+    print('{} passed, {} failed in {:.1f} s. Report: {}'.format(
+        report['passed'], report['failed'], report['seconds'],
+        osp.join(out_dir, 'report.json')))
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
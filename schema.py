@@ -0,0 +1,211 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Validates data against the kwalify schemas next to this file, e.g.
+connections_schema.yaml.
+
+A schema is loaded once and compiled into a tree of functions, one per rule,
+so validating only runs the checks the schema asks for. The part of kwalify
+used by the schemas is supported: the types, "mapping", "sequence",
+"required", "enum", "range", "pattern" and "allowempty". Compiling a schema
+that uses anything else raises an error rather than ignoring it.
+
+Errors name the path of the value, e.g. "/0/baud", as pykwalify does.
+
+References
+----------
+* http://www.kuwata-lab.com/kwalify/ruby/users-guide.01.html
+* http://pykwalify.readthedocs.io/en/master/validation-rules.html
+
+"""
+
+import functools
+import os.path as osp
+import re
+
+import yaml
+
+
+# Where the schema files are.
+SCHEMA_DIR = osp.dirname(osp.abspath(__file__))
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _isInt(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+_type_checks = {
+    'any': lambda value: True,
+    'bool': lambda value: isinstance(value, bool),
+    'float': _isNumber,
+    'int': _isInt,
+    'map': lambda value: isinstance(value, dict),
+    'number': _isNumber,
+    'seq': lambda value: isinstance(value, list),
+    'str': lambda value: isinstance(value, str),
+    'text': lambda value: isinstance(value, str) or _isNumber(value),
+}
+
+_rule_keys = {'allowempty', 'enum', 'mapping', 'pattern', 'range', 'required',
+    'sequence', 'type'}
+
+
+def _pathToStr(path):
+    return '/' + '/'.join(str(key) for key in path)
+
+
+def compileRule(rule, where='/'):
+    """Compiles a schema rule into a function.
+
+    Parameters
+    ----------
+    rule : dict
+        The rule, e.g. a whole schema.
+    where : str
+        The path of the rule in the schema, for errors.
+
+    Returns
+    -------
+    A function check(value, path, errors) that appends an error string to the
+    list "errors" for everything wrong with "value". "path" is a tuple of
+    the keys of the value.
+
+    Raises
+    ------
+    ValueError
+        If the rule isn't valid or isn't supported.
+    """
+    unknown = set(rule) - _rule_keys
+    if len(unknown) > 0:
+        raise ValueError('Unsupported schema keys at {}: {}'.format(where,
+            ', '.join(sorted(unknown))))
+    type_name = rule.get('type', 'str')
+    if type_name not in _type_checks:
+        raise ValueError('Unsupported type at {}: {}'.format(where, type_name))
+    type_check = _type_checks[type_name]
+    checks = []
+
+    if 'enum' in rule:
+        enum = list(rule['enum'])
+
+        def checkEnum(value, path, errors):
+            if value not in enum:
+                errors.append('{}: {!r} is not one of {}.'.format(
+                    _pathToStr(path), value, enum))
+        checks.append(checkEnum)
+
+    if 'range' in rule:
+        low = rule['range'].get('min')
+        high = rule['range'].get('max')
+
+        def checkRange(value, path, errors):
+            size = value if _isNumber(value) else len(value)
+            if low is not None and size < low:
+                errors.append('{}: {!r} is less than the minimum, {}.'.format(
+                    _pathToStr(path), value, low))
+            elif high is not None and size > high:
+                errors.append('{}: {!r} is more than the maximum, {}.'.format(
+                    _pathToStr(path), value, high))
+        checks.append(checkRange)
+
+    if 'pattern' in rule:
+        regex = re.compile(rule['pattern'])
+
+        def checkPattern(value, path, errors):
+            if regex.search(str(value)) is None:
+                errors.append('{}: {!r} does not match {!r}.'.format(
+                    _pathToStr(path), value, rule['pattern']))
+        checks.append(checkPattern)
+
+    if 'mapping' in rule:
+        mapping = {key: compileRule(child, '{}mapping/{}/'.format(where, key))
+            for key, child in rule['mapping'].items()}
+        required = [key for key, child in rule['mapping'].items()
+            if child.get('required', False)]
+        allow_other = rule.get('allowempty', False)
+
+        def checkMapping(value, path, errors):
+            for key in required:
+                if value.get(key) is None:
+                    errors.append('{}: The key "{}" is required.'.format(
+                        _pathToStr(path), key))
+            for key, item in value.items():
+                check = mapping.get(key)
+                if check is not None:
+                    check(item, path + (key,), errors)
+                elif not allow_other:
+                    errors.append('{}: The key "{}" is not allowed.'.format(
+                        _pathToStr(path), key))
+        checks.append(checkMapping)
+
+    if 'sequence' in rule:
+        check_item = compileRule(rule['sequence'][0], where + 'sequence/0/')
+
+        def checkSequence(value, path, errors):
+            for i, item in enumerate(value):
+                check_item(item, path + (i,), errors)
+        checks.append(checkSequence)
+
+    def check(value, path, errors):
+        # Missing and null values are allowed unless required, which is
+        # checked by the mapping.
+        if value is None:
+            return
+        if not type_check(value):
+            errors.append('{}: {!r} is not a {}.'.format(_pathToStr(path),
+                value, type_name))
+            return
+        for c in checks:
+            c(value, path, errors)
+    return check
+
+
+@functools.lru_cache(maxsize=None)
+def validator(schema_file):
+    """Loads and compiles a schema file in SCHEMA_DIR, once.
+
+    Returns
+    -------
+    A function that takes the data and returns a list of errors, empty if
+    the data is valid.
+    """
+    with open(osp.join(SCHEMA_DIR, schema_file), encoding='utf-8') as f:
+        rule = yaml.load(f, Loader=_Loader)
+    check = compileRule(rule)
+
+    def validate(data):
+        errors = []
+        if data is None:
+            errors.append('/: There is no data.')
+        else:
+            check(data, (), errors)
+        return errors
+    return validate
+
+
+def validate(data, schema_file):
+    """Validates data against a schema file in SCHEMA_DIR.
+
+    Returns
+    -------
+    A list of error strings. Empty if the data is valid.
+    """
+    return validator(schema_file)(data)
@@ -0,0 +1,454 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Automates a device with send and expect, e.g. for test scripts.
+
+In the application console a session on the connected port is available as
+"session". It keeps what was received since the console was shown or the
+connection was made, so start with clear() to only match what follows:
+
+    >>> session.clear()
+    >>> session.sendline('version')
+    >>> session.expect(r'v(\\d+)\\.(\\d+)')
+    0
+    >>> session.match.groups()
+    (b'1', b'4')
+
+A standalone script opens a port of its own:
+
+    import scripting
+
+    with scripting.open_port('/dev/ttyUSB0', 115200) as session:
+        session.sendline('AT')
+        session.expect(['OK', 'ERROR'], timeout=2)
+
+and can read lines with asyncio:
+
+    async for line in session:
+        print(line)
+
+Received data is kept in a buffer until it is consumed by a match. Each wait
+only searches the data that arrived since it last searched, plus the last
+"search_window" bytes before it so that matches split across reads are
+found. A match up to "search_window" bytes long is always found, and a wait
+costs time in proportion to the new data however much is buffered.
+
+References
+----------
+* https://pexpect.readthedocs.io/en/stable/api/pexpect.html#spawn-class
+
+"""
+
+import asyncio
+import re
+import threading
+import time
+
+from PyQt5 import QtCore
+
+import serial
+
+
+# The most bytes kept waiting to be matched. Older data is dropped.
+MAX_BUFFER = 1024 * 1024
+
+# Seconds between reads of the port by lines() when nothing else reads it.
+POLL_INTERVAL = 0.01
+
+# The application made by open_port() when a script doesn't have one.
+_app = None
+
+
+def _wake(waiters):
+    """Sets the asyncio events of lines() from another thread."""
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The loop was closed.
+            pass
+
+
+class _PortLink(QtCore.QObject):
+    """Connects a session to a port. It lives in the port's thread so the
+    data is received and the writes are made there.
+    """
+
+    _writeRequested = QtCore.pyqtSignal(bytes)
+
+    def __init__(self, serial_port, session):
+        super(_PortLink, self).__init__()
+        self._serial_port = serial_port
+        self._session = session
+        self.moveToThread(serial_port.thread())
+        self._writeRequested.connect(self._onWriteRequested)
+        serial_port.dataReceived.connect(self._onDataReceived)
+
+    def write(self, data):
+        if QtCore.QThread.currentThread() == self._serial_port.thread():
+            self._serial_port.write(data)
+            # There may not be an event loop to write it.
+            self._serial_port.waitForBytesWritten(1000)
+        else:
+            self._writeRequested.emit(data)
+
+    def detach(self):
+        self._serial_port.dataReceived.disconnect(self._onDataReceived)
+
+    def _onDataReceived(self, data, timestamp):
+        self._session.feed(data)
+
+    def _onWriteRequested(self, data):
+        if self._serial_port.is_connected:
+            self._serial_port.write(data)
+
+
+class Session():
+    """Sends to and expects data from a serial port. The methods can be
+    called from any thread. When called from the port's thread the waits
+    read the port themselves, so no event loop is needed.
+
+    The data is bytes. Strings are encoded with "encoding" and lines are
+    decoded with it.
+
+    Parameters
+    ----------
+    serial_port : serial.SerialPort
+        The port.
+    timeout : float
+        The default number of seconds to wait. None to wait forever.
+    encoding : str
+        The encoding of strings and lines.
+    newline : str
+        What sendline() appends.
+    """
+
+    def __init__(self, serial_port, timeout=10.0, encoding='utf-8',
+            newline='\r\n'):
+        # A port from the console is wrapped in a GuiProxy.
+        self._serial_port = getattr(serial_port, 'unwrapped', serial_port)
+        self.timeout = timeout
+        self.encoding = encoding
+        self.newline = newline
+        self.search_window = 4096
+        self.max_buffer = MAX_BUFFER
+        # The last expect() match and the data before it.
+        self.match = None
+        self.before = b''
+        # Bytes dropped because the buffer was full.
+        self.dropped = 0
+        # A binary file the received and sent data is written to.
+        self.logfile = None
+        self._condition = threading.Condition()
+        self._buffer = bytearray()
+        # The position in the stream of the start of the buffer.
+        self._base = 0
+        self._closed = False
+        self._owns_port = False
+        # (loop, asyncio.Event) pairs set when data arrives.
+        self._waiters = []
+        self._link = _PortLink(self._serial_port, self)
+
+    def feed(self, data):
+        """Adds received data. Called by the port's thread."""
+        if self.logfile is not None:
+            self.logfile.write(data)
+        with self._condition:
+            self._buffer += data
+            excess = len(self._buffer) - self.max_buffer
+            if excess > 0:
+                del self._buffer[:excess]
+                self._base += excess
+                self.dropped += excess
+            waiters = self._waiters
+            self._waiters = []
+            self._condition.notify_all()
+        _wake(waiters)
+
+    def send(self, data):
+        """Writes bytes or a string to the port.
+
+        Raises
+        ------
+        OSError
+            If the port isn't open.
+        """
+        if self._closed or not self._serial_port.is_connected:
+            raise OSError('Port {} is not open.'.format(
+                self._serial_port.portName()))
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        if self.logfile is not None:
+            self.logfile.write(data)
+        self._link.write(bytes(data))
+
+    def sendline(self, line=''):
+        self.send(line + self.newline)
+
+    def expect(self, patterns, timeout=None):
+        """Waits for data that matches one of the regular expressions. The
+        data up to the end of the match is consumed.
+
+        Parameters
+        ----------
+        patterns : str, bytes or list
+            A pattern or a list of them. The first that matches earliest in
+            the data wins.
+        timeout : float
+            Seconds to wait. The session's timeout if None.
+
+        Returns
+        -------
+        The index of the pattern that matched. The match is in "match" and
+        the data before it in "before".
+
+        Raises
+        ------
+        TimeoutError
+            If nothing matched in time.
+        EOFError
+            If the session was closed.
+        re.error
+            If a pattern isn't a valid regular expression.
+        """
+        if isinstance(patterns, (str, bytes)):
+            patterns = [patterns]
+        regexes = [re.compile(p.encode(self.encoding) if isinstance(p, str)
+            else p) for p in patterns]
+
+        def find(pos):
+            best = None
+            for index, regex in enumerate(regexes):
+                m = regex.search(self._buffer, pos)
+                if m is not None and (best is None or m.start() < best[1].start()):
+                    best = (index, m)
+            if best is None:
+                return None
+            index, m = best
+            # The match has to outlive the buffer, so it's made again on a
+            # copy. Only the data up to the match and a window after it,
+            # for lookaheads, is copied rather than the whole buffer.
+            regex = regexes[index]
+            end = min(len(self._buffer), m.end() + self.search_window)
+            data = self._copy(end)
+            match = regex.search(data, m.start())
+            if match is None or match.span() != m.span():
+                # A lookahead past the window.
+                data = self._copy(len(self._buffer))
+                match = regex.search(data, m.start())
+            self.match = match
+            self.before = data[:m.start()]
+            self._consume(m.end())
+            return index
+
+        return self._wait(find, self.search_window, timeout, patterns)
+
+    def read_until(self, delimiter=b'\n', timeout=None):
+        """Waits for a delimiter and consumes the data up to and including
+        it.
+
+        Returns
+        -------
+        The bytes including the delimiter.
+
+        Raises
+        ------
+        TimeoutError
+            If the delimiter wasn't received in time.
+        EOFError
+            If the session was closed.
+        """
+        if isinstance(delimiter, str):
+            delimiter = delimiter.encode(self.encoding)
+
+        def find(pos):
+            return self._takeUntil(delimiter, pos)
+
+        return self._wait(find, len(delimiter) - 1, timeout, delimiter)
+
+    def readline(self, timeout=None):
+        """
+        Returns
+        -------
+        The next line as a string without the line ending.
+        """
+        return self._decodeLine(self.read_until(b'\n', timeout))
+
+    def clear(self):
+        """Discards the data that hasn't been consumed."""
+        with self._condition:
+            self._consume(len(self._buffer))
+
+    def close(self):
+        """Stops receiving. The port is closed if open_port() opened it.
+        Waits in progress raise EOFError.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            waiters = self._waiters
+            self._waiters = []
+            self._condition.notify_all()
+        _wake(waiters)
+        self._link.detach()
+        if self._owns_port and self._serial_port.isOpen():
+            self._serial_port.close()
+
+    async def lines(self):
+        """Yields the received lines as strings without the line endings
+        until the session is closed. Waiting doesn't block the event loop.
+        """
+        loop = asyncio.get_event_loop()
+        read_port = QtCore.QThread.currentThread() == self._serial_port.thread()
+        scanned = self._base
+        while True:
+            event = asyncio.Event()
+            with self._condition:
+                pos = max(0, scanned - self._base)
+                line = self._takeUntil(b'\n', pos)
+                if line is None:
+                    if self._closed:
+                        return
+                    scanned = self._base + len(self._buffer)
+                    if not read_port:
+                        self._waiters.append((loop, event))
+            if line is not None:
+                scanned = self._base
+                yield self._decodeLine(line)
+                continue
+            if read_port:
+                # Nothing else reads the port, so it's polled.
+                if not self._serial_port.waitForReadyRead(0):
+                    await asyncio.sleep(POLL_INTERVAL)
+                continue
+            try:
+                await event.wait()
+            finally:
+                with self._condition:
+                    if (loop, event) in self._waiters:
+                        self._waiters.remove((loop, event))
+
+    def __aiter__(self):
+        return self.lines()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _wait(self, find, overlap, timeout, what):
+        """Calls find(pos) on the new data until it returns something other
+        than None. Data before "pos" has been searched already, except for
+        the last "overlap" bytes.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Without an event loop in the port's thread nothing is received
+        # unless the port is read here.
+        read_port = QtCore.QThread.currentThread() == self._serial_port.thread()
+        # The position in the stream searched up to.
+        scanned = self._base
+        while True:
+            with self._condition:
+                pos = max(0, scanned - self._base - overlap)
+                result = find(pos)
+                if result is not None:
+                    return result
+                if self._closed:
+                    raise EOFError('The session is closed.')
+                scanned = self._base + len(self._buffer)
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError('Timed out after {:g} seconds '
+                            'waiting for {!r}.'.format(timeout, what))
+                if not read_port:
+                    self._condition.wait(remaining)
+                    continue
+            wait = 100 if remaining is None else max(1, int(remaining * 1000))
+            self._serial_port.waitForReadyRead(min(wait, 100))
+
+    def _takeUntil(self, delimiter, pos):
+        # Called with the lock held.
+        index = self._buffer.find(delimiter, pos)
+        if index < 0:
+            return None
+        end = index + len(delimiter)
+        data = self._copy(end)
+        self._consume(end)
+        return data
+
+    def _copy(self, end):
+        # The view has to be released before the buffer can be resized.
+        with memoryview(self._buffer) as view, view[:end] as head:
+            return bytes(head)
+
+    def _consume(self, n):
+        # Deleting from the front of a bytearray doesn't move the rest.
+        del self._buffer[:n]
+        self._base += n
+
+    def _decodeLine(self, line):
+        return line.decode(self.encoding, 'replace').rstrip('\r\n')
+
+
+def open_port(port, baud=115200, data_bits=8, parity='none',
+        stop_bits=1, flow_control='none', timeout=10.0, **options):
+    """Opens a port for a standalone script. The session is read by the
+    thread that opened it, which has to be the main thread or a QThread.
+
+    Parameters
+    ----------
+    port : str
+        The name of the port, e.g. "COM4" or "/dev/ttyUSB0".
+    options
+        Other settings of a connection, e.g. "low_latency", and the
+        Session's "encoding" and "newline".
+
+    Returns
+    -------
+    A Session. Closing it closes the port.
+
+    Raises
+    ------
+    ValueError
+        If the configuration isn't valid.
+    OSError
+        If the port couldn't be opened.
+    """
+    session_options = {k: options.pop(k) for k in ('encoding', 'newline')
+        if k in options}
+    config = {'port': port, 'baud': baud, 'data_bits': data_bits,
+        'parity': parity, 'stop_bits': stop_bits,
+        'flow_control': flow_control}
+    config.update(options)
+    if QtCore.QCoreApplication.instance() is None:
+        # Qt needs an application for the port's notifiers. It's kept in
+        # the module so it isn't deleted.
+        global _app
+        _app = QtCore.QCoreApplication([])
+    serial_port = serial.SerialPort()
+    if not serial_port.setConfig(config):
+        raise ValueError(serial_port.get_config_error())
+    if serial_port.open() != 0:
+        raise OSError('Could not open {}: {}'.format(port,
+            serial_port.errorString()))
+    session = Session(serial_port, timeout, **session_options)
+    session._owns_port = True
+    return session
@@ -14,19 +14,254 @@ Copyright 2017-2018 Justin Watson
    limitations under the License.
 """
 
+import collections
+import concurrent.futures
+import copy
 from datetime import datetime
 import os
 import os.path as osp
 import queue
 import re
+import stat
+import struct
+import sys
+import tempfile
 import threading
 import time
 
-import pykwalify.core, pykwalify.errors
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # Not available on Windows.
+    fcntl = None
+    termios = None
+
 from PyQt5 import QtCore, QtSerialPort
 import yaml
 
 import console
+import schema
+
+# The LibYAML loader and dumper are much faster than the pure Python ones.
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# The standard rates followed by the high speed rates. Any rate the port
+# supports can be used, these are the ones offered in the UI and the
+# candidates for detecting the baud.
+BAUD_RATES = [1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400,
+    460800, 921600, 1000000, 1500000, 2000000, 3000000]
+
+# The order the rates are tried in when detecting the baud, the common ones
+# first. The slow rates are listened to for longest, so they are last.
+DETECT_ORDER = [115200, 9600, 57600, 38400, 19200, 230400, 460800, 921600,
+    1000000, 1500000, 2000000, 3000000, 4800, 2400, 1200]
+
+# The range of rates that can be entered and saved. Keep in step with the
+# range of "baud" in connections_schema.yaml.
+MIN_BAUD = 50
+MAX_BAUD = 20000000
+
+# The bytes of text. Tab, line feed and carriage return plus the printable
+# ASCII characters.
+_text_bytes = bytes([9, 10, 13]) + bytes(range(0x20, 0x7f))
+
+
+def scoreBaudSample(data):
+    """Scores how likely it is that the data was received at the right baud.
+
+    Data received at the wrong rate is mostly bytes that aren't printable.
+    Framing and parity errors would tell more, but QSerialPort in Qt 5 no
+    longer reports them.
+
+    Parameters
+    ----------
+    data : bytes
+        The data received at the rate.
+
+    Returns
+    -------
+    A score from 0 to 1, the share of the bytes that are text.
+    """
+    if len(data) == 0:
+        return 0.0
+    # translate() deletes the text bytes, leaving the ones that aren't.
+    not_text = len(data.translate(None, _text_bytes))
+    return (len(data) - not_text) / len(data)
+
+
+# From linux/serial.h and asm-generic/ioctls.h.
+TIOCGSERIAL = 0x541E
+TIOCSSERIAL = 0x541F
+ASYNC_LOW_LATENCY = 1 << 13
+# struct serial_struct is 72 bytes on 64 bit systems and the flags are the
+# fifth int.
+_serial_struct_size = 72
+_serial_struct_flags = 16
+
+# The Qt read buffer size used in low latency mode. Data is handed on as
+# soon as it is read, so the buffer only has to cover a stalled GUI.
+LOW_LATENCY_READ_BUFFER = 64 * 1024
+
+
+def setLowLatency(serial_port, latency_timer=1):
+    """Configures an open port on Linux for the lowest latency.
+
+    * Sets ASYNC_LOW_LATENCY on the tty so the driver pushes received data
+      to the reader without deferring it.
+    * Sets termios VMIN and VTIME to 0 so a read returns whatever is
+      available without waiting for more.
+    * Bounds the Qt read buffer.
+    * Sets the FTDI latency_timer, which is 16 ms by default, if the port is
+      an FTDI adapter and the file can be written.
+
+    Parameters
+    ----------
+    serial_port : SerialPort
+        An open port.
+    latency_timer : int
+        The FTDI latency timer in milliseconds (1 to 255).
+
+    Returns
+    -------
+    A list of strings that describe the settings that were achieved.
+    """
+    if not sys.platform.startswith('linux') or fcntl is None:
+        return ['Low latency mode is only available on Linux.']
+
+    fd = serial_port.handle()
+    status = []
+
+    try:
+        buf = bytearray(_serial_struct_size)
+        fcntl.ioctl(fd, TIOCGSERIAL, buf)
+        flags = struct.unpack_from('i', buf, _serial_struct_flags)[0]
+        struct.pack_into('i', buf, _serial_struct_flags,
+            flags | ASYNC_LOW_LATENCY)
+        fcntl.ioctl(fd, TIOCSSERIAL, buf)
+        status.append('ASYNC_LOW_LATENCY on')
+    except OSError as e:
+        status.append('ASYNC_LOW_LATENCY not supported ({})'.format(e.strerror))
+
+    try:
+        attrs = termios.tcgetattr(fd)
+        attrs[6][termios.VMIN] = 0
+        attrs[6][termios.VTIME] = 0
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        attrs = termios.tcgetattr(fd)
+        status.append('VMIN {} VTIME {}'.format(attrs[6][termios.VMIN],
+            attrs[6][termios.VTIME]))
+    except termios.error as e:
+        status.append('termios not set ({})'.format(e))
+
+    serial_port.setReadBufferSize(LOW_LATENCY_READ_BUFFER)
+    status.append('read buffer {} KiB'.format(
+        serial_port.readBufferSize() // 1024))
+
+    # Resolve links such as /dev/serial/by-id/... to the tty name.
+    name = osp.basename(osp.realpath(osp.join('/dev', serial_port.portName())))
+    timer_path = '/sys/bus/usb-serial/devices/{}/latency_timer'.format(name)
+    if osp.exists(timer_path):
+        try:
+            with open(timer_path, 'w') as f:
+                f.write(str(latency_timer))
+        except OSError as e:
+            console.enqueue('Could not set {}: {}'.format(timer_path,
+                e.strerror), console.WARNING)
+        with open(timer_path) as f:
+            status.append('latency_timer {} ms'.format(f.read().strip()))
+
+    return status
+
+
+class BaudDetector(QtCore.QObject):
+    """Finds the baud of a device by listening at each of the candidate
+    rates for a short window and scoring what was received.
+
+    Use SerialPort.detectBaud() to start it.
+
+    Parameters
+    ----------
+    serial_port : SerialPort
+        The open port.
+    rates : list
+        The candidate rates in the order they are tried. DETECT_ORDER if
+        None.
+    window : float
+        The shortest time in seconds listened at each rate. Slow rates are
+        listened to for longer, long enough to receive min_bytes with a
+        margin, e.g. 0.17 s at 1200 baud.
+
+    The detection stops at the first rate that scores good_score, which for
+    a device at a common rate is within the first few windows. Trying all
+    of DETECT_ORDER, when nothing scores well, takes about 0.9 s.
+    """
+
+    # Emitted with the best rate, 0 if nothing was received, and a list of
+    # (baud, score, bytes received) for every rate that was tried.
+    finished = QtCore.pyqtSignal(int, list)
+
+    # The detection stops early if a rate scores this well.
+    good_score = 0.98
+    # A score needs at least this many bytes to be trusted.
+    min_bytes = 16
+
+    def __init__(self, serial_port, rates=None, window=0.05):
+        super(BaudDetector, self).__init__()
+        self._serial_port = serial_port
+        self._rates = list(DETECT_ORDER if rates is None else rates)
+        self._window = window
+        self._index = 0
+        self._data = bytearray()
+        self._results = []
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._onWindowEnd)
+
+    def start(self):
+        self._sampleRate()
+
+    def sample(self, data):
+        self._data += data
+
+    def _sampleRate(self):
+        self._serial_port.setBaudRate(self._rates[self._index])
+        self._serial_port.clear(QtSerialPort.QSerialPort.Input)
+        self._data = bytearray()
+        self._timer.start(int(self._windowFor(self._rates[self._index]) *
+            1000))
+
+    def _windowFor(self, baud):
+        # A character is about 10 bits. Without the margin a device that
+        # pauses now and then would be missed at the slow rates.
+        return max(self._window, self.min_bytes * 10 / baud * 1.25)
+
+    def _onWindowEnd(self):
+        # Get anything that hasn't been signalled yet.
+        self.sample(bytes(self._serial_port.readAll()))
+        score = scoreBaudSample(bytes(self._data))
+        self._results.append((self._rates[self._index], score, len(self._data)))
+        self._index += 1
+        done = score >= self.good_score and len(self._data) >= self.min_bytes
+        if not done and self._index < len(self._rates):
+            self._sampleRate()
+            return
+        self.finished.emit(self.bestRate(), self._results)
+
+    def bestRate(self):
+        """
+        Returns
+        -------
+        The rate with the best score, preferring rates that received more
+        data, or 0 if no rate received enough data.
+        """
+        trusted = [r for r in self._results if r[2] >= self.min_bytes]
+        if len(trusted) == 0:
+            return 0
+        return max(trusted, key=lambda r: (round(r[1], 2), r[2]))[0]
 
 
 class SerialPort(QtSerialPort.QSerialPort):
@@ -52,6 +287,16 @@ class SerialPort(QtSerialPort.QSerialPort):
     # Signal to indicate a new connection has been made.
     opened = QtCore.pyqtSignal()
     closed = QtCore.pyqtSignal()
+    # Emitted before the port is closed, while the handle is still valid.
+    # QIODevice.aboutToClose is emitted after QSerialPort closes it.
+    closing = QtCore.pyqtSignal()
+    # Emitted with the bytes read from the port and the time.monotonic() time
+    # the read was made. Everything that consumes the received data, e.g. the
+    # pipeline and the TCP bridge, connects to it.
+    dataReceived = QtCore.pyqtSignal(bytes, float)
+    # Emitted with the detected rate, 0 if none was found, when detectBaud()
+    # finishes.
+    baudDetected = QtCore.pyqtSignal(int)
 
     def __init__(self):
         super(QtSerialPort.QSerialPort, self).__init__()
@@ -60,6 +305,13 @@ class SerialPort(QtSerialPort.QSerialPort):
         # The dictionary used for successful configuration.
         self._serial_config = None
         self.is_connected = False
+        # What low latency mode achieved when the port was opened. Empty if
+        # low latency mode wasn't asked for.
+        self.low_latency_status = []
+        # While the baud is being detected the received data goes to the
+        # detector instead of dataReceived.
+        self._baud_detector = None
+        self.readyRead.connect(self._onReadyRead)
 
     def open(self):
         """Connects to a serial port.
@@ -74,6 +326,16 @@ class SerialPort(QtSerialPort.QSerialPort):
         if not open_result:
             return self.error()
 
+        self.low_latency_status = []
+        if self._serial_config.get('low_latency', False):
+            self.low_latency_status = setLowLatency(self,
+                self._serial_config.get('latency_timer', 1))
+            console.enqueue('Low latency: ' + ', '.join(
+                self.low_latency_status))
+        else:
+            # The default, unlimited.
+            self.setReadBufferSize(0)
+
         # Indicate we have a new connection.
         self.opened.emit()
         self.is_connected = True
@@ -82,6 +344,7 @@ class SerialPort(QtSerialPort.QSerialPort):
         return 0
 
     def close(self):
+        self.closing.emit()
         super(SerialPort, self).close()
         console.enqueue('Disconnected from device {} at {:%d %b. %Y %H:%M:%S}.'.format(
             self._serial_config['port'], datetime.now()))
@@ -101,7 +364,16 @@ class SerialPort(QtSerialPort.QSerialPort):
         self._config_error = ''
 
         self.setPortName(config['port'])
-        self.setBaudRate(config['baud'], QtSerialPort.QSerialPort.AllDirections)
+        if not isinstance(config['baud'], int) or \
+                not MIN_BAUD <= config['baud'] <= MAX_BAUD:
+            self._config_error = 'Invalid baud. It must be from {} to {}.' \
+                .format(MIN_BAUD, MAX_BAUD)
+            return False
+        if not self.setBaudRate(config['baud'],
+                QtSerialPort.QSerialPort.AllDirections):
+            self._config_error = 'The port does not support {} baud.'.format(
+                config['baud'])
+            return False
 
         if config['stop_bits'] == 1:
             self.setStopBits(QtSerialPort.QSerialPort.OneStop)
@@ -123,33 +395,49 @@ class SerialPort(QtSerialPort.QSerialPort):
             self.setDataBits(QtSerialPort.QSerialPort.Data8)
         else:
             self._config_error = 'Invalid choice for data bits.'
+            return False
 
-        if config['parity'] == 'NONE':
-            self.setParity(QtSerialPort.QSerialPort.NoParity)
-        elif config['parity'] == 'ODD':
-            self.setParity(QtSerialPort.QSerialPort.NoParity)
-        elif config['parity'] == 'EVEN':
-            self.setParity(QtSerialPort.QSerialPort.NoParity)
-        elif config['parity'] == 'SPACE':
-            self.setParity(QtSerialPort.QSerialPort.NoParity)
-        elif config['parity'] == 'MARK':
+        if config['parity'] == 'none':
             self.setParity(QtSerialPort.QSerialPort.NoParity)
+        elif config['parity'] == 'odd':
+            self.setParity(QtSerialPort.QSerialPort.OddParity)
+        elif config['parity'] == 'even':
+            self.setParity(QtSerialPort.QSerialPort.EvenParity)
+        elif config['parity'] == 'space':
+            self.setParity(QtSerialPort.QSerialPort.SpaceParity)
+        elif config['parity'] == 'mark':
+            self.setParity(QtSerialPort.QSerialPort.MarkParity)
         else:
             self._config_error = 'Invalid choice for parity.'
+            return False
 
-        if config['flow_control'] == 'NONE':
+        # At high rates hardware flow control is what keeps the device from
+        # overrunning the receive buffer.
+        if config['flow_control'] == 'none':
             self.setFlowControl(QtSerialPort.QSerialPort.NoFlowControl)
-        elif config['flow_control'] == 'XON/XOFF':
+        elif config['flow_control'] == 'software':
             self.setFlowControl(QtSerialPort.QSerialPort.SoftwareControl)
-        elif config['flow_control'] == 'RTS/CTS':
+        elif config['flow_control'] == 'hardware':
             self.setFlowControl(QtSerialPort.QSerialPort.HardwareControl)
         else:
             self._config_error = 'Invalid choice for flow control.'
+            return False
 
         self._serial_config = config
 
         return True
 
+    def getConfig(self):
+        """
+        Returns
+        -------
+        The configuration dictionary last set with setConfig. An empty
+        dictionary if there isn't one.
+        """
+        if self._serial_config is None:
+            return {}
+        return self._serial_config
+
     def get_config_error(self):
         return self._config_error
 
@@ -171,38 +459,175 @@ class SerialPort(QtSerialPort.QSerialPort):
         s = c['port']
         s += ' ' + str(c['baud'])
         s += ' ' + str(c['data_bits'])
-        s += ' ' + c['stop_bits']
+        s += ' ' + '{:g}'.format(float(c['stop_bits']))
 
-        if c['parity'] == 'NONE':
+        if c['parity'] == 'none':
             s += ' None'
-        elif c['parity'] == 'ODD':
+        elif c['parity'] == 'odd':
             s += ' Odd'
-        elif c['parity'] == 'EVEN':
+        elif c['parity'] == 'even':
             s += ' Even'
-        elif c['parity'] == 'SPACE':
+        elif c['parity'] == 'space':
             s += ' Space'
-        elif c['parity'] == 'MARK':
+        elif c['parity'] == 'mark':
             s += ' Mark'
         else:
             s += ' Unk' # Unknown
 
-        if c['flow_control'] == 'NONE':
+        if c['flow_control'] == 'none':
             s += ' None'
-        elif c['flow_control'] == 'XON/XOFF':
+        elif c['flow_control'] == 'software':
             s += ' XON/XOFF'
-        elif c['flow_control'] == 'RTS/CTS':
+        elif c['flow_control'] == 'hardware':
             s += ' RTS/CTS'
         else:
             s += ' Unk' # Unknown
 
         return s
 
+    def detectBaud(self, rates=None):
+        """Starts detecting the baud of the connected device. When done the
+        port is left at the detected rate, or the rate it had if nothing was
+        detected, and baudDetected is emitted. The port's configuration is
+        updated, not the saved connection.
+
+        Parameters
+        ----------
+        rates : list
+            The candidate rates in the order they are tried. DETECT_ORDER if
+            None.
+
+        Returns
+        -------
+        False if the port isn't connected or a detection is already running.
+        """
+        if not self.is_connected or self._baud_detector is not None:
+            return False
+        self._baud_detector = BaudDetector(self, rates)
+        self._baud_detector.finished.connect(self._onBaudDetected)
+        self._baud_detect_start = time.perf_counter()
+        self._baud_detector.start()
+        return True
+
+    def _onBaudDetected(self, baud, results):
+        self._baud_detector = None
+        seconds = time.perf_counter() - self._baud_detect_start
+        console.enqueue('Baud detection took {:.3f} seconds:\n'.format(seconds)
+            + '\n'.join('{:>8}: {:.2f} ({} bytes)'.format(*r) for r in results))
+        if baud == 0:
+            console.enqueue('Could not detect the baud. Not enough data was '
+                'received.', console.WARNING)
+        else:
+            console.enqueue('Detected baud: {}'.format(baud))
+            self._serial_config['baud'] = baud
+        self.setBaudRate(self._serial_config['baud'],
+            QtSerialPort.QSerialPort.AllDirections)
+        self.baudDetected.emit(baud)
+
+    def _onReadyRead(self):
+        # Time the read before anything else so the timing of the data, e.g.
+        # for gap framing, isn't skewed by the work done with it. It is
+        # still late by however long the GUI thread took to get here. See
+        # framing.GapFramer.
+        timestamp = time.monotonic()
+        available = self.bytesAvailable()
+        if available > 0:
+            data = bytes(self.read(available))
+            if self._baud_detector is not None:
+                self._baud_detector.sample(data)
+                return
+            self.dataReceived.emit(data, timestamp)
+
     def scanComs(self):
         # http://doc.qt.io/qt-5/qserialportinfo.html#availablePorts
         available_ports = QtSerialPort.QSerialPortInfo.availablePorts()
         return available_ports
 
 
+class ConnectionSupervisor(QtCore.QObject):
+    """Reopens a serial port that was lost, e.g. when a USB-serial adapter
+    resets or the device reboots.
+
+    When the port reports a resource error it is closed and reopened with the
+    same configuration. Attempts are made with an exponential backoff from
+    "initial_delay" up to "max_delay" seconds until the port opens or cancel()
+    is called. Because the same SerialPort object is reopened everything
+    connected to it, such as the pipeline and the console, keeps its state.
+    """
+
+    # Emitted before every attempt with the attempt number and the delay in
+    # seconds until it is made.
+    reconnecting = QtCore.pyqtSignal(int, float)
+    # Emitted with the number of seconds the port was lost for.
+    reconnected = QtCore.pyqtSignal(float)
+
+    # Errors that mean the device went away.
+    lost_errors = [
+        QtSerialPort.QSerialPort.ResourceError,
+        QtSerialPort.QSerialPort.ReadError,
+    ]
+
+    def __init__(self, serial_port, initial_delay=0.25, max_delay=30.0):
+        super(ConnectionSupervisor, self).__init__()
+        self._serial_port = serial_port
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._delay = initial_delay
+        self._attempts = 0
+        self._lost_time = None
+        self.enabled = True
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._onRetry)
+
+        self._serial_port.errorOccurred.connect(self._onError)
+
+    def cancel(self):
+        """Stops reconnecting."""
+        if self._lost_time is None:
+            return
+        self._timer.stop()
+        self._lost_time = None
+        console.enqueue('Stopped reconnecting to device {}.'.format(
+            self._serial_port.portName()), console.WARNING)
+
+    def isReconnecting(self):
+        return self._lost_time is not None
+
+    def _onError(self, error):
+        if not self.enabled or error not in self.lost_errors:
+            return
+        if self._lost_time is not None or not self._serial_port.is_connected:
+            return
+        self._lost_time = time.monotonic()
+        self._attempts = 0
+        self._delay = self._initial_delay
+        console.enqueue('Lost device {}: {}'.format(
+            self._serial_port.portName(), self._serial_port.errorString()), console.WARNING)
+        self._serial_port.close()
+        self._schedule()
+
+    def _onRetry(self):
+        if self._lost_time is None:
+            return
+        if self._serial_port.open() != 0:
+            self._delay = min(self._delay * 2, self._max_delay)
+            self._schedule()
+            return
+        seconds = time.monotonic() - self._lost_time
+        self._lost_time = None
+        console.enqueue('Reconnected to device {} after {:.3f} seconds '
+            '({} attempts).'.format(self._serial_port.portName(), seconds,
+            self._attempts))
+        self.reconnected.emit(seconds)
+
+    def _schedule(self):
+        self._attempts += 1
+        self.reconnecting.emit(self._attempts, self._delay)
+        self._timer.start(int(self._delay * 1000))
+
+
 class SerialConnections():
     """Handful of methods to load, save, and check connections.json files.
     """
@@ -213,38 +638,27 @@ class SerialConnections():
         """
         if not os.path.isfile(filePath):
             console.enqueue('Could not load connections file. File not found: {}'
-                .format(filePath))
+                .format(filePath), console.WARNING)
+            return None
         try:
             # Now parse the file.
             with open(filePath, encoding='utf-8') as connections_file:
-                contents = connections_file.read()
-                # Remove all comments that start with "//".
-                #contents = re.sub('//.*[\r\n]*', '', contents, 0, re.M)
-                # Remove blank lines.
-                #contents = re.sub('^\s*[\r\n]*', '', contents, 0, re.M)
-                # Parse the file as JSON.
-                connections = yaml.load(contents)
-            return connections
-        except TypeError:
+                return yaml.load(connections_file, Loader=_Loader)
+        except (OSError, yaml.YAMLError) as e:
             # If there was a parsing error post a message to the console.
-            console.enqueue('Error parsing the preferences file.')
+            console.enqueue('Error parsing the connections file: {}'.format(e),
+                console.ERROR)
             return None
 
     @staticmethod
     def check(connections):
         """Checks a dictionary of connections for correct fields and values
-        in the fields.
-
-        References
-        ----------
-        * http://pykwalify.readthedocs.io/en/master/basics.html
+        in the fields against connections_schema.yaml.
         """
-        try:
-            # jsonschema.validate(connections, schema)
-            c = pykwalify.core.Core(source_data=connections, schema_files=['connections_schema.yaml'])
-            c.validate(raise_exception=True)
-        except pykwalify.errors.SchemaError as e:
-            console.enqueue(e.msg)
+        errors = schema.validate(connections, 'connections_schema.yaml')
+        if len(errors) > 0:
+            console.enqueue('The connections are not valid:\n' +
+                '\n'.join(errors), console.WARNING)
             return False
         return True
 
@@ -254,6 +668,190 @@ class SerialConnections():
         """
         # print('saving')
         # print(connections)
-        with open(filePath, 'w', encoding='utf-8') as connections_file:
-            yaml.dump(connections, connections_file, indent=2,
-                default_flow_style=False)
+        # Written to a temporary file that replaces the file, so a crash
+        # while saving doesn't leave half a file. A symbolic link is
+        # followed so the file it points to is replaced, not the link.
+        filePath = osp.realpath(filePath)
+        fd, temp_path = tempfile.mkstemp(prefix='.connections-', suffix='.tmp',
+            dir=osp.dirname(filePath))
+        try:
+            with open(fd, 'w', encoding='utf-8') as connections_file:
+                yaml.dump(connections, connections_file, Dumper=_Dumper,
+                    indent=2, default_flow_style=False)
+                connections_file.flush()
+                os.fsync(connections_file.fileno())
+            # The temporary file is only readable by its owner. A shared
+            # file keeps the permissions it had.
+            if osp.exists(filePath):
+                os.chmod(temp_path, stat.S_IMODE(os.stat(filePath).st_mode))
+            os.replace(temp_path, filePath)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+class ConnectionStore(QtCore.QObject):
+    """The saved connections by name, in the order of the file.
+
+    The file can be loaded in the background with loadInBackground().
+    Changes are saved in the background SAVE_DELAY milliseconds after the
+    last one, or when save() is called. Nothing is written if nothing
+    changed. A file that couldn't be loaded isn't saved over, so the
+    connections in it aren't lost.
+
+    The connections returned by get() shouldn't be changed. Use set().
+    """
+
+    # Emitted when a connection is added, replaced or removed.
+    changed = QtCore.pyqtSignal()
+    # Emitted with what load() would return when loadInBackground() is done.
+    loaded = QtCore.pyqtSignal(bool)
+
+    # Hands the connections read by the worker thread to the store's thread.
+    _read = QtCore.pyqtSignal(object)
+
+    SAVE_DELAY = 1000
+
+    def __init__(self, file_path):
+        super(ConnectionStore, self).__init__()
+        self.file_path = file_path
+        self._connections = collections.OrderedDict()
+        # Incremented on every change. The file has the connections as of
+        # _saved_version.
+        self._version = 0
+        self._saved_version = 0
+        self._writable = False
+        # Whether the user was told that changes can't be saved.
+        self._warned = False
+        # One thread, so the saves are made in order.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.SAVE_DELAY)
+        self._timer.timeout.connect(self.save)
+        self._read.connect(self._onRead)
+
+    def load(self):
+        """Loads the connections from the file.
+
+        Returns
+        -------
+        True if the connections were loaded. False if the file doesn't
+        exist, in which case it's made when a connection is saved, or isn't
+        valid.
+        """
+        return self._apply(self._readFile())
+
+    def loadInBackground(self):
+        """Starts loading the connections on the worker thread. loaded is
+        emitted when they have been. Connections set meanwhile are kept.
+        """
+        self._pending = self._executor.submit(
+            lambda: self._read.emit(self._readFile()))
+
+    def _readFile(self):
+        """
+        Returns
+        -------
+        The valid connections in the file, None if there aren't any, or
+        False if the file doesn't exist.
+        """
+        if not osp.exists(self.file_path):
+            console.enqueue('Could not find the connections file "{}". It will '
+                'be made when a connection is saved.'.format(self.file_path))
+            return False
+        connections = SerialConnections.load(self.file_path)
+        if connections is None or not SerialConnections.check(connections):
+            return None
+        return connections
+
+    def _apply(self, connections):
+        if connections is None or connections is False:
+            # A file that doesn't exist can be made.
+            self._writable = connections is False
+            return False
+        loaded = collections.OrderedDict()
+        for c in connections:
+            c['stop_bits'] = float(c['stop_bits'])
+            loaded[c['name']] = c
+        # Changes made while loading win over the file.
+        loaded.update(self._connections)
+        self._connections = loaded
+        self._writable = True
+        self.changed.emit()
+        return True
+
+    def _onRead(self, connections):
+        self.loaded.emit(self._apply(connections))
+
+    def names(self):
+        return list(self._connections)
+
+    def get(self, name):
+        """
+        Raises
+        ------
+        KeyError
+            If there isn't a connection named "name".
+        """
+        return self._connections[name]
+
+    def __contains__(self, name):
+        return name in self._connections
+
+    def __len__(self):
+        return len(self._connections)
+
+    def set(self, config):
+        """Adds a connection, or replaces the one with the same name."""
+        if self._connections.get(config['name']) == config:
+            return
+        self._connections[config['name']] = copy.deepcopy(config)
+        self._onChanged()
+
+    def remove(self, name):
+        if self._connections.pop(name, None) is not None:
+            self._onChanged()
+
+    def isDirty(self):
+        return self._version != self._saved_version
+
+    def save(self):
+        """Starts saving the connections in the background if they changed.
+        """
+        self._timer.stop()
+        if not self.isDirty():
+            return
+        if not self._writable:
+            if not self._warned:
+                self._warned = True
+                console.enqueue('The connections file "{}" could not be '
+                    'loaded, so it is not saved over. Changes to the '
+                    'connections will be lost when Super Serial is '
+                    'closed.'.format(self.file_path), console.WARNING)
+            return
+        # The connections are replaced rather than changed, so a copy of
+        # the list is enough.
+        self._pending = self._executor.submit(self._write,
+            list(self._connections.values()), self._version)
+
+    def wait(self):
+        """Waits for the save in progress, if any."""
+        if self._pending is not None:
+            concurrent.futures.wait([self._pending])
+
+    def _onChanged(self):
+        self._version += 1
+        self._timer.start()
+        self.changed.emit()
+
+    def _write(self, connections, version):
+        try:
+            SerialConnections.save(connections, self.file_path)
+        except Exception as e:
+            # Anything raised here would be kept in the future unseen.
+            console.enqueue('Could not save the connections file: {}: {}'
+                .format(type(e).__name__, e), console.ERROR)
+            return
+        self._saved_version = version
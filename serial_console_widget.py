@@ -16,6 +16,7 @@ Copyright 2017-2018 Justin Watson
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
+import hex_dump
 import preferences
 
 
@@ -31,6 +32,11 @@ class SerialConsoleWidget(QtWidgets.QTextEdit):
         self.local_echo_enabled = False
         self.setWordWrapMode(QtGui.QTextOption.NoWrap)
         self.show_crlf = False
+        self.hex_mode = False
+        self._hexDumper = hex_dump.HexDumper()
+        # Length of the partial hex row at the end of the document. It is
+        # replaced as the rest of the row arrives.
+        self._hexPartialLength = 0
         self.ccp = ControlCharPainter()
         self.ccp.setTextEdit(self)
         #self.unicode_font = QtGui.QFont('Segoe UI Symbol', 12)
@@ -88,10 +94,42 @@ class SerialConsoleWidget(QtWidgets.QTextEdit):
         #         #cursor.insertText(orc, ctrlCharFormat)
         #         self.setTextCursor(cursor)
         #     else:
+        self.moveCursor(QtGui.QTextCursor.End)
         self.insertPlainText(data)
         vbar = self.verticalScrollBar()
         vbar.setValue(vbar.maximum())
 
+    def putBytes(self, data):
+        """Shows bytes. In hex mode they are shown as a hex dump, otherwise
+        they are decoded as UTF-8.
+        """
+        if not self.hex_mode:
+            self.putData(data.decode('utf-8', 'replace'))
+            return
+        rows, partial = self._hexDumper.dump(data)
+        cursor = self.textCursor()
+        cursor.movePosition(QtGui.QTextCursor.End)
+        if self._hexPartialLength > 0:
+            cursor.movePosition(QtGui.QTextCursor.Left,
+                QtGui.QTextCursor.KeepAnchor, self._hexPartialLength)
+            cursor.removeSelectedText()
+        cursor.insertText(rows + partial)
+        self._hexPartialLength = len(partial)
+        vbar = self.verticalScrollBar()
+        vbar.setValue(vbar.maximum())
+
+    def setHexMode(self, enabled):
+        """Switches between showing text and a hex dump. The dump starts
+        at offset 0 on a new line.
+        """
+        if enabled == self.hex_mode:
+            return
+        self.hex_mode = enabled
+        self._hexDumper.reset()
+        self._hexPartialLength = 0
+        if not self.document().isEmpty():
+            self.putData('\n')
+
 
 class ControlCharObject(QtCore.QObject, QtGui.QTextObjectInterface):
     """
@@ -173,30 +211,23 @@ class Highlighter(QtCore.QObject):
         char_format = QtGui.QTextCharFormat()
         cursor = self.__parent.textCursor()
 
-        #print(self.__highlight_manager.get_highlights())
+        # The compiled patterns are shared with the manager, and text that
+        # none of them match is skipped with one search.
+        matcher = self.__highlight_manager.matcher()
+        text = self.__parent.toPlainText()
+        if not matcher.search(text):
+            return
 
-        for highlight in self.__highlight_manager.get_highlights():
-            if not highlight['enabled'] or highlight['pattern'] == '':
-                continue
+        for regex, color in zip(matcher.regexes, matcher.tags):
             # Format properties are in the following to classes.
             # http://doc.qt.io/qt-5/qtextformat.html#public-functions
             # http://doc.qt.io/qt-5/qtextcharformat.html
-            char_format.setForeground(QtGui.QBrush(
-                QtGui.QColor(highlight['color'])
-                ))
-            # http://doc.qt.io/qt-5/qregexp.html
-            regex = QtCore.QRegExp(highlight['pattern'])
-            if highlight['case_sensitive']:
-                regex.setCaseSensitivity[QtCore.Qt.CaseSensitive]
-            pos = 0
-            index = regex.indexIn(self.__parent.toPlainText(), pos)
-            while index != -1:
+            char_format.setForeground(QtGui.QBrush(QtGui.QColor(color)))
+            for match in regex.finditer(text):
+                if match.end() == match.start():
+                    continue
                 # Select the matched text and apply the format.
-                #print(index, index + regex.matchedLength())
-                cursor.setPosition(index)
-                cursor.setPosition(index + regex.matchedLength(), QtGui.QTextCursor.KeepAnchor)
+                cursor.setPosition(match.start())
+                cursor.setPosition(match.end(), QtGui.QTextCursor.KeepAnchor)
                 # http://doc.qt.io/qt-5/richtext-cursor.html
                 cursor.mergeCharFormat(char_format)
-                # Move to the next match.
-                pos = index + regex.matchedLength()
-                index = regex.indexIn(self.__parent.toPlainText(), pos)
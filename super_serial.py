@@ -28,8 +28,10 @@ References
 """
 
 import argparse
+import bisect
 import collections
 import copy
+import itertools
 import os
 import os.path as osp
 import re
@@ -40,10 +42,16 @@ from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.Qt import QDesktopServices, QUrl, PYQT_VERSION_STR
 from sip import SIP_VERSION_STR
 
+import bridge
 import console
 import highlighter
 import highlighter_widget
+import latency_probe
+import periodic_sender
+import pipeline
+import port_scanner
 import preferences
+import scripting
 import serial
 import serial_console_widget
 
@@ -83,7 +91,19 @@ class ApplicationWindow(QtWidgets.QMainWindow):
             serial_config = serial_args_to_config(args)
 
         self._serialPort = serial.SerialPort()
+        self._supervisor = serial.ConnectionSupervisor(self._serialPort)
         self._highlighManager = highlighter.HighlightManager()
+        self._pipeline = pipeline.Pipeline()
+        self._latencyProbe = latency_probe.LatencyProbe(self._serialPort)
+        self._periodicSender = periodic_sender.PeriodicSender(self._serialPort)
+        self._scriptSession = scripting.Session(self._serialPort)
+        # The serial configuration the pipeline was built from.
+        self._pipelineSource = None
+        # Created the first time it's shown so matplotlib is only loaded when
+        # it's used.
+        self._plotWidget = None
+        # Shows the notifications of the rules. Created on the first one.
+        self._trayIcon = None
 
         # Widgets
         # -------
@@ -91,6 +111,7 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self._consoleWidget = ConsoleWidget()
         self._serialConfigDialog = SerialConfigDialog(self, self._serialPort)
         self._connectionLabel = QtWidgets.QLabel('Disconnected')
+        self._latencyLabel = QtWidgets.QLabel()
         self._serialConsoleWidget = serial_console_widget.SerialConsoleWidget(
             self._highlighManager, self)
         self._serialConsoleWidget.setVerticalScrollBarPolicy(
@@ -99,6 +120,9 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self._highlightManagerWidget = highlighter_widget.HighlightManagerWidget(
             self, self._highlighManager)
         self.setTitleDialog = SetTitleDialog(self)
+        self._latencyProbeDialog = LatencyProbeDialog(self, self._latencyProbe)
+        self._periodicSendDialog = PeriodicSendDialog(self,
+            self._periodicSender)
 
         # Menu
         # ----
@@ -119,6 +143,11 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self.disconnectAction = self.superSerialMenu.addAction('&Disconnect',
             self.disconnect, QtCore.Qt.CTRL + QtCore.Qt.Key_D)
         self.disconnectAction.setEnabled(False)
+        self.detectBaudAction = self.superSerialMenu.addAction(
+            'Detect &Baud Rate', self.detectBaud)
+        self.detectBaudAction.setEnabled(False)
+        self.superSerialMenu.addAction('&Latency Probe', self.showLatencyProbe)
+        self.superSerialMenu.addAction('&Periodic Send', self.showPeriodicSend)
         self.superSerialMenu.addAction('&Set Title', self.setTitle)
         self.superSerialMenu.addAction('&Exit', self.close,
             QtCore.Qt.CTRL + QtCore.Qt.Key_Q)
@@ -129,11 +158,19 @@ class ApplicationWindow(QtWidgets.QMainWindow):
             'Show Console', self.showConsole, 'Ctrl+`')
         self.highlightManagerAction = self.viewMenu.addAction(
             'Show Highlights', self.showHighlightManager)
+        self.viewMenu.addAction('Show Plot', self.showPlot)
         self.viewMenu.addSeparator()
         self.localEchoAction = self.viewMenu.addAction('Enable Local Echo',
             self._onLocalEchoAction)
         self.localEchoAction.setCheckable(True)
         self.localEchoAction.setChecked(False)
+        self.hexViewAction = self.viewMenu.addAction('Hex View',
+            self._onHexViewAction)
+        self.hexViewAction.setCheckable(True)
+        self.hexViewAction.setChecked(False)
+        self.viewMenu.addSeparator()
+        self.viewMenu.addAction('Pipeline Statistics',
+            self._onPipelineStatsAction)
         # self.show_crlf_action = self.viewMenu.addAction('Show CR and LF',
         #     self._onShowCrLfAction)
 
@@ -143,14 +180,28 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self.helpMenu.addAction('&Super Serial Webpage', self.webpage)
         self.helpMenu.addAction('&About Super Serial', self.about)
 
+        # Objects for scripting in the console.
+        self._consoleWidget.setLocals({
+            'latency_probe': self._latencyProbe,
+            'periodic_sender': self._periodicSender,
+            'pipeline': self._pipeline,
+            'serial_port': self._serialPort,
+            'session': self._scriptSession,
+        })
+
         # Connections
         # -----------
-        console.messages.newMsg.connect(self._onNewConsoleMsg)
+        console.messages.newMessages.connect(self._onNewConsoleMsgs)
         # Subscribe to preferences file update events.
         preferences.subscribe(self._onPrefsUpdate)
         self._serialPort.opened.connect(self._onSerialOpened)
         self._serialPort.closed.connect(self._onSerialClosed)
-        self._serialPort.readyRead.connect(self._onSerialPortReadyRead)
+        self._serialPort.dataReceived.connect(self._pipeline.feed)
+        self._supervisor.reconnecting.connect(self._onSerialReconnecting)
+        self._serialPort.baudDetected.connect(self._onBaudDetected)
+        self._pipeline.displayData.connect(self._serialConsoleWidget.putData)
+        self._pipeline.displayBytes.connect(self._serialConsoleWidget.putBytes)
+        self._pipeline.ruleFired.connect(self._onRuleFired)
         self._serialConsoleWidget.dataWrite.connect(self._onSerConWidWrite)
 
         # Layout
@@ -161,6 +212,7 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         layout.setSpacing(0)
 
         self.statusBar().addWidget(self._connectionLabel)
+        self.statusBar().addPermanentWidget(self._latencyLabel)
 
         self._splitter.addWidget(self._serialConsoleWidget)
         self._splitter.addWidget(self._consoleWidget)
@@ -192,49 +244,38 @@ class ApplicationWindow(QtWidgets.QMainWindow):
             preferences_file = args.preferences_file
         preferences.load(preferences_file)
         console.enqueue('Loaded preferences file: {}'.format(preferences_file))
-
-        mono_font = QtGui.QFont(preferences.get('font_face'))
-        mono_font.setPointSize(int(preferences.get('font_size')))
-        self._consoleWidget.setFont(mono_font)
-        self._serialConsoleWidget.document().setDefaultFont(mono_font)
+        self._onPrefsUpdate()
 
         # Load connections file.
         self.connections_file = os.getcwd() + osp.sep + 'connections.yaml'
         if args.connections_file is not None:
             self.connections_file = args.connections_file
 
-        self._connections = {}
-        self._connections_successfully_loaded = False
-        connections = serial.SerialConnections.load(self.connections_file)
-        connections_okay = serial.SerialConnections.check(connections)
-        # If the connections configuration checked out okay then load the
-        # connections. Otherwise don't load them.
-        if connections_okay:
-            # Convert the connections into a dict using the names.
-            # This is so we can find the items by name quickly.
-            # https://docs.python.org/3.6/faq/design.html#how-are-dictionaries-implemented
-            # Using collections.OrderedDict to keep the order the same in the list
-            # widget.
-            d = collections.OrderedDict()
-            for c in connections:
-                d[c['name']] = c
-                d[c['name']]['stop_bits'] = float(d[c['name']]['stop_bits'])
-            self._serialConfigDialog.setConnections(d)
-            self._connections = d
-            self._connections_successfully_loaded = True
-            console.enqueue('Connections file loaded: {}'.format(
-                self.connections_file))
+        # Loaded in the background as a large file takes a while to parse.
+        self._connectionStore = serial.ConnectionStore(self.connections_file)
+        self._connectionStore.loaded.connect(self._onConnectionsLoaded)
+        self._connectionStore.loadInBackground()
+        self._serialConfigDialog.setConnections(self._connectionStore)
 
         if serial_config is not None:
-            config_result = self._serial_port.setConfig(serial_config)
+            config_result = self._serialPort.setConfig(serial_config)
             if not config_result:
-                console.enqueue('Error serial config.')
+                console.enqueue('Error serial config.', console.ERROR)
             else:
-                open_result = self._serial_port.open()
+                open_result = self._serialPort.open()
                 if open_result != 0:
                     console.enqueue('Error connection: {}'.format(
-                        self._serial_port.qserialport_errors[config_result]))
+                        self._serialPort.qserialport_errors[open_result]), console.ERROR)
         self._serialConfigDialog.updatePortList()
+        self._pipeline.start()
+
+        # Share the serial port over TCP.
+        self._bridge = None
+        if args.bridge_port is not None:
+            self._bridge = bridge.SerialBridge(self._serialPort,
+                args.bridge_mode)
+            if not self._bridge.listen(args.bridge_port, args.bridge_address):
+                self._bridge = None
 
         console.enqueue('Load time: {:.4} seconds'.format(
             time.perf_counter() - app_start_time)
@@ -247,29 +288,38 @@ class ApplicationWindow(QtWidgets.QMainWindow):
 
     def closeEvent(self, event):
         # This method is overriding the event 'close'.
-        if self._connections_successfully_loaded:
-            serial.SerialConnections.save(list(self._connections.values()),
-                self.connections_file)
-
-        if not preferences.get('prompt_on_quit'):
-            return
-
-        quit_msg = "Are you sure you want to exit Super Serial?"
-        reply = QtWidgets.QMessageBox.question(self, 'Message',
-                         quit_msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
-
-        if reply == QtWidgets.QMessageBox.Yes:
-            event.accept()
-        else:
-            event.ignore()
-        self.fileQuit()
+        if preferences.values().prompt_on_quit:
+            quit_msg = "Are you sure you want to exit Super Serial?"
+            reply = QtWidgets.QMessageBox.question(self, 'Message',
+                             quit_msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
+            if reply != QtWidgets.QMessageBox.Yes:
+                # The window stays open, so everything keeps running.
+                event.ignore()
+                return
+
+        event.accept()
+        self._pipeline.stop()
+        if self._bridge is not None:
+            self._bridge.close()
+        # Only written if a connection changed since the last save. The
+        # window doesn't wait for it, Python waits for the save before it
+        # exits.
+        self._connectionStore.save()
 
     def connect(self):
         self._serialConfigDialog.setModal(True)
         self._serialConfigDialog.show()
 
+    def detectBaud(self):
+        if self._serialPort.detectBaud():
+            self._connectionLabel.setText('Detecting baud...')
+
     def disconnect(self):
-        self._serial_port.close()
+        if self._supervisor.isReconnecting():
+            self._supervisor.cancel()
+            self._onSerialClosed()
+            return
+        self._serialPort.close()
 
     def documentation(self):
         url = QUrl('http://docs.superserial.io/en/latest/')
@@ -285,6 +335,9 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         # To make the console not viewable...
         # https://stackoverflow.com/a/371634
         if self._consoleWidget.isHidden():
+            # What was received before the console was shown is stale to a
+            # script typed into it.
+            self._scriptSession.clear()
             self._consoleWidget.show()
             self.consoleAction.setText('Hide Console')
         else:
@@ -294,10 +347,52 @@ class ApplicationWindow(QtWidgets.QMainWindow):
     def showHighlightManager(self):
         self._highlightManagerWidget.show()
 
+    def showLatencyProbe(self):
+        self._latencyProbeDialog.show()
+        self._latencyProbeDialog.raise_()
+
+    def showPeriodicSend(self):
+        self._periodicSendDialog.show()
+        self._periodicSendDialog.raise_()
+
+    def showPlot(self):
+        if self._plotWidget is None:
+            import plot_widget
+            self._plotWidget = plot_widget.PlotWidget(self)
+            self._pipeline.telemetry = self._plotWidget.telemetry
+        self._plotWidget.show()
+        self._plotWidget.raise_()
+
     def webpage(self):
         url = QUrl('http://superserial.io')
         QDesktopServices.openUrl(url)
 
+    def _onBaudDetected(self, baud):
+        self._connectionLabel.setText('Connected: ' + self._serialPort.configToStr())
+        # The saved connection gets the detected baud so it's used the next
+        # time.
+        name = self._serialPort.getConfig().get('name')
+        if baud == 0 or name not in self._connectionStore:
+            return
+        saved = self._connectionStore.get(name)
+        if saved['baud'] != baud:
+            self._connectionStore.set(dict(saved, baud=baud))
+            console.enqueue('Saved the baud {} to the connection "{}".'.format(
+                baud, name))
+
+    def _applyPipelineConfig(self):
+        """Builds the pipeline for the connected profile and the view."""
+        config = None
+        if self._pipelineSource is not None:
+            config = self._pipelineSource.get('pipeline')
+        if self._serialConsoleWidget.hex_mode:
+            config = pipeline.hexViewConfig(config)
+        self._pipeline.setConfig(config, self._pipelineSource)
+
+    def _onHexViewAction(self):
+        self._serialConsoleWidget.setHexMode(self.hexViewAction.isChecked())
+        self._applyPipelineConfig()
+
     def _onLocalEchoAction(self):
         if self._serialConsoleWidget.local_echo_enabled:
             self._serialConsoleWidget.local_echo_enabled = False
@@ -306,31 +401,79 @@ class ApplicationWindow(QtWidgets.QMainWindow):
             self._serialConsoleWidget.local_echo_enabled = True
             self.localEchoAction.setChecked(True)
 
-    def _onNewConsoleMsg(self):
-        self._consoleWidget.consoleOutput.append(console.dequeue())
+    def _onNewConsoleMsgs(self, messages):
+        self._consoleWidget.appendMessages(messages)
+
+    def _onConnectionsLoaded(self, loaded):
+        if loaded:
+            console.enqueue('Connections file loaded: {}'.format(
+                self.connections_file))
+
+    def _onPipelineStatsAction(self):
+        console.enqueue('Pipeline statistics:\n' + self._pipeline.statsToStr())
 
-    def _onPrefsUpdate(self):
-        mono_font = QtGui.QFont(preferences.get('font_face'))
-        mono_font.setPointSize(int(preferences.get('font_size')))
-        self._consoleWidget.setFont(mono_font)
-        self._serialConsoleWidget.document().setDefaultFont(mono_font)
+    def _onPrefsUpdate(self, changed=None):
+        """Applies the preferences that changed, or all of them if
+        "changed" is None.
+        """
+        prefs = preferences.values()
+        if changed is None or {'font_face', 'font_size'} & changed:
+            mono_font = QtGui.QFont(prefs.font_face)
+            mono_font.setPointSize(prefs.font_size)
+            self._consoleWidget.setFont(mono_font)
+            self._serialConsoleWidget.document().setDefaultFont(mono_font)
+        if changed is None or 'scrollback_lines' in changed:
+            self._serialConsoleWidget.document().setMaximumBlockCount(
+                prefs.scrollback_lines)
+        self._supervisor.enabled = prefs.auto_reconnect
+        self._consoleWidget.setTimeout(prefs.console_timeout)
+
+    def _onRuleFired(self, action, name, argument):
+        if action == 'send':
+            if self._serialPort.is_connected:
+                self._serialPort.write(argument.encode('latin-1', 'replace'))
+        elif action == 'notify':
+            console.enqueue('Rule "{}": {}'.format(name, argument))
+            if not QtWidgets.QSystemTrayIcon.isSystemTrayAvailable():
+                QtWidgets.QApplication.alert(self)
+                return
+            if self._trayIcon is None:
+                self._trayIcon = QtWidgets.QSystemTrayIcon(self.windowIcon(),
+                    self)
+                self._trayIcon.show()
+            self._trayIcon.showMessage('Super Serial: ' + name, argument)
 
     def _onSerialClosed(self):
-        self.connectionLabel.setText('Disconnected')
+        if self._supervisor.isReconnecting():
+            return
+        self._connectionLabel.setText('Disconnected')
+        self._latencyLabel.setText('')
         self.disconnectAction.setEnabled(False)
+        self.detectBaudAction.setEnabled(False)
         self.connectAction.setEnabled(True)
 
     def _onSerialOpened(self):
-        self.connectionLabel.setText('Connected: ' + self._serialPort.configToStr())
+        # A reconnect opens the port with the same configuration. Keep the
+        # pipeline running so its state, e.g. an open log file, is kept.
+        config = self._serialPort.getConfig()
+        if config is not self._pipelineSource:
+            self._pipelineSource = config
+            self._applyPipelineConfig()
+            # The data of another connection.
+            self._scriptSession.clear()
+        self._connectionLabel.setText('Connected: ' + self._serialPort.configToStr())
+        self._latencyLabel.setText(', '.join(self._serialPort.low_latency_status))
         self.disconnectAction.setEnabled(True)
+        self.detectBaudAction.setEnabled(True)
         self.connectAction.setEnabled(False)
         self._serialConsoleWidget.setFocus(QtCore.Qt.OtherFocusReason)
 
-    def _onSerialPortReadyRead(self):
-        available = self._serialPort.bytesAvailable()
-        if available > 0:
-            data = self._serialPort.read(available)
-            self._serialConsoleWidget.putData(data.decode('utf-8'))
+    def _onSerialReconnecting(self, attempt, delay):
+        self._connectionLabel.setText('Reconnecting to {} (attempt {})...'
+            .format(self._serialPort.portName(), attempt))
+        # Disconnect stops the reconnecting.
+        self.disconnectAction.setEnabled(True)
+        self.connectAction.setEnabled(False)
 
     def _onSerConWidWrite(self, data):
         """
@@ -350,6 +493,165 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self._serialConsoleWidget.repaint()
 
 
+class LatencyProbeDialog(QtWidgets.QDialog):
+    """Dialog to set up the latency probe and show its statistics."""
+
+    def __init__(self, parent, probe):
+        super(LatencyProbeDialog, self).__init__(parent)
+        self._probe = probe
+
+        self.setWindowTitle('Latency Probe')
+        self.setWindowFlags(QtCore.Qt.WindowCloseButtonHint | QtCore.Qt.Dialog)
+
+        # Widgets
+        # -------
+        self.commandLineEdit = QtWidgets.QLineEdit('\\r')
+        self.commandLineEdit.setToolTip('Escapes such as \\r\\n are allowed.')
+        self.responseLineEdit = QtWidgets.QLineEdit('>')
+        self.responseLineEdit.setToolTip(
+            'Regular expression that matches the response.')
+        self.intervalSpinBox = QtWidgets.QDoubleSpinBox()
+        self.intervalSpinBox.setRange(0.001, 3600)
+        self.intervalSpinBox.setDecimals(3)
+        self.intervalSpinBox.setSuffix(' s')
+        self.intervalSpinBox.setValue(1.0)
+        self.timeoutSpinBox = QtWidgets.QDoubleSpinBox()
+        self.timeoutSpinBox.setRange(0.001, 3600)
+        self.timeoutSpinBox.setDecimals(3)
+        self.timeoutSpinBox.setSuffix(' s')
+        self.timeoutSpinBox.setValue(1.0)
+        self.statsLabel = QtWidgets.QLabel(probe.statsToStr())
+        self.statsLabel.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        self.startButton = QtWidgets.QPushButton('Start')
+        self.resetButton = QtWidgets.QPushButton('Reset')
+        # The statistics are shown at most 10 times a second.
+        self._updateTimer = QtCore.QTimer(self)
+        self._updateTimer.setSingleShot(True)
+        self._updateTimer.setInterval(100)
+
+        # Connections
+        # -----------
+        self.startButton.clicked.connect(self._onStart)
+        self.resetButton.clicked.connect(probe.reset)
+        probe.updated.connect(self._onProbeUpdated)
+        self._updateTimer.timeout.connect(self._onUpdate)
+
+        # Layout
+        # ------
+        layout = QtWidgets.QFormLayout()
+        layout.addRow('Command:', self.commandLineEdit)
+        layout.addRow('Response:', self.responseLineEdit)
+        layout.addRow('Interval:', self.intervalSpinBox)
+        layout.addRow('Timeout:', self.timeoutSpinBox)
+        layout.addRow(self.statsLabel)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(self.startButton)
+        buttons.addWidget(self.resetButton)
+        layout.addRow(buttons)
+        self.setLayout(layout)
+
+    def _onStart(self):
+        if self._probe.isRunning():
+            self._probe.stop()
+            self.startButton.setText('Start')
+            return
+        try:
+            self._probe.setConfig(self.commandLineEdit.text(),
+                self.responseLineEdit.text(), self.intervalSpinBox.value(),
+                self.timeoutSpinBox.value())
+        except (re.error, UnicodeError) as e:
+            console.enqueue('Latency probe: {}'.format(e))
+            return
+        self._probe.start()
+        self.startButton.setText('Stop')
+
+    def _onProbeUpdated(self):
+        # Updates that arrive while the timer runs are shown when it fires.
+        if not self._updateTimer.isActive():
+            self._updateTimer.start()
+
+    def _onUpdate(self):
+        self.statsLabel.setText(self._probe.statsToStr())
+
+
+class PeriodicSendDialog(QtWidgets.QDialog):
+    """Dialog to add and remove periodic sends and show their timing."""
+
+    def __init__(self, parent, sender):
+        super(PeriodicSendDialog, self).__init__(parent)
+        self._sender = sender
+
+        self.setWindowTitle('Periodic Send')
+        self.setWindowFlags(QtCore.Qt.WindowCloseButtonHint | QtCore.Qt.Dialog)
+
+        # Widgets
+        # -------
+        self.dataLineEdit = QtWidgets.QLineEdit()
+        self.dataLineEdit.setPlaceholderText('Data, e.g. PING\\r\\n')
+        self.intervalSpinBox = QtWidgets.QSpinBox()
+        self.intervalSpinBox.setRange(1, 3600000)
+        self.intervalSpinBox.setSuffix(' ms')
+        self.intervalSpinBox.setValue(1000)
+        self.addButton = QtWidgets.QPushButton('Add')
+        self.removeButton = QtWidgets.QPushButton('Remove')
+        self.jobsListWidget = QtWidgets.QListWidget()
+        self.jobsListWidget.setMinimumWidth(600)
+        self._updateTimer = QtCore.QTimer(self)
+        self._updateTimer.setInterval(500)
+
+        # Connections
+        # -----------
+        self.addButton.clicked.connect(self._onAdd)
+        self.removeButton.clicked.connect(self._onRemove)
+        self._updateTimer.timeout.connect(self._onUpdate)
+
+        # Layout
+        # ------
+        layout = QtWidgets.QGridLayout()
+        # row, column, rowspan, colspan
+        layout.addWidget(self.dataLineEdit, 0, 0, 1, 1)
+        layout.addWidget(self.intervalSpinBox, 0, 1, 1, 1)
+        layout.addWidget(self.addButton, 0, 2, 1, 1)
+        layout.addWidget(self.jobsListWidget, 1, 0, 1, 3)
+        layout.addWidget(self.removeButton, 2, 2, 1, 1)
+        self.setLayout(layout)
+
+    def showEvent(self, event):
+        self._onUpdate()
+        self._updateTimer.start()
+        super(PeriodicSendDialog, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self._updateTimer.stop()
+        super(PeriodicSendDialog, self).hideEvent(event)
+
+    def _onAdd(self):
+        try:
+            data = self.dataLineEdit.text().encode('latin-1').decode(
+                'unicode_escape').encode('latin-1')
+        except UnicodeError as e:
+            console.enqueue('Periodic send: {}'.format(e))
+            return
+        if len(data) == 0:
+            return
+        self._sender.add(data, self.intervalSpinBox.value() / 1000)
+        self._onUpdate()
+
+    def _onRemove(self):
+        row = self.jobsListWidget.currentRow()
+        jobs = self._sender.jobs()
+        if 0 <= row < len(jobs):
+            self._sender.remove(jobs[row])
+        self._onUpdate()
+
+    def _onUpdate(self):
+        jobs = self._sender.jobs()
+        row = self.jobsListWidget.currentRow()
+        self.jobsListWidget.clear()
+        self.jobsListWidget.addItems([job.statsToStr() for job in jobs])
+        self.jobsListWidget.setCurrentRow(min(row, len(jobs) - 1))
+
+
 class SetTitleDialog(QtWidgets.QDialog):
     """Dialog to prompt the user for a name for the application window.
     """
@@ -393,6 +695,138 @@ class SetTitleDialog(QtWidgets.QDialog):
         self.hide()
 
 
+class ConnectionListModel(QtCore.QAbstractListModel):
+    """The names of the connections in a serial.ConnectionStore. The model is
+    reset when the store changes.
+
+    It also keeps the text the connections are searched in, a line per
+    connection with its name, port and baud separated by tabs.
+    """
+
+    def __init__(self, parent=None):
+        super(ConnectionListModel, self).__init__(parent)
+        self._store = None
+        self._names = []
+        self._search_lines = []
+
+    def setStore(self, store):
+        if store is self._store:
+            self._onStoreChanged()
+            return
+        if self._store is not None:
+            self._store.changed.disconnect(self._onStoreChanged)
+        self._store = store
+        self._store.changed.connect(self._onStoreChanged)
+        self._onStoreChanged()
+
+    def store(self):
+        return self._store
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._names)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        name = self._names[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return name
+        if role == QtCore.Qt.ToolTipRole:
+            c = self._store.get(name)
+            return '{} {}'.format(c['port'], c['baud'])
+        return None
+
+    def name(self, row):
+        return self._names[row]
+
+    def searchLines(self):
+        return self._search_lines
+
+    def _onStoreChanged(self):
+        self.beginResetModel()
+        self._names = self._store.names()
+        self._search_lines = []
+        for name in self._names:
+            c = self._store.get(name)
+            self._search_lines.append('{}\t{}\t{}'.format(name.lower(),
+                c['port'].lower(), c['baud']))
+        self.endResetModel()
+
+
+class ConnectionFilterModel(QtCore.QSortFilterProxyModel):
+    """Filters a ConnectionListModel by a search.
+
+    A connection matches if every word of the search matches its name, port
+    or baud, either as a substring or fuzzily, with the letters of the word
+    in order but not next to each other, e.g. "usb3" matches "ttyUSB03".
+    The case is ignored.
+
+    Each word is found with a regular expression search of the search text
+    of the rows joined together, so the scanning is done by the re module
+    rather than row by row in Python. When a word is typed onto the end of
+    the search, only the rows that matched before are searched.
+    """
+
+    def __init__(self, parent=None):
+        super(ConnectionFilterModel, self).__init__(parent)
+        self._search = ''
+        # The source rows that match, or None for all of them.
+        self._rows = None
+        # The same rows in order.
+        self._row_list = None
+
+    def setSourceModel(self, model):
+        super(ConnectionFilterModel, self).setSourceModel(model)
+        model.modelReset.connect(self._onSourceReset)
+
+    def setSearch(self, search):
+        search = search.lower()
+        words = search.split()
+        rows = None
+        if len(words) > 0:
+            lines = self.sourceModel().searchLines()
+            rows = range(len(lines))
+            if self._rows is not None and search.startswith(self._search):
+                rows = self._row_list
+            for word in words:
+                rows = self._match(word, lines, rows)
+        self._search = search
+        self._row_list = rows
+        self._rows = None if rows is None else set(rows)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._rows is None or source_row in self._rows
+
+    def _match(self, word, lines, rows):
+        """
+        Returns
+        -------
+        The list of the rows of "rows" that "word" matches.
+        """
+        # The letters in order within one field.
+        regex = re.compile(r'[^\t\n]*?'.join(re.escape(c) for c in word))
+        text = '\n'.join(lines[row] for row in rows)
+        # Where each row starts in the text.
+        starts = list(itertools.accumulate(itertools.chain([0],
+            (len(lines[row]) + 1 for row in rows))))
+        matches = []
+        pos = 0
+        while True:
+            m = regex.search(text, pos)
+            if m is None:
+                return matches
+            i = bisect.bisect_right(starts, m.start()) - 1
+            matches.append(rows[i])
+            # On to the next row.
+            pos = starts[i + 1]
+
+    def _onSourceReset(self):
+        # The rows have changed, so all of them are searched.
+        self._rows = None
+        self.setSearch(self._search)
+
+
 class ConnectionListWidget(QtWidgets.QWidget):
     """Displays connections and allows the user to load and save them.
 
@@ -405,19 +839,35 @@ class ConnectionListWidget(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super(ConnectionListWidget, self).__init__(parent)
 
-        self.itemWidgets = []
-        self._connections = []
+        self._model = ConnectionListModel(self)
+        self._filterModel = ConnectionFilterModel(self)
+        self._filterModel.setSourceModel(self._model)
+        # The name of the selected connection while the model is reset.
+        self._currentName = None
 
         # Widgets
         # -------
-        self.listWidget = QtWidgets.QListWidget()
+        self.searchLineEdit = QtWidgets.QLineEdit()
+        self.searchLineEdit.setPlaceholderText('Search by name, port or baud')
+        self.searchLineEdit.setClearButtonEnabled(True)
+        self.listView = QtWidgets.QListView()
+        self.listView.setModel(self._filterModel)
+        # Rows aren't measured one by one, which is slow with many of them.
+        self.listView.setUniformItemSizes(True)
+        self.listView.setEditTriggers(
+            QtWidgets.QAbstractItemView.NoEditTriggers)
         self.cancelButton = QtWidgets.QPushButton('Cancel')
         self.renameButton = QtWidgets.QPushButton('Rename')
         self.loadButton = QtWidgets.QPushButton('Load')
 
         # Connections
         # -----------
-        self.listWidget.itemDoubleClicked.connect(self._onItemDoubleClicked)
+        self.searchLineEdit.textChanged.connect(self._onSearchChanged)
+        self.searchLineEdit.returnPressed.connect(self._onSearchReturn)
+        self.listView.doubleClicked.connect(self._onItemDoubleClicked)
+        # Connected after the filter model so it has filtered the new rows.
+        self._model.modelAboutToBeReset.connect(self._onModelAboutToBeReset)
+        self._model.modelReset.connect(self._onModelReset)
 
         # Layout
         # ------
@@ -426,36 +876,74 @@ class ConnectionListWidget(QtWidgets.QWidget):
         self.buttonLayout.addWidget(self.cancelButton)
         self.buttonLayout.addWidget(self.renameButton)
         self.buttonLayout.addWidget(self.loadButton)
-        self.mainLayout.addWidget(self.listWidget)
+        self.mainLayout.addWidget(self.searchLineEdit)
+        self.mainLayout.addWidget(self.listView)
         self.mainLayout.addLayout(self.buttonLayout)
         self.setLayout(self.mainLayout)
 
     def setConnections(self, connections):
-        """Sets the connections in the list to those provided by the
-        parameter "connections".
+        """Sets the connections in the list to those of the
+        serial.ConnectionStore "connections". The list follows the changes
+        to the store.
         """
-        self.listWidget.clear()
-        for name, c in connections.items():
-            self.itemWidgets.append(QtWidgets.QListWidgetItem(name,
-                self.listWidget))
-        self._connections = connections
+        self._model.setStore(connections)
 
     def getConnections(self):
-        return self._connections
+        return self._model.store()
 
     def getCurrentConfig(self):
         """
         Returns
         -------
-        Returns the currently selected connection.
+        Returns the currently selected connection, or None if none is
+        selected.
         """
-        return self._connections[self.listWidget.currentItem().text()]
+        index = self._filterModel.mapToSource(self.listView.currentIndex())
+        if not index.isValid():
+            return None
+        return self._model.store().get(self._model.name(index.row()))
 
     def _onItemDoubleClicked(self):
         self.itemDoubleClicked.emit()
 
+    def _onSearchChanged(self, text):
+        self._filterModel.setSearch(text)
+        if self._filterModel.rowCount() > 0:
+            self.listView.setCurrentIndex(self._filterModel.index(0, 0))
+
+    def _onModelAboutToBeReset(self):
+        # The store has changed already, so the name is taken from the model.
+        index = self._filterModel.mapToSource(self.listView.currentIndex())
+        self._currentName = self._model.name(index.row()) \
+            if index.isValid() else None
+
+    def _onModelReset(self):
+        # The reset loses the current index. The selected connection is
+        # selected again, or the first match of a search, so Return still
+        # loads one, e.g. after a save.
+        index = QtCore.QModelIndex()
+        if self._currentName in self._model.store():
+            row = self._model.store().names().index(self._currentName)
+            index = self._filterModel.mapFromSource(self._model.index(row, 0))
+        if not index.isValid() and self.searchLineEdit.text() != '' and \
+                self._filterModel.rowCount() > 0:
+            index = self._filterModel.index(0, 0)
+        if index.isValid():
+            self.listView.setCurrentIndex(index)
+        self._currentName = None
+
+    def _onSearchReturn(self):
+        # Loads the selected match, the first one unless another was picked.
+        if self.listView.currentIndex().isValid():
+            self.itemDoubleClicked.emit()
+
 
 class SerialConfigWidget(QtWidgets.QWidget):
+
+    # The connection settings that have a UI element.
+    config_keys = ['name', 'port', 'baud', 'data_bits', 'stop_bits', 'parity',
+        'flow_control', 'local_echo_enabled', 'low_latency']
+
     def __init__(self, parent=None):
         super(SerialConfigWidget, self).__init__(parent)
 
@@ -473,7 +961,17 @@ class SerialConfigWidget(QtWidgets.QWidget):
 
         self.baudrateLabel = QtWidgets.QLabel('Baud')
 
-        self.baudrateEdit = QtWidgets.QLineEdit('115200')
+        # Any rate can be typed in. The list has the standard and high speed
+        # rates.
+        self.baudrateComboBox = QtWidgets.QComboBox()
+        self.baudrateComboBox.setEditable(True)
+        self.baudrateComboBox.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+        self.baudrateComboBox.setValidator(
+            QtGui.QIntValidator(serial.MIN_BAUD, serial.MAX_BAUD,
+            self.baudrateComboBox))
+        for rate in serial.BAUD_RATES:
+            self.baudrateComboBox.addItem(str(rate))
+        self.baudrateComboBox.setEditText('115200')
 
         self.databitsLabel = QtWidgets.QLabel('Data bits')
 
@@ -510,6 +1008,10 @@ class SerialConfigWidget(QtWidgets.QWidget):
         self.flowControlComboBox.addItem('XON/XOFF')
         self.flowControlComboBox.setCurrentIndex(1)
 
+        self.lowLatencyCheckBox = QtWidgets.QCheckBox('Low latency (Linux)')
+        self.lowLatencyCheckBox.setToolTip('Sets ASYNC_LOW_LATENCY, VMIN/VTIME '
+            'and the FTDI latency timer for request/response protocols.')
+
         self.errorWidget = QtWidgets.QLabel()
         self.errorWidget.setObjectName('error')
         self.errorWidget.setWordWrap(True)
@@ -538,7 +1040,7 @@ class SerialConfigWidget(QtWidgets.QWidget):
         connectionLayout.addWidget(self.scanComsButton, 1, 3, 1, 1)
 
         connectionLayout.addWidget(self.baudrateLabel, 2, 0, 1, 2)
-        connectionLayout.addWidget(self.baudrateEdit, 2, 2, 1, 2)
+        connectionLayout.addWidget(self.baudrateComboBox, 2, 2, 1, 2)
 
         connectionLayout.addWidget(self.databitsLabel, 3, 0, 1, 2)
         connectionLayout.addWidget(self.databitsComboBox, 3, 2, 1, 2)
@@ -552,51 +1054,83 @@ class SerialConfigWidget(QtWidgets.QWidget):
         connectionLayout.addWidget(self.flowControlLabel, 6, 0, 1, 2)
         connectionLayout.addWidget(self.flowControlComboBox, 6, 2, 1, 2)
 
-        connectionLayout.addWidget(self.errorWidget, 7, 0, 1, 4)
+        connectionLayout.addWidget(self.lowLatencyCheckBox, 7, 2, 1, 2)
 
-        connectionLayout.addWidget(self.moreSettingsButton, 8, 2, 1, 2)
+        connectionLayout.addWidget(self.errorWidget, 8, 0, 1, 4)
 
-        connectionLayout.addWidget(self.cancelButton, 9, 0, 1, 1)
-        connectionLayout.addWidget(self.connectButton, 9, 1, 1, 1)
-        connectionLayout.addWidget(self.saveButton, 9, 2, 1, 1)
-        connectionLayout.addWidget(self.loadButton, 9, 3, 1, 1)
+        connectionLayout.addWidget(self.moreSettingsButton, 9, 2, 1, 2)
+
+        connectionLayout.addWidget(self.cancelButton, 10, 0, 1, 1)
+        connectionLayout.addWidget(self.connectButton, 10, 1, 1, 1)
+        connectionLayout.addWidget(self.saveButton, 10, 2, 1, 1)
+        connectionLayout.addWidget(self.loadButton, 10, 3, 1, 1)
 
         self.setLayout(connectionLayout)
 
+        # Settings of the loaded connection that don't have a UI element,
+        # e.g. the pipeline. They are kept so they are saved and used when
+        # connecting.
+        self._extraConfig = {}
+
+    def setExtraConfig(self, config):
+        self._extraConfig = copy.deepcopy(config)
+
     def updatePortList(self, ports):
         """
-        Set the combo-box to the provided list.
+        Set the combo-box to the provided list. The port that was typed in or
+        selected is kept.
 
         Parameters
         ----------
-        ports : str
-            List of port names that are available.
+        ports : list
+            List of port_scanner.PortInfo for the ports that are available.
+        """
+        current = self.portComboBox.currentText()
+        self.portComboBox.clear()
+        for i, port in enumerate(ports):
+            self.portComboBox.addItem(port.name)
+            self.portComboBox.setItemData(i,
+                port_scanner.portInfoToStr(port), QtCore.Qt.ToolTipRole)
+        if current != '':
+            self.portComboBox.setEditText(current)
+
+    def validate(self):
+        """Checks the values of the UI elements that can be typed in.
+
+        Returns
+        -------
+        An error message or an empty string if there isn't an error.
         """
-        if len(ports) > 0:
-            self.portComboBox.clear()
-            for port in ports:
-                self.portComboBox.addItem(port)
+        baud = self.baudrateComboBox.currentText()
+        if not baud.isdigit() or \
+                not serial.MIN_BAUD <= int(baud) <= serial.MAX_BAUD:
+            return 'The baud must be a whole number from {} to {}.'.format(
+                serial.MIN_BAUD, serial.MAX_BAUD)
+        return ''
 
     def getCurrentConfig(self):
         """Gets the current configuration from the UI elements and returns
-        a dictionary of the config.
+        a dictionary of the config. Call validate() first.
         """
         serial_config = {
             'name': self.nameEdit.text(),
             'port': self.portComboBox.currentText(),
-            'baud': int(self.baudrateEdit.text()),
+            'baud': int(self.baudrateComboBox.currentText()),
             'data_bits': int(self.databitsComboBox.currentText()),
             'stop_bits': float(self.stopbitsComboBox.currentText()),
             'parity': self.parityComboBox.currentText().lower(),
             'flow_control': 'none',
-            'local_echo_enabled': False
+            'local_echo_enabled': False,
+            'low_latency': self.lowLatencyCheckBox.isChecked()
         }
 
         if self.flowControlComboBox.currentText() == 'RTS/CTS':
             serial_config['flow_control'] = 'hardware'
-        else:
+        elif self.flowControlComboBox.currentText() == 'XON/XOFF':
             serial_config['flow_control'] = 'software'
 
+        for key, value in self._extraConfig.items():
+            serial_config.setdefault(key, copy.deepcopy(value))
 
         return serial_config
 
@@ -634,6 +1168,7 @@ class SerialConfigDialog(QtWidgets.QDialog):
         # -------
         self._serialConfigWidget = SerialConfigWidget(self)
         self._connectionListWidget = ConnectionListWidget(self)
+        self._portScanner = port_scanner.PortScanner(self)
 
         # Connections
         # -----------
@@ -644,6 +1179,8 @@ class SerialConfigDialog(QtWidgets.QDialog):
         self._serialConfigWidget.scanComsButton.clicked.connect(
             self.updatePortList)
         self._serialConfigWidget.saveButton.clicked.connect(self._onSave)
+        self._portScanner.portsChanged.connect(
+            self._serialConfigWidget.updatePortList)
 
         self._connectionListWidget.cancelButton.clicked.connect(
             self._showSerialConfigWidget)
@@ -668,7 +1205,7 @@ class SerialConfigDialog(QtWidgets.QDialog):
 
         scw.nameEdit.setText(config['name'])
         scw.portComboBox.setEditText(config['port'])
-        scw.baudrateEdit.setText(str(config['baud']))
+        scw.baudrateComboBox.setEditText(str(config['baud']))
         scw.databitsComboBox.setCurrentIndex(
             scw.databitsComboBox.findText(str(config['data_bits'])))
         # If the stop bits is a whole number remove the ".0" from the string.
@@ -687,10 +1224,18 @@ class SerialConfigDialog(QtWidgets.QDialog):
             scw.flowControlComboBox.setCurrentIndex(1)
         else:
             scw.flowControlComboBox.setCurrentIndex(2)
+        scw.lowLatencyCheckBox.setChecked(config.get('low_latency', False))
+        scw.setExtraConfig({k: v for k, v in config.items()
+            if k not in SerialConfigWidget.config_keys})
 
     def saveCurrentConfig(self):
         """Saves the current configuration.
         """
+        error = self._serialConfigWidget.validate()
+        if error != '':
+            self._serialConfigWidget.errorWidget.setText(error)
+            self._shake()
+            return
         config = self._serialConfigWidget.getCurrentConfig()
         # Check for a name.
         if config['name'] == '':
@@ -698,9 +1243,7 @@ class SerialConfigDialog(QtWidgets.QDialog):
                 'You need a name if you want to save.')
             self._shake()
             return
-        connections = self._connectionListWidget.getConnections()
-        connections[config['name']] = config
-        self._connectionListWidget.setConnections(connections)
+        self._connectionListWidget.getConnections().set(config)
 
     def setConnections(self, connections):
         """Applies the connections list to the serial configuration widget.
@@ -708,20 +1251,21 @@ class SerialConfigDialog(QtWidgets.QDialog):
         self._connectionListWidget.setConnections(connections)
 
     def updatePortList(self):
-        """Updates the list of ports. Uses the Qt library to get the available
-        ports.
+        """Updates the list of ports. The scan is done on a worker thread and
+        the combo-box is updated when it is done.
         """
-        serialInfos = self._serialPort.scanComs()
-        availablePorts = []
-        for info in serialInfos:
-            availablePorts.append(info.portName())
-        self._serialConfigWidget.updatePortList(availablePorts)
+        self._portScanner.scan()
 
     def _onCancel(self):
         self.hide()
 
     def _onConnect(self):
         scw = self._serialConfigWidget
+        error = scw.validate()
+        if error != '':
+            self._shake()
+            scw.errorWidget.setText(error)
+            return
         serial_config = self._serialConfigWidget.getCurrentConfig()
         config_result = self._serialPort.setConfig(serial_config)
 
@@ -746,6 +1290,8 @@ class SerialConfigDialog(QtWidgets.QDialog):
         it to the current settings and change the view.
         """
         config = self._connectionListWidget.getCurrentConfig()
+        if config is None:
+            return
         self.applyConfig(config)
         self._showSerialConfigWidget()
 
@@ -814,14 +1360,26 @@ class SerialConfigDialog(QtWidgets.QDialog):
 class ConsoleWidget(QtWidgets.QWidget):
     """
     This is a console for the application as a whole. Not for the serial port.
+
+    The output keeps the last MAX_LINES lines. Messages that arrive while the
+    console is hidden are only rendered when it is shown. The full history is
+    in the log file.
+
+    Commands run in a console.ConsoleSession on a worker thread, so a slow
+    one doesn't hold up the serial port. Escape cancels the running command.
     """
+
+    MAX_LINES = 5000
+
     def __init__(self, parent=None):
         super(ConsoleWidget, self).__init__(parent)
 
         self.consoleOutput = QtWidgets.QTextEdit()
         self.consoleInput = QtWidgets.QLineEdit()
+        self._pending = collections.deque(maxlen=self.MAX_LINES)
 
         self.consoleOutput.setWordWrapMode(QtGui.QTextOption.NoWrap)
+        self.consoleOutput.document().setMaximumBlockCount(self.MAX_LINES)
 
         self.consoleOutput.setReadOnly(True)
 
@@ -832,11 +1390,16 @@ class ConsoleWidget(QtWidgets.QWidget):
         layout.addWidget(self.consoleOutput)
         layout.addWidget(self.consoleInput)
 
-        self.consoleInput.returnPressed.connect(self.onEnterKey)
-
         self.setLayout(layout)
 
-        self._ric = console.RemoteConsole()
+        self._session = console.ConsoleSession()
+        self._cancelShortcut = QtWidgets.QShortcut(
+            QtGui.QKeySequence(QtCore.Qt.Key_Escape), self.consoleInput)
+
+        self.consoleInput.returnPressed.connect(self.onEnterKey)
+        self._session.finished.connect(self._onCommandFinished)
+        self._session.busyChanged.connect(self._onBusyChanged)
+        self._cancelShortcut.activated.connect(self._session.cancel)
 
     def onEnterKey(self):
         # https://github.com/pallets/werkzeug/blob/master/werkzeug/debug/console.py
@@ -846,11 +1409,43 @@ class ConsoleWidget(QtWidgets.QWidget):
         user_input = self.consoleInput.text()
         self.consoleInput.setText('')
 
-        self._ric.push(user_input)
-        output = self._ric.getResult()
-
         self.consoleOutput.append('>>> ' + user_input)
-        self.consoleOutput.append(output[:-1])
+        self._session.push(user_input)
+
+    def setTimeout(self, seconds):
+        """Sets how long a command can run before it's cancelled. 0 for no
+        limit.
+        """
+        self._session.timeout = seconds
+
+    def _onBusyChanged(self, busy):
+        self.consoleInput.setPlaceholderText(
+            'Running... Press Escape to cancel.' if busy else '')
+
+    def _onCommandFinished(self, user_input, output):
+        if output.endswith('\n'):
+            output = output[:-1]
+        if output != '':
+            self.consoleOutput.append(output)
+
+    def appendMessages(self, messages):
+        self._pending.extend(messages)
+        if self.isVisible():
+            self._render()
+
+    def showEvent(self, event):
+        self._render()
+        super(ConsoleWidget, self).showEvent(event)
+
+    def _render(self):
+        if len(self._pending) == 0:
+            return
+        self.consoleOutput.append('\n'.join(self._pending))
+        self._pending.clear()
+
+    def setLocals(self, names):
+        """Makes objects available to the console by name."""
+        self._session.setLocals(names)
 
     def setFont(self, font):
         self.consoleOutput.setFont(font)
@@ -868,7 +1463,7 @@ def serial_args_to_config(args):
     serial_config['port'] = args.port
     serial_config['baud'] = args.baud
     serial_config['data_bits'] = args.data_bits
-    serial_config['stop_bits'] = str(args.stop_bits)
+    serial_config['stop_bits'] = float(args.stop_bits)
 
     if args.parity == 'n':
         serial_config['parity'] = 'none'
@@ -884,9 +1479,9 @@ def serial_args_to_config(args):
         serial_config['data_bits'] = 'unk' # Unknown
 
     if args.flow_control == 's':
-        serial_config['flow_control'] = 'XON/XOFF'
+        serial_config['flow_control'] = 'software'
     elif args.flow_control == 'h':
-        serial_config['flow_control'] = 'RTS/CTS'
+        serial_config['flow_control'] = 'hardware'
     elif args.flow_control == 'n':
         serial_config['flow_control'] = 'none'
     else:
@@ -900,9 +1495,13 @@ def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--baud', type=int, dest='baud', default=115200, help='Baud of the connection. Default 115200')
+    parser.add_argument('--bridge-address', dest='bridge_address', default='127.0.0.1', help='Address the TCP bridge listens on. Default 127.0.0.1')
+    parser.add_argument('--bridge-mode', dest='bridge_mode', default='raw', choices=['raw', 'rfc2217'], help='Protocol of the TCP bridge. Default \'raw\'')
+    parser.add_argument('--bridge-port', type=int, dest='bridge_port', help='Share the serial port over TCP on this port.')
     parser.add_argument('--connections', dest='connections_file', help='Specify a connections file instead of the default.')
     parser.add_argument('--data-bits', type=int, dest='data_bits', default=8, help='Number of data bits. Default 8')
     parser.add_argument('--fc', '--flow-control', dest='flow_control', default='n', help='Hardware RTS/CTS (h), Software XON/XOFF (s), or None (n). Default \'n\' for None')
+    parser.add_argument('--log-file', dest='log_file', default='super_serial.log', help='File the application messages are logged to. It is rotated at 1 MB. Default \'super_serial.log\'')
     parser.add_argument('--parity', dest='parity', default='n', help='Parity of the connection. None (n), Odd (o), Even (e), Space (s), Mark (m). Default \'n\' for None')
     parser.add_argument('--port', dest='port', help='Port to connect to at start.')
     parser.add_argument('--preferences', dest='preferences_file', help='Specify a preferences file instead of the default.')
@@ -911,6 +1510,11 @@ def main():
 
     args = parser.parse_args()
 
+    try:
+        console.startLogFile(args.log_file)
+    except OSError as e:
+        print('Could not open the log file: {}'.format(e))
+
     app = QtWidgets.QApplication(sys.argv)
 
     script_dir = osp.dirname(osp.realpath(__file__))
@@ -921,6 +1525,7 @@ def main():
     aw.show()
 
     app.exec_()
+    console.stopLogFile()
 
     # Check for memory leaks.
     # https://stackoverflow.com/a/37928086
@@ -0,0 +1,252 @@
+"""
+Copyright 2017-2018 Justin Watson
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Extracts numbers from the received text for plotting.
+
+Every match of a regular expression in a line is a sample. Each group of
+the expression is a series, named after the group if it is a named group.
+An expression without groups has one series, the whole match. e.g.
+
+    temp=(?P<temp>[-\\d.]+) rpm=(?P<rpm>\\d+)
+
+The samples are kept in a fixed size NumPy ring buffer, so memory use is
+bounded and old samples are overwritten. A whole chunk of text is matched
+and converted at once to keep up with high sample rates.
+
+"""
+
+import re
+import threading
+
+import numpy as np
+
+
+# The number of samples kept by default.
+DEFAULT_CAPACITY = 1000000
+# The longest line that is matched. A longer line, e.g. binary data without
+# newlines, is dropped rather than kept until its end arrives.
+MAX_LINE_LENGTH = 4096
+
+
+class RingBuffer():
+    """A fixed size buffer of samples. Each sample has a time and one value
+    per column.
+    """
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._values = np.full((capacity, columns), np.nan, dtype=np.float64)
+        self._next = 0
+        self.size = 0
+
+    def append(self, times, values):
+        """Appends samples. When the buffer is full the oldest samples are
+        overwritten.
+
+        Parameters
+        ----------
+        times : numpy.ndarray
+            The times of the samples.
+        values : numpy.ndarray
+            The values with one row per sample.
+        """
+        n = len(times)
+        if n >= self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+            n = self.capacity
+        # At most two slices, the end of the buffer and the start.
+        first = min(n, self.capacity - self._next)
+        self._times[self._next:self._next + first] = times[:first]
+        self._values[self._next:self._next + first] = values[:first]
+        rest = n - first
+        if rest > 0:
+            self._times[:rest] = times[first:]
+            self._values[:rest] = values[first:]
+        self._next = (self._next + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def snapshot(self):
+        """
+        Returns
+        -------
+        A tuple (times, values) with copies of the samples, oldest first.
+        """
+        if self.size < self.capacity:
+            return (self._times[:self.size].copy(),
+                self._values[:self.size].copy())
+        return (np.concatenate((self._times[self._next:],
+            self._times[:self._next])), np.concatenate((
+            self._values[self._next:], self._values[:self._next])))
+
+
+def decimate(times, values, width):
+    """Reduces a series to about 2 * "width" points for plotting. The
+    samples are split into "width" buckets and the minimum and maximum of
+    each bucket are kept, so spikes are still visible.
+
+    Returns
+    -------
+    A tuple (times, values).
+    """
+    n = len(values)
+    if width <= 0 or n <= 2 * width:
+        return times, values
+    per_bucket = -(-n // width)
+    buckets = n // per_bucket
+    used = buckets * per_bucket
+    blocks = values[:used].reshape(buckets, per_bucket)
+    out_values = np.empty(2 * buckets, dtype=values.dtype)
+    # fmin/fmax so a missing value (NaN) doesn't hide the rest of a bucket.
+    out_values[0::2] = np.fmin.reduce(blocks, axis=1)
+    out_values[1::2] = np.fmax.reduce(blocks, axis=1)
+    out_times = np.repeat(times[:used:per_bucket], 2)
+    if used < n:
+        out_times = np.concatenate((out_times, times[used:]))
+        out_values = np.concatenate((out_values, values[used:]))
+    return out_times, out_values
+
+
+class Telemetry():
+    """Extracts samples from text and keeps them in a ring buffer. feed() is
+    called by the pipeline's worker thread and snapshot() by the plot, so
+    the buffer is protected by a lock.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self._regex = None
+        self._partial = ''
+        # True while the rest of a line that was too long is skipped.
+        self._skipping = False
+        self._buffer = None
+        self.names = []
+        # The time of the first sample. Times are plotted relative to it.
+        self.start = None
+        # Incremented whenever samples are added or removed, so the plot only
+        # redraws when something changed.
+        self.version = 0
+
+    def setPattern(self, pattern):
+        """Sets the regular expression and clears the samples. An empty
+        pattern turns the extraction off.
+
+        Raises
+        ------
+        re.error
+            If the pattern isn't a valid regular expression.
+        """
+        regex = re.compile(pattern, re.MULTILINE) if pattern != '' else None
+        names = []
+        if regex is not None:
+            if regex.groups == 0:
+                names = ['value']
+            else:
+                names = ['field {}'.format(i + 1) for i in range(regex.groups)]
+                for name, index in regex.groupindex.items():
+                    names[index - 1] = name
+        with self._lock:
+            self._regex = regex
+            self.names = names
+            self._partial = ''
+            self._skipping = False
+            self._reset()
+
+    def setCapacity(self, capacity):
+        """Sets the number of samples kept and clears the samples."""
+        with self._lock:
+            self.capacity = capacity
+            self._reset()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def feed(self, text, timestamp):
+        """Extracts the samples from the complete lines of the text. A line
+        that isn't complete is kept until the rest of it is fed, unless it
+        is longer than MAX_LINE_LENGTH. All of the samples get the same time.
+        """
+        with self._lock:
+            regex = self._regex
+            if regex is None:
+                return
+            if self._skipping:
+                start = text.find('\n') + 1
+                if start == 0:
+                    return
+                text = text[start:]
+                self._skipping = False
+            text = self._partial + text
+            end = text.rfind('\n') + 1
+            self._partial = text[end:]
+            if len(self._partial) > MAX_LINE_LENGTH:
+                self._partial = ''
+                self._skipping = True
+        if end == 0:
+            return
+        matches = regex.findall(text, 0, end)
+        if len(matches) == 0:
+            return
+        values = _toArray(matches, len(self.names))
+        with self._lock:
+            if regex is not self._regex:
+                # The pattern changed while the text was being matched.
+                return
+            if self.start is None:
+                self.start = timestamp
+            self._buffer.append(np.full(len(values), timestamp), values)
+            self.version += 1
+
+    def snapshot(self):
+        """
+        Returns
+        -------
+        A tuple (times, values, names). "times" are in seconds since the
+        first sample and "values" has a column per series.
+        """
+        with self._lock:
+            if self._buffer is None or self._buffer.size == 0:
+                return (np.zeros(0), np.zeros((0, len(self.names))),
+                    list(self.names))
+            times, values = self._buffer.snapshot()
+            return times - self.start, values, list(self.names)
+
+    def _reset(self):
+        self._buffer = RingBuffer(self.capacity, max(len(self.names), 1))
+        self.start = None
+        self.version += 1
+
+
+def _toArray(matches, columns):
+    """Converts the matches from findall() to an array with a row per match.
+    Fields that aren't numbers are NaN.
+    """
+    try:
+        # NumPy parses the strings itself, which is much faster than float().
+        values = np.array(matches, dtype=np.float64)
+    except ValueError:
+        values = np.array([[_toFloat(f) for f in (m if columns > 1 else (m,))]
+            for m in matches], dtype=np.float64)
+    return values.reshape(len(matches), columns)
+
+
+def _toFloat(field):
+    try:
+        return float(field)
+    except ValueError:
+        return np.nan